@@ -1,74 +1,183 @@
+import argparse
 import csv
-from random import randint, shuffle
-
-provider_names = open("providers.txt", encoding="utf-8").read().split("\n")
-prov_count = len(provider_names)
-shuffle(provider_names)
-
-customer_names = open("customers.txt", encoding="utf-8").read().split("\n")
-shuffle(customer_names)
-
-phones = [randint(80000000000, 89999999999) for _ in range(len(customer_names) + 1)]
-shuffle(phones)
-
-addresses = open("addresses.txt", encoding="utf-8").read().split("\n")
-shuffle(addresses)
-
-flowers = open("flowers.txt", encoding="utf-8").read().split("\n")
-shuffle(flowers)
-
-
-def generate_providers():
-    # id name address
-    # id address
-    i = 1
-    fname_name = "csv/provider_name.csv"
-    fname_address = "csv/provider_address.csv"
-    with open(fname_name, "w", encoding="utf-8") as csvfile:
-        w = csv.writer(csvfile)
-        while provider_names:
-            w.writerow((i, provider_names.pop()))
-            i += 1
-
-    with open(fname_address, "w", encoding="utf-8") as csvfile:
-        w = csv.writer(csvfile)
-        for j in range(1, i+1):
-            w.writerow((j, addresses.pop()))
-
-
-def generate_flowers():
-    # id name price provider_id
-    i = 1
-    fname = "csv/flowers.csv"
-    with open(fname, "w", encoding="utf-8") as csvfile:
-        w = csv.writer(csvfile)
-        while flowers:
-            w.writerow((i, flowers.pop(), randint(5, 100), randint(1, prov_count)))
-            i += 1
-
-
-def generate_customers():
-    # id name
-    # id phone address
-    i = 1
-    fname_name = "csv/customer_name.csv"
-    fname_info = "csv/customer_info.csv"
-    with open(fname_name, "w", encoding="utf-8") as csvfile:
-        w = csv.writer(csvfile)
-        while customer_names:
-            w.writerow((i, customer_names.pop()))
-            i += 1
-
-    with open(fname_info, "w", encoding="utf-8") as csvfile:
-        w = csv.writer(csvfile)
-        for j in range(1, i + 1):
-            w.writerow((j, phones.pop(), addresses.pop()))
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+START_DATE = np.datetime64("2020-01-01")
+DAYS = 3 * 365
 
-def main():
-    generate_providers()
-    generate_flowers()
-    generate_customers()
+# Заполняются в каждом процессе-исполнителе через init_worker
+provider_names: list[str]
+customer_names: list[str]
+flower_names: list[str]
+addresses: list[str]
+popularity: dict[str, tuple[np.ndarray, np.ndarray]]
+seed: int
+
+
+def read_lines(file_name: str) -> list[str]:
+    with open(os.path.join(BASE_DIR, file_name), encoding="utf-8") as file:
+        return [line for line in file.read().split("\n") if line]
+
+
+def make_popularity(count: int, exponent: float, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    # Распределение Ципфа: k-й по популярности код выбирается с вероятностью ~ 1 / k^exponent.
+    # Популярные коды перемешаны, чтобы "горячими" были не только первые строки таблицы
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    order = rng.permutation(count) + 1
+    return order, weights / weights.sum()
+
+
+def skewed_ids(rng: np.random.Generator, table: str, size: int) -> np.ndarray:
+    order, probabilities = popularity[table]
+    return order[rng.choice(len(order), size=size, p=probabilities)]
 
 
-main()
\ No newline at end of file
+def unique_names(base_names: list[str], first: int, last: int) -> list[str]:
+    # Названия уникальны в БД, поэтому после исчерпания списка к ним добавляется номер
+    count = len(base_names)
+    return [base_names[i % count] if i < count else f"{base_names[i % count]} {i // count}"
+            for i in range(first, last)]
+
+
+def init_worker(args: dict):
+    global provider_names, customer_names, flower_names, addresses, popularity, seed
+    provider_names = read_lines("providers.txt")
+    customer_names = read_lines("customers.txt")
+    flower_names = read_lines("flowers.txt")
+    addresses = read_lines("addresses.txt")
+    seed = args["seed"]
+    rng = np.random.default_rng([seed, 0])
+    popularity = {
+        "customer": make_popularity(args["customers"], args["skew"], rng),
+        "flower": make_popularity(args["flowers"], args["skew"], rng),
+    }
+
+
+def to_csv(*columns) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(zip(*columns))
+    return buffer.getvalue()
+
+
+# Каждая функция ниже генерирует строки с кодами [first, last) и возвращает их в виде CSV.
+# Генератор случайных чисел зависит только от seed, таблицы и номера пачки,
+# поэтому результат не зависит от числа процессов
+
+def provider_name_chunk(first: int, last: int, rng: np.random.Generator) -> str:
+    ids = np.arange(first + 1, last + 1)
+    return to_csv(ids.tolist(), unique_names(provider_names, first, last))
+
+
+def provider_address_chunk(first: int, last: int, rng: np.random.Generator) -> str:
+    ids = np.arange(first + 1, last + 1)
+    address_indexes = rng.integers(0, len(addresses), size=last - first)
+    return to_csv(ids.tolist(), [addresses[i] for i in address_indexes])
+
+
+def flower_chunk(first: int, last: int, rng: np.random.Generator, providers: int = 0) -> str:
+    size = last - first
+    ids = np.arange(first + 1, last + 1)
+    prices = rng.integers(5, 101, size=size)
+    provider_ids = rng.integers(1, providers + 1, size=size)
+    return to_csv(ids.tolist(), unique_names(flower_names, first, last), prices.tolist(), provider_ids.tolist())
+
+
+def customer_name_chunk(first: int, last: int, rng: np.random.Generator) -> str:
+    ids = np.arange(first + 1, last + 1)
+    return to_csv(ids.tolist(), unique_names(customer_names, first, last))
+
+
+def customer_info_chunk(first: int, last: int, rng: np.random.Generator) -> str:
+    size = last - first
+    ids = np.arange(first + 1, last + 1)
+    phones = rng.integers(80000000000, 90000000000, size=size)
+    address_indexes = rng.integers(0, len(addresses), size=size)
+    return to_csv(ids.tolist(), phones.tolist(), [addresses[i] for i in address_indexes])
+
+
+def contract_chunk(first: int, last: int, rng: np.random.Generator) -> str:
+    size = last - first
+    ids = np.arange(first + 1, last + 1)
+    customer_ids = skewed_ids(rng, "customer", size)
+    register_dates = START_DATE + rng.integers(0, DAYS, size=size)
+    execution_dates = register_dates + rng.integers(1, 61, size=size)
+    return to_csv(ids.tolist(), customer_ids.tolist(),
+                  register_dates.astype(str).tolist(), execution_dates.astype(str).tolist())
+
+
+def booking_chunk(first: int, last: int, rng: np.random.Generator, contracts: int = 0) -> str:
+    size = last - first
+    ids = np.arange(first + 1, last + 1)
+    contract_ids = rng.integers(1, contracts + 1, size=size)
+    flower_ids = skewed_ids(rng, "flower", size)
+    quantities = np.clip(rng.lognormal(3, 1, size=size), 1, 10000).astype(int)
+    return to_csv(ids.tolist(), contract_ids.tolist(), flower_ids.tolist(), quantities.tolist())
+
+
+def run_chunk(task: tuple) -> str:
+    table_index, chunk_index, first, last, function, kwargs = task
+    rng = np.random.default_rng([seed, table_index + 1, chunk_index])
+    return function(first, last, rng, **kwargs)
+
+
+def generate_table(executor, table_index: int, file_name: str, header: list[str],
+                   count: int, chunk_size: int, function, **kwargs):
+    # Пачки генерируются параллельно, а пишутся в файл по порядку по мере готовности
+    tasks = [(table_index, chunk_index, first, min(first + chunk_size, count), function, kwargs)
+             for chunk_index, first in enumerate(range(0, count, chunk_size))]
+    with open(file_name, "w", encoding="utf-8", newline="") as file:
+        file.write(",".join(header) + "\n")
+        for text in executor.map(run_chunk, tasks):
+            file.write(text)
+    print(f"{os.path.basename(file_name)}: {count} строк")
+
+
+def parse_args() -> dict:
+    parser = argparse.ArgumentParser(description="Генератор тестовых данных для manage.py bulk_load")
+    parser.add_argument("--bookings", type=int, default=100_000)
+    parser.add_argument("--contracts", type=int, help="По умолчанию bookings / 5")
+    parser.add_argument("--customers", type=int, help="По умолчанию contracts / 10")
+    parser.add_argument("--flowers", type=int, help="По умолчанию bookings / 1000")
+    parser.add_argument("--providers", type=int, help="По умолчанию flowers / 20")
+    parser.add_argument("--skew", type=float, default=1.1,
+                        help="Показатель распределения Ципфа для заказчиков и цветов")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "csv"))
+    args = vars(parser.parse_args())
+    args["contracts"] = args["contracts"] or max(args["bookings"] // 5, 1)
+    args["customers"] = args["customers"] or max(args["contracts"] // 10, 1)
+    args["flowers"] = args["flowers"] or max(args["bookings"] // 1000, len(read_lines("flowers.txt")))
+    args["providers"] = args["providers"] or max(args["flowers"] // 20, len(read_lines("providers.txt")))
+    return args
+
+
+def main():
+    args = parse_args()
+    os.makedirs(args["out"], exist_ok=True)
+    init_worker(args)
+    tables = [
+        ("provider_name.csv", ["provider_id", "name"], args["providers"], provider_name_chunk, {}),
+        ("provider_address.csv", ["provider_id", "address"], args["providers"], provider_address_chunk, {}),
+        ("flowers.csv", ["flower_id", "name", "price", "provider_id"], args["flowers"], flower_chunk,
+         {"providers": args["providers"]}),
+        ("customer_name.csv", ["customer_id", "name"], args["customers"], customer_name_chunk, {}),
+        ("customer_info.csv", ["customer_id", "phone", "address"], args["customers"], customer_info_chunk, {}),
+        ("contracts.csv", ["contract_id", "customer_id", "register_date", "execution_date"], args["contracts"],
+         contract_chunk, {}),
+        ("bookings.csv", ["booking_id", "contract_id", "flower_id", "quantity"], args["bookings"], booking_chunk,
+         {"contracts": args["contracts"]}),
+    ]
+    with ProcessPoolExecutor(max_workers=args["workers"], initializer=init_worker, initargs=(args,)) as executor:
+        for table_index, (file_name, header, count, function, kwargs) in enumerate(tables):
+            generate_table(executor, table_index, os.path.join(args["out"], file_name), header,
+                           count, args["chunk_size"], function, **kwargs)
+
+
+if __name__ == "__main__":
+    main()
@@ -49,6 +49,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'my_app.middleware.QueryLogMiddleware',
+    'my_app.middleware.ConnectionPoolMiddleware',
+    'my_app.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'Kursach.urls'
@@ -66,6 +69,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'my_app.context_processors.staged_changes',
+                'my_app.context_processors.query_log',
             ],
         },
     },
@@ -84,6 +89,60 @@ DATABASES = {
     }
 }
 
+# Каталог со схемой БД приложения: create_db.sql и миграции migrations/ (manage.py migrate_schema).
+# В docker-compose он монтируется в контейнер приложения, путь задаёт переменная окружения DATABASE_SCHEMA_DIR
+DATABASE_SCHEMA_DIR = Path(os.environ.get('DATABASE_SCHEMA_DIR', BASE_DIR.parent.parent / 'database'))
+
+# База данных с данными приложения (my_app.models), работа с ней идёт через пул соединений
+
+MODEL_DATABASE = {
+    # 'mysql' или 'sqlite' (my_app.backends). Для SQLite NAME - путь к файлу БД или ':memory:',
+    # схема создаётся из DATABASE_SCHEMA_DIR/create_db.sql, остальные параметры подключения не используются
+    'BACKEND': 'mysql',
+    'USER': 'root',
+    'PASSWORD': 'aboba',
+    'HOST': 'database',
+    'PORT': 3306,
+    'NAME': 'kursach',
+    'POOL_SIZE': 10,  # Максимум одновременно открытых соединений
+    'POOL_TIMEOUT': 5,  # Сколько секунд запрос ждёт свободное соединение
+    'PING_INTERVAL': 30,  # Соединения, простоявшие дольше, проверяются перед выдачей
+    'RECONNECT_ATTEMPTS': 3,
+    # Реплики для чтения: параметры подключения, которые отличаются от основной БД, например {'HOST': 'replica'}.
+    # Чтения вне транзакций (страницы таблиц, get) идут на реплику, записи - на основную БД.
+    # Список можно задать и переменной окружения MODEL_DATABASE_REPLICAS=хост[:порт],...
+    'REPLICAS': [
+        {'HOST': host, **({'PORT': int(port)} if port else {})}
+        for host, _, port in (item.partition(':') for item in os.environ.get('MODEL_DATABASE_REPLICAS', '').split(','))
+        if host
+    ],
+    'REPLICA_LAG_SECONDS': 5,  # Столько секунд после записи сессия читает с основной БД
+}
+
+# Асинхронные представления таблиц и форм (my_app.async_views) для запуска под ASGI:
+# uvicorn Kursach.asgi:application. Запросы к БД выполняются в пуле из POOL_SIZE потоков
+ASYNC_VIEWS = False
+
+# Учёт запросов к БД моделей (my_app.query_log): итоги в заголовках X-DB-* каждого ответа,
+# панель со списком запросов внизу страницы и порог одинаковых запросов для предупреждения о N+1
+QUERY_LOG = {
+    'FOOTER': DEBUG,
+    'DUPLICATE_THRESHOLD': 5,
+}
+
+# Кэш справочников для форм (my_app.lookup_cache), общий для всех процессов сервера
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'lookups': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'lookup_cache',
+        'TIMEOUT': 24 * 60 * 60,
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
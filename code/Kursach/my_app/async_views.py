@@ -0,0 +1,45 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .model_objects import Connection
+
+# Потоки для работы с БД из асинхронных представлений. Потоков столько же, сколько соединений
+# в пуле, поэтому поток никогда не ждёт соединение, а лишние запросы ждут в цикле событий, не занимая потоков
+db_executor = ThreadPoolExecutor(max_workers=settings.MODEL_DATABASE["POOL_SIZE"], thread_name_prefix="db")
+
+
+def run_in_db_thread(function, *args, **kwargs):
+    # Корутина, выполняющая синхронную функцию в потоке db_executor.
+    # Соединение, взятое функцией из пула, возвращается сразу после её завершения
+    def call():
+        try:
+            return function(*args, **kwargs)
+        finally:
+            Connection.release()
+
+    return sync_to_async(call, thread_sensitive=False, executor=db_executor)()
+
+
+class AsyncViewMixin:
+    # Делает синхронное представление асинхронным: dispatch целиком (проверка доступа, сессия,
+    # запросы к БД и шаблоны) выполняется в потоке db_executor, а цикл событий в это время
+    # обслуживает другие запросы. Под ASGI (uvicorn Kursach.asgi:application) медленные клиенты
+    # не занимают потоки: чтение запроса и отправка ответа происходят в цикле событий.
+    # Для этого все middleware должны поддерживать асинхронный режим (my_app.middleware),
+    # встроенные middleware Django уходят в поток только на время своих process_request/process_response
+    view_is_async = True
+    # Django 4.1 отдаёт потоковый ответ, читая его синхронно в цикле событий,
+    # поэтому потоковый вывод таблиц в асинхронном режиме выключен
+    allow_streaming = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        response = await run_in_db_thread(super().dispatch, request, *args, **kwargs)
+        if asyncio.iscoroutine(response):  # options() и http_method_not_allowed() при view_is_async
+            response = await response
+        return response
+
+
+def make_async(view_class: type) -> type:
+    # Асинхронный вариант представления, например make_async(views.FlowersView)
+    return type(f"Async{view_class.__name__}", (AsyncViewMixin, view_class), {"__module__": view_class.__module__})
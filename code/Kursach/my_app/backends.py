@@ -0,0 +1,318 @@
+import datetime
+import re
+import sqlite3
+import threading
+import uuid
+from functools import lru_cache
+import mysql.connector
+from mysql.connector.constants import ClientFlag
+from django.conf import settings
+from . import schema_migrations
+
+# Ошибки БД любого из бэкендов
+DatabaseError = (mysql.connector.Error, sqlite3.Error)
+
+SCHEMA_PATH = settings.DATABASE_SCHEMA_DIR / "create_db.sql"
+
+
+def error_message(error: Exception) -> str:
+    # У ошибок mysql.connector текст без кода ошибки лежит в msg
+    return getattr(error, "msg", None) or str(error)
+
+
+class BaseBackend:
+    # Различия СУБД, которые нужны слою моделей: подключение, синтаксис upsert,
+    # коды вставленных строк. Запросы моделей пишутся для MySQL с параметрами %s
+    name: str
+
+    def __init__(self, config: dict):
+        self.config = config
+
+    def connect(self, **options):
+        raise NotImplementedError
+
+    def ignore_duplicates(self, unique_column: str, key_column: str) -> str:
+        # Окончание INSERT, при котором строки с уже существующим unique_column пропускаются
+        raise NotImplementedError
+
+    def upsert_returning_key(self, unique_column: str, key_column: str) -> str:
+        # Окончание INSERT одной строки, после которого returned_key() возвращает key_column
+        # новой строки или уже существующей строки с тем же unique_column
+        raise NotImplementedError
+
+    def returned_key(self, cursor):
+        raise NotImplementedError
+
+    def first_inserted_id(self, cursor, row_count: int) -> int:
+        # Код первой строки многострочного INSERT
+        raise NotImplementedError
+
+    def prefix_match(self, column: str) -> str:
+        # Условие "column начинается с параметра", которое может использовать индекс по column.
+        # Параметр - prefix_pattern(начало строки)
+        raise NotImplementedError
+
+    def prefix_pattern(self, prefix: str) -> str:
+        raise NotImplementedError
+
+    def add_on_duplicate(self, table: str, key_columns: list[str], columns: list[str]) -> str:
+        # Окончание INSERT, при котором значения columns прибавляются к строке с тем же ключом
+        raise NotImplementedError
+
+    def month_start(self, column: str) -> str:
+        # Первый день месяца даты column
+        raise NotImplementedError
+
+    def null_safe_equal(self, column: str) -> str:
+        # Условие "column равна параметру", истинное и когда оба NULL
+        raise NotImplementedError
+
+
+class MySQLBackend(BaseBackend):
+    name = "mysql"
+
+    @property
+    def connect_params(self) -> dict:
+        return {
+            "user": self.config["USER"],
+            "password": self.config["PASSWORD"],
+            "host": self.config["HOST"],
+            "port": self.config["PORT"],
+            "database": self.config["NAME"],
+            # rowcount UPDATE - число найденных, а не изменённых строк, как в SQLite. Иначе UPDATE,
+            # записавший равное значение (цена "0150" вместо 150), выглядит как изменённая строка
+            "client_flags": [ClientFlag.FOUND_ROWS],
+        }
+
+    def connect(self, **options):
+        return mysql.connector.connect(**self.connect_params, **options)
+
+    def ignore_duplicates(self, unique_column: str, key_column: str) -> str:
+        return f"ON DUPLICATE KEY UPDATE {key_column} = {key_column}"
+
+    def upsert_returning_key(self, unique_column: str, key_column: str) -> str:
+        # LAST_INSERT_ID(key) делает код существующей строки значением lastrowid
+        return f"ON DUPLICATE KEY UPDATE {key_column} = LAST_INSERT_ID({key_column})"
+
+    def returned_key(self, cursor):
+        return cursor.lastrowid
+
+    def first_inserted_id(self, cursor, row_count: int) -> int:
+        return cursor.lastrowid  # MySQL возвращает код первой строки
+
+    def prefix_match(self, column: str) -> str:
+        return f"{column} LIKE %s"  # Без учёта регистра, как и сравнение в колляции таблиц
+
+    def prefix_pattern(self, prefix: str) -> str:
+        return re.sub(r"([\\%_])", r"\\\1", prefix) + "%"
+
+    def add_on_duplicate(self, table: str, key_columns: list[str], columns: list[str]) -> str:
+        # Колонки таблицы уточняются её именем: такие же колонки могут быть в SELECT
+        updates = ", ".join(f"{table}.{column} = {table}.{column} + VALUES({column})" for column in columns)
+        return f"ON DUPLICATE KEY UPDATE {updates}"
+
+    def month_start(self, column: str) -> str:
+        return f"{column} - INTERVAL DAYOFMONTH({column}) - 1 DAY"
+
+    def null_safe_equal(self, column: str) -> str:
+        return f"{column} <=> %s"
+
+
+class SQLiteBackend(BaseBackend):
+    # SQLite для тестов и замеров без сервера MySQL. NAME - путь к файлу БД или ":memory:".
+    # Схема создаётся из database/create_db.sql при первом подключении к пустой БД,
+    # неприменённые миграции из database/migrations применяются при первом подключении процесса
+    name = "sqlite"
+
+    def __init__(self, config: dict):
+        super().__init__(config)
+        self._schema_lock = threading.Lock()
+        self._keeper = None  # Держит БД в памяти, пока открыт процесс
+        self._migrated = False
+        if config["NAME"] == ":memory:":
+            # Соединения пула должны видеть одну и ту же БД в памяти
+            self.database = f"file:kursach-{uuid.uuid4().hex}?mode=memory&cache=shared"
+        else:
+            self.database = str(config["NAME"])
+
+    def connect(self, **options):
+        connection = sqlite3.connect(self.database, uri=self.database.startswith("file:"),
+                                     detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False, timeout=30)
+        connection.execute("PRAGMA foreign_keys = ON")
+        if not self.database.startswith("file:"):
+            connection.execute("PRAGMA journal_mode = WAL")  # Чтение не ждёт записи
+        self._ensure_schema(connection)
+        return SQLiteConnection(connection)
+
+    def _ensure_schema(self, connection: sqlite3.Connection):
+        with self._schema_lock:
+            if self.database.startswith("file:") and self._keeper is None:
+                self._keeper = sqlite3.connect(self.database, uri=True, check_same_thread=False)
+            if self._migrated:
+                return
+            if not connection.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]:
+                connection.executescript(translate_ddl(SCHEMA_PATH.read_text(encoding="utf-8")))
+            schema_migrations.migrate(SQLiteConnection(connection), self.name)
+            self._migrated = True
+
+    def ignore_duplicates(self, unique_column: str, key_column: str) -> str:
+        return f"ON CONFLICT ({unique_column}) DO NOTHING"
+
+    def upsert_returning_key(self, unique_column: str, key_column: str) -> str:
+        return f"ON CONFLICT ({unique_column}) DO UPDATE SET {unique_column} = excluded.{unique_column} RETURNING {key_column}"
+
+    def returned_key(self, cursor):
+        return cursor.fetchall()[0][0]
+
+    def first_inserted_id(self, cursor, row_count: int) -> int:
+        return cursor.lastrowid - row_count + 1  # SQLite возвращает код последней строки
+
+    def prefix_match(self, column: str) -> str:
+        # LIKE в SQLite не использует обычный индекс, а GLOB использует. GLOB учитывает регистр
+        return f"{column} GLOB %s"
+
+    def prefix_pattern(self, prefix: str) -> str:
+        return re.sub(r"([*?\[])", r"[\1]", prefix) + "*"
+
+    def add_on_duplicate(self, table: str, key_columns: list[str], columns: list[str]) -> str:
+        updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in columns)
+        return f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}"
+
+    def month_start(self, column: str) -> str:
+        return f"date({column}, 'start of month')"
+
+    def null_safe_equal(self, column: str) -> str:
+        return f"{column} IS %s"
+
+
+class SQLiteConnection:
+    # Соединение SQLite с тем же интерфейсом, что у соединения mysql.connector,
+    # в объёме, который используют пул и модели
+    unread_result = False
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.connection_id = id(connection)
+
+    @property
+    def in_transaction(self) -> bool:
+        return self.connection.in_transaction
+
+    def cursor(self, buffered: bool = None, prepared: bool = None) -> "SQLiteCursor":
+        # SQLite сам кэширует разобранные запросы соединения, отдельные prepared-курсоры не нужны
+        return SQLiteCursor(self.connection)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def consume_results(self):
+        pass
+
+    def ping(self, reconnect: bool = False, attempts: int = 1, delay: int = 0):
+        self.connection.execute("SELECT 1")
+
+    def close(self):
+        self.connection.close()
+
+
+class SQLiteCursor:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+        self.cursor = connection.cursor()
+
+    def execute(self, sql: str, params=()):
+        sql = translate_query(sql)
+        # Модуль sqlite3 сам открывает транзакцию только перед INSERT/UPDATE/DELETE,
+        # а SAVEPOINT вне транзакции фиксировался бы при RELEASE, как отдельная транзакция
+        if sql.startswith("SAVEPOINT") and not self.connection.in_transaction:
+            self.cursor.execute("BEGIN")
+        self.cursor.execute(sql, tuple(params or ()))
+
+    def executemany(self, sql: str, rows):
+        self.cursor.executemany(translate_query(sql), rows)
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size: int = 1):
+        return self.cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    @property
+    def rowcount(self) -> int:
+        return self.cursor.rowcount
+
+    @property
+    def lastrowid(self) -> int:
+        return self.cursor.lastrowid
+
+    def close(self):
+        self.cursor.close()
+
+
+@lru_cache(maxsize=4096)
+def translate_query(sql: str) -> str:
+    return sql.strip().replace("%s", "?")
+
+
+def translate_ddl(script: str) -> str:
+    # Перевод схемы MySQL (create_db.sql) в SQLite: AUTO_INCREMENT у первичных ключей
+    script = re.sub(r"(?im)^\s*use\s+\w+\s*;", "", script)
+    script = re.sub(r"--[^\n]*", "", script)
+    statements = [statement.strip() for statement in script.split(";") if statement.strip()]
+    result = []
+    for statement in statements:
+        if re.match(r"(?i)CREATE\s+TABLE", statement):
+            statement = _translate_table(statement)
+        result.append(statement + ";")
+    return "\n\n".join(result)
+
+
+def _translate_table(statement: str) -> str:
+    auto_columns = re.findall(r"(?i)(\w+)\s+INT\s+AUTO_INCREMENT", statement)
+    for column in auto_columns:
+        statement = re.sub(rf"(?i)\b{column}\s+INT\s+AUTO_INCREMENT(\s+PRIMARY\s+KEY)?",
+                           f"{column} INTEGER PRIMARY KEY AUTOINCREMENT", statement)
+        statement = re.sub(rf"(?i),\s*PRIMARY\s+KEY\s*\(\s*{column}\s*\)", "", statement)
+    return statement
+
+
+def _adapt_date(value: datetime.date) -> str:
+    return value.isoformat()
+
+
+def _adapt_datetime(value: datetime.datetime) -> str:
+    return value.isoformat(" ")
+
+
+def _convert_date(value: bytes) -> datetime.date:
+    return datetime.date.fromisoformat(value.decode())
+
+
+def _convert_timestamp(value: bytes) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.decode())
+
+
+# Даты хранятся строками 'YYYY-MM-DD' и читаются обратно в date, как из MySQL
+sqlite3.register_adapter(datetime.date, _adapt_date)
+sqlite3.register_adapter(datetime.datetime, _adapt_datetime)
+sqlite3.register_converter("DATE", _convert_date)
+sqlite3.register_converter("TIMESTAMP", _convert_timestamp)
+
+BACKENDS = {
+    "mysql": MySQLBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def get_backend(config: dict) -> BaseBackend:
+    return BACKENDS[config.get("BACKEND", "mysql")](config)
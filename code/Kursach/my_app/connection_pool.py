@@ -0,0 +1,89 @@
+import queue
+import threading
+import time
+from mysql.connector import CMySQLConnection
+from .backends import DatabaseError
+
+
+class PoolExhaustedError(Exception):
+    pass
+
+
+class ConnectionPool:
+    # Ограниченный пул соединений с БД, connect - функция открытия нового соединения (backend.connect).
+    # Одновременно выдаётся не больше size соединений, остальные запросы ждут освобождения до timeout секунд.
+    # Соединение, простоявшее без дела дольше ping_interval, перед выдачей проверяется ping-ом и при
+    # необходимости переподключается
+
+    def __init__(self, connect, size: int, timeout: float,
+                 ping_interval: float, reconnect_attempts: int):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.reconnect_attempts = reconnect_attempts
+        self._idle = queue.LifoQueue()  # (соединение, время возврата в пул)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def checkout(self) -> CMySQLConnection:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolExhaustedError(f"Нет свободных соединений с БД (размер пула {self.size})")
+        try:
+            connection = self._take_idle()
+            if connection is None:
+                connection = self.connect()
+            return connection
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, connection: CMySQLConnection, discard: bool = False):
+        try:
+            if connection.unread_result:  # Например, оборванное потоковое чтение
+                connection.consume_results()
+            if connection.in_transaction:  # Незавершённая транзакция не должна достаться следующему запросу
+                connection.rollback()
+        except DatabaseError:
+            discard = True
+        try:
+            if discard:
+                self._close(connection)
+            else:
+                self._idle.put((connection, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    def close(self):
+        # Закрывает свободные соединения. Выданные соединения должны быть возвращены до этого
+        while True:
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(connection)
+
+    def _take_idle(self) -> CMySQLConnection | None:
+        while True:
+            try:
+                connection, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return None
+            if self._is_healthy(connection, released_at):
+                return connection
+            self._close(connection)
+
+    def _is_healthy(self, connection: CMySQLConnection, released_at: float) -> bool:
+        if time.monotonic() - released_at < self.ping_interval:
+            return True
+        try:
+            connection.ping(reconnect=True, attempts=self.reconnect_attempts, delay=1)
+        except DatabaseError:
+            return False
+        return True
+
+    @staticmethod
+    def _close(connection: CMySQLConnection):
+        try:
+            connection.close()
+        except DatabaseError:
+            pass
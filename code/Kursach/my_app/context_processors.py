@@ -0,0 +1,14 @@
+from django.conf import settings
+from .query_log import current_log
+from .unit_of_work import UnitOfWork
+
+
+def staged_changes(request):
+    return {"staged_changes": UnitOfWork(request.session).describe()}
+
+
+def query_log(request):
+    # Журнал запросов для отладочной панели внизу страницы (settings.QUERY_LOG["FOOTER"])
+    if not settings.QUERY_LOG["FOOTER"]:
+        return {}
+    return {"query_log": current_log.get()}
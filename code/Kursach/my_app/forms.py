@@ -1,47 +1,80 @@
 from django import forms
+from django.core import signing
 from .model_objects import UserStatus, BaseModelObj
-from .models import Database, BaseDBModel
+from .models import Database, BaseDBModel, TableQuery
+from .unit_of_work import UnitOfWork
 
 
 class BaseCreateForm(forms.Form):
     model: BaseDBModel
 
-    def save_to_db(self):
+    def save_to_db(self, unit_of_work: UnitOfWork):
         fields = dict()
         for field_name in self.fields:
             fields[field_name] = self.cleaned_data[field_name]
         data = self._convert_data(fields)
-        self.model.create(*data)
+        unit_of_work.create(self.model, data)
 
     def _convert_data(self, fields: dict) -> tuple:
         return tuple(fields.values())
 
 
 class BaseUpdateForm(forms.Form):
+    # Строка читается из БД только для показа формы. Её поля передаются в форме подписанными
+    # (get_snapshot()), и при отправке строка восстанавливается из них без запроса к БД
     model: BaseDBModel
+    snapshot_salt = "my_app.forms.BaseUpdateForm"
 
     primary_params: dict
-    obj: BaseModelObj
+    obj: BaseModelObj | None
 
-    def __init__(self, primary_params, *args, **kwargs):
+    def __init__(self, primary_params, *args, snapshot: str = None, **kwargs):
         super().__init__(*args, **kwargs)
         self.primary_params = primary_params
-        self.obj = self.model.get(*primary_params.values())
-        self.fill_fields()
-
-    def save_to_db(self):
+        self.obj = self._load_snapshot(snapshot) if snapshot else None
+        if self.obj is None:
+            self.obj = self.model.get(*primary_params.values())
+        if not self.is_bound and self.obj is not None:
+            self.fill_fields()
+
+    def get_snapshot(self) -> str:
+        return signing.dumps(UnitOfWork._to_json(list(self.obj)), salt=self.snapshot_salt)
+
+    def _load_snapshot(self, snapshot: str) -> BaseModelObj | None:
+        # Подпись не даёт подменить поля, а сравнение ключа - подставить поля другой строки
+        try:
+            obj = self.model.model_obj(*signing.loads(snapshot, salt=self.snapshot_salt))
+        except (signing.BadSignature, TypeError):
+            return None
+        key = [str(getattr(obj, field)) for field in self.model.get_primary_fields()]
+        return obj if key == [str(value) for value in self.primary_params.values()] else None
+
+    def save_to_db(self, unit_of_work: UnitOfWork):
         fields = dict()
         for field_name in self.fields:
             fields[field_name] = self.cleaned_data[field_name]
         new_params = self._convert_data(fields)
-        self.obj.update(*new_params)
+        unit_of_work.update(self.model, list(self.primary_params.values()), new_params, list(self.obj))
 
     def _convert_data(self, fields: dict) -> tuple:
         return tuple(fields.values())
 
     def fill_fields(self):
-        for field in self.fields:
-            self.fields[field].initial = getattr(self.obj, field)
+        for field, value in self._get_initial().items():
+            self.fields[field].initial = value
+
+    def _get_initial(self) -> dict:
+        # Начальные значения полей формы по строке, обратное к _convert_data
+        return {field: getattr(self.obj, field) for field in self.fields}
+
+
+class BaseBulkUpdateForm(forms.Form):
+    # Новые значения для строк, выбранных в таблице. Пустые поля не меняются
+    model: BaseDBModel
+    prefix = "bulk"
+
+    def get_values(self) -> dict:
+        return {name: value for name, value in self.cleaned_data.items() if value not in (None, "")}
 
 
 class ProviderForm(forms.Form):
@@ -58,6 +91,11 @@ class ProviderUpdateForm(ProviderForm, BaseUpdateForm):
     pass
 
 
+class ProviderBulkUpdateForm(BaseBulkUpdateForm):
+    model = Database.Provider
+    address = forms.CharField(label="Адрес поставщика", max_length=100, required=False)
+
+
 class FlowerForm(forms.Form):
     model = Database.Flower
     name = forms.CharField(label="Название", max_length=50)
@@ -76,6 +114,10 @@ class FlowerForm(forms.Form):
         provider_id = Database.Provider.get_provider_id(fields["provider_name"])
         return fields["name"], fields["price"], provider_id
 
+    def _get_initial(self) -> dict:
+        provider_name = Database.Provider.get_provider_name(self.obj.provider_id)
+        return {"name": self.obj.name, "price": self.obj.price, "provider_name": provider_name}
+
 
 class FlowerCreateForm(FlowerForm, BaseCreateForm):
     pass
@@ -85,6 +127,12 @@ class FlowerUpdateForm(FlowerForm, BaseUpdateForm):
     pass
 
 
+class FlowerBulkUpdateForm(BaseBulkUpdateForm):
+    model = Database.Flower
+    price = forms.IntegerField(label="Цена за рассаду", required=False)
+    provider_id = forms.IntegerField(label="Код поставщика", required=False)
+
+
 class CustomerForm(forms.Form):
     model = Database.Customer
     name = forms.CharField(label="Название заказчика", max_length=50)
@@ -100,6 +148,11 @@ class CustomerUpdateForm(CustomerForm, BaseUpdateForm):
     pass
 
 
+class CustomerBulkUpdateForm(BaseBulkUpdateForm):
+    model = Database.Customer
+    address = forms.CharField(label="Адрес заказчика", max_length=100, required=False)
+
+
 class ContractForm(forms.Form):
     model = Database.Contract
     customer_name = forms.ChoiceField(label="Заказчик")
@@ -116,7 +169,12 @@ class ContractForm(forms.Form):
 
     def _convert_data(self, fields: dict) -> tuple:
         customer_id = Database.Customer.get_customer_id(fields["customer_name"])
-        return fields["customer_name"], fields["register_date"], fields["execution_date"], customer_id
+        return customer_id, fields["register_date"], fields["execution_date"]
+
+    def _get_initial(self) -> dict:
+        customer_name = Database.Customer.get_customer_name(self.obj.customer_id)
+        return {"customer_name": customer_name, "register_date": self.obj.register_date,
+                "execution_date": self.obj.execution_date}
 
 
 class ContractCreateForm(ContractForm, BaseCreateForm):
@@ -127,6 +185,12 @@ class ContractUpdateForm(ContractForm, BaseUpdateForm):
     pass
 
 
+class ContractBulkUpdateForm(BaseBulkUpdateForm):
+    model = Database.Contract
+    register_date = forms.DateField(label="Дата регистрации", required=False, widget=forms.DateInput({"type": "date"}))
+    execution_date = forms.DateField(label="Дата исполнения", required=False, widget=forms.DateInput({"type": "date"}))
+
+
 class OrderForm(forms.Form):
     model = Database.Order
     contract_id = forms.ChoiceField(label="Номер договора")
@@ -150,6 +214,10 @@ class OrderForm(forms.Form):
         flower_id = Database.Flower.get_flower_id(fields["flower_name"])
         return fields["contract_id"], flower_id, fields["quantity"]
 
+    def _get_initial(self) -> dict:
+        flower_name = Database.Flower.get_flower_name(self.obj.flower_id)
+        return {"contract_id": self.obj.contract_id, "flower_name": flower_name, "quantity": self.obj.quantity}
+
 
 class OrderCreateForm(OrderForm, BaseCreateForm):
     pass
@@ -159,6 +227,13 @@ class OrderUpdateForm(OrderForm, BaseUpdateForm):
     pass
 
 
+class OrderBulkUpdateForm(BaseBulkUpdateForm):
+    model = Database.Order
+    contract_id = forms.IntegerField(label="Код договора", required=False)
+    flower_id = forms.IntegerField(label="Код цветка", required=False)
+    quantity = forms.IntegerField(label="Количество рассады", required=False)
+
+
 class EmployeeForm(forms.Form):
     model = Database.Employee
     login = forms.CharField(label="Логин", max_length=50)
@@ -174,21 +249,87 @@ class EmployeeUpdateForm(EmployeeForm, BaseUpdateForm):
     pass
 
 
-class CustomerForm(forms.Form):
+class EmployeeBulkUpdateForm(BaseBulkUpdateForm):
+    model = Database.Employee
+    job_title = forms.ChoiceField(label="Должность", required=False,
+                                  choices=[("", "---------"), *((e.value, e.value) for e in UserStatus if e.value)])
+
+
+class CustomerUserForm(forms.Form):
     model = Database.CustomerUser
     login = forms.CharField(label="Логин", max_length=50)
     password = forms.CharField(label="Пароль", widget=forms.PasswordInput())
     name = forms.CharField(label="Название компании", max_length=50)
 
+    def clean_name(self) -> str:
+        name = self.cleaned_data["name"]
+        if name not in Database.Customer.name_ids.get():
+            raise forms.ValidationError("Заказчика с таким названием нет")
+        return name
+
+    def _convert_data(self, fields: dict) -> tuple:
+        # В строке аккаунта хранится код заказчика, а в форме вводится его название
+        return fields["login"], fields["password"], Database.Customer.get_customer_id(fields["name"])
+
+    def _get_initial(self) -> dict:
+        return {"login": self.obj.login, "name": Database.Customer.get_customer_name(self.obj.customer_id)}
+
 
-class CustomerUserRegisterForm(CustomerForm, BaseCreateForm):
+class CustomerUserRegisterForm(CustomerUserForm, BaseCreateForm):
     pass
 
 
-class CustomerUserUpdateForm(CustomerForm, BaseUpdateForm):
+class CustomerUserUpdateForm(CustomerUserForm, BaseUpdateForm):
     pass
 
 
 class LoginForm(forms.Form):
     login = forms.CharField(label="Логин", max_length=50)
     password = forms.CharField(label="Пароль", widget=forms.PasswordInput())
+
+
+class TableFilterForm(forms.Form):
+    # Фильтры и сортировка таблицы по model.filter_columns. Поля "int" и "date" отбираются
+    # по диапазону <поле>_from - <поле>_to (одинаковые границы - равенство), "prefix" - по началу строки
+    range_fields = {
+        "int": lambda label: forms.IntegerField(label=label, required=False),
+        "date": lambda label: forms.DateField(label=label, required=False, widget=forms.DateInput({"type": "date"})),
+    }
+
+    def __init__(self, model: BaseDBModel, labels: dict[str, str], *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.model = model
+        sort_choices = [("", "---------")]
+        for name, (column, kind) in model.filter_columns.items():
+            label = labels.get(name, name)
+            if kind == "prefix":
+                self.fields[name] = forms.CharField(label=f"{label} начинается с", max_length=100, required=False)
+            else:
+                self.fields[f"{name}_from"] = self.range_fields[kind](f"{label} от")
+                self.fields[f"{name}_to"] = self.range_fields[kind]("до")
+            if name in model.get_sort_fields():
+                sort_choices += [(name, f"{label} ↑"), (f"-{name}", f"{label} ↓")]
+        self.fields["sort"] = forms.ChoiceField(label="Сортировка", choices=sort_choices, required=False)
+
+    def get_query(self) -> TableQuery:
+        # Поля с ошибками не применяются, ошибки показываются в форме
+        query = TableQuery()
+        if not self.is_bound:
+            return query
+        self.is_valid()
+        data = self.cleaned_data
+        for name, (column, kind) in self.model.filter_columns.items():
+            if kind == "prefix":
+                if data.get(name):
+                    query.filters.append((name, "prefix", data[name]))
+                continue
+            low, high = data.get(f"{name}_from"), data.get(f"{name}_to")
+            if low is not None and low == high:
+                query.filters.append((name, "=", low))
+                continue
+            if low is not None:
+                query.filters.append((name, ">=", low))
+            if high is not None:
+                query.filters.append((name, "<=", high))
+        query.sort = data.get("sort") or None
+        return query
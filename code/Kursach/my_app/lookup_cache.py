@@ -0,0 +1,77 @@
+import threading
+import time
+import uuid
+from django.core.cache import caches
+
+
+class LookupCache:
+    # Справочник (например, название -> код) в кэше, общем для всех процессов (settings.CACHES["lookups"]).
+    # Данные лежат под ключом с текущей версией таблицы. Запись в таблицу меняет версию (bump),
+    # и первый следующий запрос перечитывает справочник из БД. Пока версия не менялась,
+    # процесс отдаёт свою копию из памяти и не обращается к самим данным в кэше.
+    # Справочники читаются с основной БД, а не с реплик: отстающая реплика сохранила бы
+    # в общем кэше старые данные под новой версией до следующего изменения таблицы.
+    # bump вызывает приложение после своих транзакций. Изменения в обход приложения меняют только
+    # версию таблицы в БД (table_version), её процесс сверяет не чаще раза в revalidate_seconds
+    cache_alias = "lookups"
+    revalidate_seconds = 5
+    _db_versions: dict[str, tuple[float, int]] = {}  # Таблица -> (время сверки, версия в БД)
+    _db_versions_lock = threading.Lock()
+
+    def __init__(self, table: str, name: str, loader):
+        self.table = table
+        self.name = name
+        self.loader = loader
+        self._local_version = None
+        self._local_value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        cache = caches[self.cache_alias]
+        version = f"{self.get_version(self.table)}:{self.get_db_version(self.table)}"
+        with self._lock:
+            if version == self._local_version:
+                return self._local_value
+        key = f"lookup:{self.table}:{self.name}:{version}"
+        value = cache.get(key)
+        if value is None:
+            value = self.loader()
+            cache.set(key, value)  # Данные старых версий удаляются по TIMEOUT из настроек кэша
+        with self._lock:
+            self._local_version, self._local_value = version, value
+        return value
+
+    @classmethod
+    def get_version(cls, table: str) -> str:
+        cache = caches[cls.cache_alias]
+        version = cache.get(f"version:{table}")
+        if version is None:
+            cache.add(f"version:{table}", uuid.uuid4().hex, timeout=None)
+            version = cache.get(f"version:{table}")
+        return version
+
+    @classmethod
+    def get_db_version(cls, table: str) -> int:
+        now = time.monotonic()
+        with cls._db_versions_lock:
+            checked_at, version = cls._db_versions.get(table, (None, None))
+        if checked_at is None or now - checked_at >= cls.revalidate_seconds:
+            from .model_objects import Connection  # model_objects импортирует этот модуль
+            version = Connection.execute_prepared(
+                "SELECT COALESCE(SUM(version), 0) FROM table_version WHERE table_name = %s", (table,)
+            ).fetchall()[0][0]
+            with cls._db_versions_lock:
+                cls._db_versions[table] = (now, version)
+        return version
+
+    @classmethod
+    def forget_db_versions(cls):
+        # После подключения к другой БД (Connection.reset)
+        with cls._db_versions_lock:
+            cls._db_versions.clear()
+
+    @classmethod
+    def bump(cls, table: str):
+        # Новая версия - случайная строка, а не счётчик: одновременные bump из разных процессов
+        # не могут вернуть версию, под которой уже лежат устаревшие данные
+        caches[cls.cache_alias].set(f"version:{table}", uuid.uuid4().hex, timeout=None)
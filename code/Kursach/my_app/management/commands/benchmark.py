@@ -0,0 +1,328 @@
+import datetime
+import io
+import itertools
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from my_app import urls, views
+from my_app.model_objects import Connection, UserStatus
+from my_app.models import Database
+
+# Число заказов (booking) в БД для каждого масштаба. Остальные таблицы генератор
+# заполняет пропорционально: договоров в 5 раз меньше, заказчиков ещё в 10 раз меньше и т.д.
+SCALES = {
+    "1k": 1_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+}
+
+GENERATOR_PATH = settings.BASE_DIR.parent / "CSV generator" / "generator.py"
+SEED_USERS = 100  # Сотрудников и аккаунтов заказчиков в БД замеров
+
+
+class Command(BaseCommand):
+    help = ("Замеряет методы моделей и все URL приложения на БД SQLite разного размера. "
+            "Результаты сохраняются в JSON и сравниваются с эталонным файлом")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", nargs="+", choices=list(SCALES), default=list(SCALES),
+                            help="Размеры БД по числу заказов")
+        parser.add_argument("--repeat", type=int, default=5, help="Запусков каждого замера, берётся медиана")
+        parser.add_argument("--stream", action="store_true",
+                            help="Замерять и потоковый вывод таблиц целиком (?stream=1)")
+        parser.add_argument("--output", help="Файл для результатов в JSON")
+        parser.add_argument("--baseline", help="Файл с эталонными результатами для сравнения")
+        parser.add_argument("--tolerance", type=float, default=0.3,
+                            help="Допустимое замедление относительно эталона, 0.3 = на 30%%")
+        parser.add_argument("--min-delta-ms", type=float, default=2.0,
+                            help="Замедление меньше стольких мс не считается регрессией")
+        parser.add_argument("--data-dir", default=os.path.join(settings.BASE_DIR, "benchmark_data"),
+                            help="Папка для заполненных БД, они создаются один раз на масштаб")
+
+    def handle(self, *args, **options):
+        self.options = options
+        results = {"repeat": options["repeat"], "scales": {}}
+        for scale in options["scale"]:
+            template_path = self.get_seeded_db(scale)
+            with tempfile.TemporaryDirectory() as work_dir:
+                # Замеры изменяют БД (формы фиксируют изменения), поэтому работают с копией
+                db_path = os.path.join(work_dir, "benchmark.sqlite3")
+                self.copy_db(template_path, db_path)
+                with self.use_database(db_path, work_dir):
+                    timings = {**self.bench_models(), **self.bench_urls()}
+            results["scales"][scale] = timings
+            self.print_timings(scale, timings)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+        if options["baseline"]:
+            self.compare(results, options["baseline"])
+
+    @contextmanager
+    def use_database(self, db_path: str, work_dir: str):
+        # Модели и представления работают с БД замеров, а не с БД из настроек.
+        # Сессии хранятся в cookie, чтобы не требовать таблиц Django
+        lookups = {**settings.CACHES["lookups"], "LOCATION": os.path.join(work_dir, "lookup_cache")}
+        with override_settings(
+                MODEL_DATABASE={**settings.MODEL_DATABASE, "BACKEND": "sqlite", "NAME": db_path},
+                CACHES={**settings.CACHES, "lookups": lookups},
+                SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies",
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+        ):
+            Connection.reset()
+            try:
+                yield
+            finally:
+                Connection.reset()
+
+    def get_seeded_db(self, scale: str) -> str:
+        # БД масштаба: данные генератора, загруженные bulk_load, и пользователи
+        os.makedirs(self.options["data_dir"], exist_ok=True)
+        path = os.path.join(self.options["data_dir"], f"{scale}.sqlite3")
+        if os.path.exists(path):
+            return path
+        self.stdout.write(f"{scale}: заполнение БД {path}")
+        with tempfile.TemporaryDirectory() as work_dir:
+            csv_dir = os.path.join(work_dir, "csv")
+            subprocess.run([sys.executable, str(GENERATOR_PATH), "--bookings", str(SCALES[scale]),
+                            "--out", csv_dir, "--seed", "42"], check=True, stdout=subprocess.DEVNULL)
+            db_path = os.path.join(work_dir, "seed.sqlite3")
+            with self.use_database(db_path, work_dir):
+                call_command("bulk_load", dir=csv_dir, workers=1, skip_fk_check=True, stdout=io.StringIO())
+                self.seed_users()
+            # Копия, а не перенос: вместе с файлом БД остались бы её файлы WAL
+            self.copy_db(db_path, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        return path
+
+    @staticmethod
+    def seed_users():
+        customer_ids = sorted({obj.customer_id for obj in Database.Customer.page(limit=SEED_USERS).objects})
+        with Connection.transaction():
+            Database.Employee.create_many([(f"employee{i}", "password", status.value)
+                                           for i, status in zip(range(SEED_USERS), itertools.cycle(UserStatus))
+                                           if status.value is not None])
+            Database.CustomerUser.create_many([(f"customer{customer_id}", "password", customer_id)
+                                               for customer_id in customer_ids])
+
+    @staticmethod
+    def copy_db(source_path: str, target_path: str):
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+    def bench_models(self) -> dict:
+        # all(), get(), update(), create() и remove() каждой модели. Изменения откатываются,
+        # update() меняет одно поле строки (get_changed_fields), remove() удаляет строки, созданные create()
+        repeat = self.options["repeat"]
+        sample = self.get_sample()
+        counter = itertools.count()
+        timings = {}
+        changed_fields = self.get_changed_fields()
+        for name, make_row in self.get_model_rows(sample).items():
+            model = Database.get_model(name)
+            changed_field, change = changed_fields[name]
+            timings[f"{name}.all"] = self.measure(model.all, [()] * repeat)
+            objects = model.page(limit=repeat).objects
+            keys = [[getattr(obj, field) for field in model.get_primary_fields()] for obj in objects]
+            timings[f"{name}.get"] = self.measure(model.get, keys)
+            try:
+                timings[f"{name}.update"] = self.measure(
+                    lambda obj: obj.update(*[change(getattr(obj, field)) if field == changed_field else getattr(obj, field)
+                                             for field in obj.get_manual_fields()]),
+                    [(obj,) for obj in objects])
+                rows = [make_row(next(counter)) for _ in range(repeat)]
+                created = []
+                timings[f"{name}.create"] = self.measure(lambda *row: created.append(model.create(*row)), rows)
+                created_objects = [model.get(*self.get_created_key(name, row, key)) for row, key in zip(rows, created)]
+                timings[f"{name}.remove"] = self.measure(lambda obj: obj.remove(), [(obj,) for obj in created_objects])
+            finally:
+                Connection.get_connection().rollback()
+        Connection.release()
+        return timings
+
+    @staticmethod
+    def get_sample() -> dict:
+        # Существующие строки, на которые ссылаются новые строки замеров
+        return {
+            "provider": Database.Provider.page(limit=1).objects[0],
+            "flower": Database.Flower.page(limit=1).objects[0],
+            "customer": Database.Customer.page(limit=1).objects[0],
+            "contract": Database.Contract.page(limit=1).objects[0],
+        }
+
+    @staticmethod
+    def get_model_rows(sample: dict) -> dict:
+        # Модель -> функция, возвращающая аргументы create() для i-й новой строки
+        date = datetime.date(2023, 1, 1)
+        return {
+            "Provider": lambda i: (f"benchmark provider {i}", f"benchmark address {i}"),
+            "Flower": lambda i: (f"benchmark flower {i}", 100, sample["provider"].provider_id),
+            "Customer": lambda i: (f"benchmark customer {i}", f"+7900{i:07d}", f"benchmark address {i}"),
+            "Contract": lambda i: (sample["customer"].customer_id, date, date + datetime.timedelta(days=30)),
+            "Order": lambda i: (sample["contract"].contract_id, sample["flower"].flower_id, 10),
+            "Employee": lambda i: (f"benchmark_employee_{i}", "password", UserStatus.ACCOUNTANT.value),
+            "CustomerUser": lambda i: (f"benchmark_customer_{i}", "password", sample["customer"].customer_id),
+        }
+
+    @staticmethod
+    def get_changed_fields() -> dict:
+        # Модель -> поле, которое меняет замер update(), и функция нового значения. Поля выбраны так,
+        # чтобы новое значение не нарушало уникальность и длину колонки
+        return {
+            "Provider": ("address", lambda value: value + " *"),
+            "Flower": ("price", lambda value: value + 1),
+            "Customer": ("address", lambda value: value + " *"),
+            "Contract": ("execution_date", lambda value: value + datetime.timedelta(days=1)),
+            "Order": ("quantity", lambda value: value + 1),
+            "Employee": ("password", lambda value: "benchmark" if value != "benchmark" else "password"),
+            "CustomerUser": ("password", lambda value: "benchmark" if value != "benchmark" else "password"),
+        }
+
+    @staticmethod
+    def get_created_key(name: str, row: tuple, created_id) -> tuple:
+        if name in ("Provider", "Customer"):  # Ключ - код и адрес/телефон
+            return created_id, row[1]
+        return (created_id,)
+
+    def bench_urls(self) -> dict:
+        # Полный путь запроса (middleware, сессия, представление, шаблон) для каждого URL из urls.py
+        client = Client(raise_request_exception=False)
+        rollback_path = reverse("rollback_url")
+        timings = {}
+        for pattern in urls.urlpatterns:
+            for label, method, path, make_data, prepare in self.get_url_requests(pattern):
+                times = []
+                for i in range(self.options["repeat"]):
+                    client.cookies["user_status"] = UserStatus.HEAD_MANAGER.value  # exit_url её удаляет
+                    if prepare is not None:
+                        prepare(client, i)
+                    data = make_data(i)
+                    started = time.perf_counter()
+                    response = getattr(client, method)(path, data)
+                    times.append(time.perf_counter() - started)
+                    client.post(rollback_path, {"curr_path": "/"})  # Сессия не растёт от замера к замеру
+                timing = self.summarize(times)
+                timing["status"] = response.status_code
+                timings[f"{method.upper()} {pattern.name}{label}"] = timing
+                if response.status_code >= 500:
+                    self.stderr.write(f"{method.upper()} {path}{label}: ответ {response.status_code}")
+        Connection.release()
+        return timings
+
+    def get_url_requests(self, pattern) -> list[tuple]:
+        # (подпись, метод, путь, данные i-го запроса, подготовка i-го запроса вне замера)
+        path = reverse(pattern.name)
+        view_class = pattern.callback.view_class
+        requests = [("", "get", path, lambda i: {}, None)]
+        if issubclass(view_class, views.BaseTableView):
+            if self.options["stream"]:
+                requests.append((" stream", "get", path, lambda i: {"stream": "1"}, None))
+        elif issubclass(view_class, views.BaseCreateView):
+            requests.append(("", "post", path, self.get_form_data(view_class.form_class.model), None))
+        elif issubclass(view_class, views.BaseUpdateView):
+            obj = view_class.model.page(limit=1).objects[0]
+            key = {field: getattr(obj, field) for field in view_class.model.get_primary_fields()}
+            old_key = {"__old_" + field: value for field, value in key.items()}
+            form_data = self.get_form_data(view_class.model)
+            requests = [
+                ("", "get", path, lambda i: key, None),
+                ("", "post", path, lambda i: {**form_data(i), **old_key}, None),
+            ]
+        elif issubclass(view_class, views.Commit):
+            # Фиксируется новый цветок, добавленный в сессию перед замером
+            create_path = reverse("create_flower_url")
+            form_data = self.get_form_data(Database.Flower)
+            requests = [("", "post", path, lambda i: {"curr_path": "/"},
+                         lambda client, i: client.post(create_path, form_data(f"commit {i}")))]
+        elif issubclass(view_class, views.Rollback):
+            requests = [("", "post", path, lambda i: {"curr_path": "/"}, None)]
+        elif issubclass(view_class, views.LoginView):
+            requests.append(("", "post", path, lambda i: {"login": "employee0", "password": "password"}, None))
+        Connection.release()
+        return requests
+
+    @staticmethod
+    def get_form_data(model):
+        # Функция, возвращающая данные формы создания/изменения строки модели для i-го запроса
+        provider_name = Database.Provider.page(limit=1).objects[0].name
+        customer_name = Database.Customer.page(limit=1).objects[0].name
+        contract_id = Database.Contract.page(limit=1).objects[0].contract_id
+        flower_name = Database.Flower.page(limit=1).objects[0].name
+        return {
+            Database.Provider: lambda i: {"name": f"benchmark provider {i}", "address": f"benchmark address {i}"},
+            Database.Flower: lambda i: {"name": f"benchmark flower {i}", "price": 100,
+                                        "provider_name": provider_name},
+            Database.Customer: lambda i: {"name": f"benchmark customer {i}", "phone": f"+7900{i:07d}",
+                                          "address": f"benchmark address {i}"},
+            Database.Contract: lambda i: {"customer_name": customer_name, "register_date": "2023-01-01",
+                                          "execution_date": "2023-02-01"},
+            Database.Order: lambda i: {"contract_id": contract_id, "flower_name": flower_name, "quantity": 10},
+            Database.Employee: lambda i: {"login": f"benchmark_employee_{i}", "password": "password",
+                                          "job_title": UserStatus.ACCOUNTANT.value},
+            Database.CustomerUser: lambda i: {"login": f"benchmark_customer_{i}", "password": "password",
+                                              "name": customer_name},
+        }[model]
+
+    def measure(self, function, runs: list) -> dict:
+        times = []
+        for args in runs:
+            started = time.perf_counter()
+            function(*args)
+            times.append(time.perf_counter() - started)
+        return self.summarize(times)
+
+    @staticmethod
+    def summarize(times: list[float]) -> dict:
+        return {
+            "runs": len(times),
+            "median_ms": round(statistics.median(times) * 1000, 3),
+            "min_ms": round(min(times) * 1000, 3),
+        }
+
+    def print_timings(self, scale: str, timings: dict):
+        self.stdout.write(f"\n{scale} ({SCALES[scale]} заказов):")
+        width = max(len(name) for name in timings)
+        for name, timing in timings.items():
+            status = f"  [{timing['status']}]" if "status" in timing else ""
+            self.stdout.write(f"  {name:<{width}}  {timing['median_ms']:>10.2f} мс{status}")
+
+    def compare(self, results: dict, baseline_path: str):
+        # Регрессия - медиана больше эталонной более чем на tolerance и более чем на min_delta_ms.
+        # Замеры, которых нет в эталоне (новые URL или масштабы), не сравниваются
+        with open(baseline_path, encoding="utf-8") as file:
+            baseline = json.load(file)
+        tolerance = self.options["tolerance"]
+        regressions = []
+        for scale, timings in results["scales"].items():
+            baseline_timings = baseline["scales"].get(scale, {})
+            for name, timing in timings.items():
+                if name not in baseline_timings:
+                    continue
+                old, new = baseline_timings[name]["median_ms"], timing["median_ms"]
+                if new > old * (1 + tolerance) and new - old > self.options["min_delta_ms"]:
+                    regressions.append(f"{scale} {name}: {old:.2f} -> {new:.2f} мс")
+                if timing.get("status") != baseline_timings[name].get("status"):
+                    regressions.append(f"{scale} {name}: ответ {baseline_timings[name].get('status')} "
+                                       f"-> {timing.get('status')}")
+        if regressions:
+            raise CommandError("Регрессии относительно эталона:\n" + "\n".join(regressions))
+        self.stdout.write(f"Регрессий относительно {baseline_path} нет")
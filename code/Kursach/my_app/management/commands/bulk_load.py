@@ -0,0 +1,181 @@
+import csv
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from my_app.backends import DatabaseError, error_message
+from my_app.lookup_cache import LookupCache
+from my_app.model_objects import Connection, Summaries
+
+# Файлы генератора (CSV generator/generator.py) и таблицы, в которые они загружаются.
+# Таблицы одного уровня не зависят друг от друга и грузятся параллельно,
+# следующий уровень начинается только после предыдущего
+LOAD_LEVELS = [
+    {
+        "provider_name.csv": "provider_name",
+        "customer_name.csv": "customer_name",
+    },
+    {
+        "provider_address.csv": "provider_address",
+        "flowers.csv": "flower",
+        "customer_info.csv": "customer_info",
+        "contracts.csv": "contract",
+    },
+    {
+        "bookings.csv": "booking",
+    },
+]
+
+# (таблица, колонка, родительская таблица, колонка родителя)
+FOREIGN_KEYS = [
+    ("provider_address", "provider_id", "provider_name", "provider_id"),
+    ("flower", "provider_id", "provider_name", "provider_id"),
+    ("customer_info", "customer_id", "customer_name", "customer_id"),
+    ("contract", "customer_id", "customer_name", "customer_id"),
+    ("booking", "contract_id", "contract", "contract_id"),
+    ("booking", "flower_id", "flower", "flower_id"),
+]
+
+
+class Command(BaseCommand):
+    help = ("Загружает CSV-файлы генератора в БД в порядке внешних ключей. "
+            "В MySQL использует LOAD DATA LOCAL INFILE, а если он недоступен - пачки INSERT")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", default=os.path.join(settings.BASE_DIR.parent, "CSV generator", "csv"),
+                            help="Папка с CSV-файлами")
+        parser.add_argument("--batch-size", type=int, default=5000,
+                            help="Строк в одном INSERT, если LOAD DATA недоступен")
+        parser.add_argument("--workers", type=int, default=4,
+                            help="Сколько таблиц одного уровня грузить одновременно")
+        parser.add_argument("--no-local-infile", action="store_true",
+                            help="Не пробовать LOAD DATA LOCAL INFILE")
+        parser.add_argument("--skip-fk-check", action="store_true",
+                            help="Не проверять внешние ключи после загрузки")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.backend = Connection.get_backend()
+        directory = options["dir"]
+        if not os.path.isdir(directory):
+            raise CommandError(f"Папка {directory} не найдена")
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["workers"]) as executor:
+            for level in LOAD_LEVELS:
+                files = [(os.path.join(directory, file_name), table) for file_name, table in level.items()
+                         if os.path.exists(os.path.join(directory, file_name))]
+                # Перебор результатов дожидается загрузки всего уровня и пробрасывает ошибки
+                for path, table, rows, method, seconds in executor.map(lambda args: self.load_file(*args), files):
+                    LookupCache.bump(table)
+                    self.stdout.write(f"{table}: {rows} строк за {seconds:.1f} с ({method})")
+        self.stdout.write(f"Всего: {time.monotonic() - started:.1f} с")
+
+        # Сводки отчётов меняют модели, а загрузка идёт в обход них, поэтому сводки пересчитываются целиком
+        started = time.monotonic()
+        with Connection.transaction():
+            Summaries.rebuild()
+        Connection.release()
+        self.stdout.write(f"Сводки отчётов пересчитаны за {time.monotonic() - started:.1f} с")
+
+        if not options["skip_fk_check"]:
+            self.check_foreign_keys()
+
+    def load_file(self, path: str, table: str) -> tuple:
+        # Каждая таблица грузится своим соединением. Проверки внешних ключей и уникальности
+        # отключены на время загрузки и проверяются после неё (check_foreign_keys).
+        # Триггеры версий таблиц (table_version) отключены, версия меняется один раз в конце
+        started = time.monotonic()
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            if self.backend.name == "mysql":
+                cursor.execute("SET foreign_key_checks = 0")
+                cursor.execute("SET unique_checks = 0")
+                cursor.execute("SET @table_version_disabled = 1")
+            with open(path, newline="", encoding="utf-8") as file:
+                columns = next(csv.reader(file))
+            rows, method = None, "INSERT"
+            if self.backend.name == "mysql" and not self.options["no_local_infile"]:
+                try:
+                    rows = self.load_data_infile(cursor, path, table, columns)
+                    method = "LOAD DATA"
+                except DatabaseError as error:
+                    self.stderr.write(f"{table}: LOAD DATA недоступен ({error_message(error)}), загрузка через INSERT")
+                    connection.rollback()
+            if rows is None:
+                rows = self.insert_batches(connection, cursor, path, table, columns)
+            cursor.execute("""
+                UPDATE table_version
+                SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE table_name = %s AND shard = 0
+            """, (table,))
+            connection.commit()
+        finally:
+            connection.close()
+        return path, table, rows, method, time.monotonic() - started
+
+    def load_data_infile(self, cursor, path: str, table: str, columns: list[str]) -> int:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE %s
+            INTO TABLE {table}
+            CHARACTER SET utf8mb4
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+            LINES TERMINATED BY %s
+            IGNORE 1 LINES
+            ({",".join(columns)})
+        """, (os.path.abspath(path), self.line_terminator(path)))
+        return cursor.rowcount
+
+    def insert_batches(self, connection, cursor, path: str, table: str, columns: list[str]) -> int:
+        # executemany склеивает пачку в один многострочный INSERT
+        query = f"""
+            INSERT INTO {table}({",".join(columns)})
+            VALUES ({",".join(["%s"] * len(columns))})
+        """
+        rows = 0
+        with open(path, newline="", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            next(reader)
+            while batch := list(islice(reader, self.options["batch_size"])):
+                cursor.executemany(query, batch)
+                connection.commit()
+                rows += len(batch)
+        return rows
+
+    def check_foreign_keys(self):
+        connection = self.connect()
+        try:
+            cursor = connection.cursor()
+            broken = []
+            for table, column, parent, parent_column in FOREIGN_KEYS:
+                cursor.execute(f"""
+                    SELECT COUNT(*)
+                    FROM {table}
+                    LEFT JOIN {parent}
+                    ON {table}.{column} = {parent}.{parent_column}
+                    WHERE {table}.{column} IS NOT NULL AND {parent}.{parent_column} IS NULL
+                """)
+                count = cursor.fetchone()[0]
+                if count:
+                    broken.append(f"{table}.{column} -> {parent}: {count} строк без родителя")
+        finally:
+            connection.close()
+        if broken:
+            raise CommandError("Нарушены внешние ключи:\n" + "\n".join(broken))
+        self.stdout.write("Внешние ключи в порядке")
+
+    def connect(self):
+        return self.backend.connect(allow_local_infile=True)
+
+    @staticmethod
+    def line_terminator(path: str) -> str:
+        with open(path, "rb") as file:
+            head = file.read(64 * 1024)
+        if b"\r\n" in head:
+            return "\r\n"
+        if b"\r" in head and b"\n" not in head:
+            return "\r"
+        return "\n"
@@ -0,0 +1,143 @@
+import ast
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from my_app import model_objects, models
+from my_app.model_objects import BaseModelObj, Connection, Summaries
+from my_app.models import Database, TableQuery
+
+# Таблицы, растущие вместе с числом заказов. Полный просмотр остальных таблиц (поставщики,
+# цветы, сотрудники, версии таблиц) дёшев и не считается ошибкой
+LARGE_TABLES = ["booking", "contract", "customer_name", "customer_info", "customer_user",
+                "contract_total", "customer_month_revenue", "provider_month_revenue"]
+
+# Запросы, которые читают всю таблицу намеренно: вывод таблицы целиком и загрузка справочников
+FULL_READ_STATEMENTS = {"all", "name_ids", "ids"}
+
+SOURCE_FILES = [Path(models.__file__), Path(model_objects.__file__)]
+
+
+@dataclass
+class PlanStep:
+    table: str | None
+    full_scan: bool  # Читаются все строки таблицы или все записи индекса
+    sorts: bool  # Результат сортируется отдельно, LIMIT не останавливает чтение раньше
+    detail: str
+
+
+class Command(BaseCommand):
+    help = ("Выполняет EXPLAIN для каждого запроса из models.py и model_objects.py и завершается "
+            "с ошибкой, если запрос просматривает большую таблицу целиком. "
+            "Планы зависят от данных, поэтому проверять лучше на заполненной БД (см. manage.py benchmark). "
+            "С -v 2 выводит планы всех запросов")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--table", nargs="+", default=LARGE_TABLES, help="Большие таблицы")
+
+    def handle(self, *args, **options):
+        backend = Connection.get_backend()
+        explain = {"mysql": self.explain_mysql, "sqlite": self.explain_sqlite}[backend.name]
+        connection = backend.connect()
+        problems = []
+        try:
+            cursor = connection.cursor()
+            statements = self.collect_statements()
+            for label, sql in statements.items():
+                if not re.match(r"(?i)\s*(SELECT|UPDATE|DELETE|INSERT\s+INTO\s+\w+\s*\([^)]*\)\s*SELECT)\b", sql):
+                    continue
+                plan = explain(cursor, self.with_sample_params(sql))
+                if options["verbosity"] >= 2:
+                    self.stdout.write(f"{label}:\n" + "\n".join(f"    {step.detail}" for step in plan))
+                limited = re.search(r"(?i)\bLIMIT\b", sql) is not None
+                sorts = any(step.sorts for step in plan)
+                for step in plan:
+                    if not step.full_scan or step.table not in options["table"]:
+                        continue
+                    if limited and not sorts:  # Чтение по индексу в нужном порядке до LIMIT строк
+                        continue
+                    if label.rsplit(".", 1)[-1] in FULL_READ_STATEMENTS:
+                        continue
+                    problems.append(f"{label}: {step.detail}\n    {' '.join(sql.split())}")
+        finally:
+            connection.rollback()
+            connection.close()
+        if problems:
+            raise CommandError("Полный просмотр больших таблиц:\n" + "\n".join(problems))
+        self.stdout.write(f"Проверено запросов: {len(statements)}, полных просмотров больших таблиц нет")
+
+    @staticmethod
+    def collect_statements() -> dict[str, str]:
+        # Запросы из реестров statements моделей и объектов строк, запросы страниц с каждым
+        # фильтром и сортировкой из filter_columns и SQL-литералы, передаваемые
+        # в execute()/execute_prepared() прямо в коде методов
+        statements = {}
+        for name in Database.__annotations__:
+            model = Database.get_model(name)
+            for statement, sql in model.statements.items():
+                statements.setdefault(f"{name}.{statement}", sql)
+            queries = {}
+            for field, (column, kind) in model.filter_columns.items():
+                op = "prefix" if kind == "prefix" else ">="
+                queries[f"{name}[{field} {op}]"] = TableQuery(filters=[(field, op, None)])
+            for field in model.get_sort_fields():
+                queries[f"{name}[sort {field}]"] = TableQuery(sort=field)
+            for label, query in queries.items():
+                statements.setdefault(f"{label}.page_after", model.get_query_statement("after", query))
+                if query.sort is not None:
+                    # Запрос строк без NULL ("not_nulls") читает по индексу с начала, как первая страница
+                    statements.setdefault(f"{label}.page_before", model.get_query_statement("before", query))
+                    for segment in () if query.sort in model.not_null_fields else ("null_key", "nulls"):
+                        statements.setdefault(f"{label}.page_after.{segment}",
+                                              model.get_query_statement("after", query, segment))
+        for statement, sql in Summaries.get_statements().items():
+            statements.setdefault(f"Summaries.{statement}", sql)
+        for obj_class in BaseModelObj.__subclasses__():
+            for statement, sql in obj_class.get_statements().items():
+                statements.setdefault(f"{obj_class.__name__}.{statement}", sql)
+        for path in SOURCE_FILES:
+            for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"))):
+                if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                        and node.func.attr in ("execute", "execute_prepared") and node.args
+                        and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+                    statements.setdefault(f"{path.name}:{node.lineno}", node.args[0].value)
+        # Один и тот же запрос проверяется один раз
+        unique = {}
+        for label, sql in statements.items():
+            unique.setdefault(" ".join(sql.split()), label)
+        return {label: sql for sql, label in unique.items()}
+
+    @staticmethod
+    def with_sample_params(sql: str) -> str:
+        # EXPLAIN без параметров: LIMIT получает размер страницы, остальные параметры - строку '1',
+        # которую MySQL и SQLite сравнивают с числовыми колонками по индексу
+        sql = re.sub(r"(?i)LIMIT\s+%s", "LIMIT 50", sql)
+        return sql.replace("%s", "'1'")
+
+    @staticmethod
+    def explain_mysql(cursor, sql: str) -> list[PlanStep]:
+        cursor.execute(f"EXPLAIN {sql}")
+        columns = [column[0] for column in cursor.description]
+        plan = []
+        for row in cursor.fetchall():
+            step = dict(zip(columns, row))
+            extra = step.get("Extra") or ""
+            plan.append(PlanStep(
+                table=step["table"],
+                full_scan=step["type"] in ("ALL", "index"),
+                sorts="Using filesort" in extra or "Using temporary" in extra,
+                detail=f"{step['table']}: type={step['type']}, key={step['key']}, rows={step['rows']}, {extra}",
+            ))
+        return plan
+
+    @staticmethod
+    def explain_sqlite(cursor, sql: str) -> list[PlanStep]:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        plan = []
+        for row in cursor.fetchall():
+            detail = row[-1]
+            scan = re.match(r"SCAN (\w+)", detail)
+            table = scan.group(1) if scan and scan.group(1) != "CONSTANT" else None
+            plan.append(PlanStep(table=table, full_scan=table is not None,
+                                 sorts=detail.startswith("USE TEMP B-TREE"), detail=detail))
+        return plan
@@ -0,0 +1,283 @@
+import html
+import http.client
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from my_app.model_objects import UserStatus
+
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+SELECT = re.compile(r'<select name="(\w+)"[^>]*>(.*?)</select>', re.S)
+OPTION = re.compile(r'<option value="([^"]*)"')
+NEXT_PAGE = re.compile(r'<a href="\?([^"]+)">Вперёд</a>')
+
+
+@dataclass
+class Scenario:
+    weight: int
+    status: UserStatus  # Статус пользователя на время сценария, как после входа через login_url
+    method: str  # Метод VirtualUser, выполняющий запросы сценария
+
+
+# Смесь сценариев по умолчанию. Вес - относительная частота выбора сценария на каждой итерации.
+# Заказы создаёт главный менеджер: форма создания заказа доступна только ему
+SCENARIOS = {
+    "manager_browse": Scenario(30, UserStatus.HEAD_MANAGER, "browse_all_tables"),
+    "accountant_browse": Scenario(10, UserStatus.ACCOUNTANT, "browse_tables"),
+    "purchase_browse": Scenario(10, UserStatus.PURCHASE_MANAGER, "browse_tables"),
+    "delivery_browse": Scenario(10, UserStatus.DELIVERY_MANAGER, "browse_tables"),
+    "customer_browse": Scenario(15, UserStatus.CUSTOMER, "browse_tables"),
+    "manager_create_order": Scenario(15, UserStatus.HEAD_MANAGER, "create_order"),
+    "login": Scenario(10, UserStatus.ANONYMOUS, "login"),
+}
+
+# Таблицы, которые просматривает пользователь с данным статусом (см. allowed_statuses представлений)
+STATUS_TABLES = {
+    UserStatus.HEAD_MANAGER: ["providers_url", "flowers_url", "customers_url", "contracts_url", "orders_url",
+                              "employees_url", "customers_users_url", "contract_totals_url",
+                              "customer_revenue_url", "provider_revenue_url"],
+    UserStatus.ACCOUNTANT: ["providers_url", "flowers_url", "contracts_url", "orders_url", "contract_totals_url",
+                            "customer_revenue_url", "provider_revenue_url"],
+    UserStatus.PURCHASE_MANAGER: ["flowers_url", "contracts_url", "orders_url"],
+    UserStatus.DELIVERY_MANAGER: ["flowers_url", "customers_url", "contracts_url", "orders_url"],
+    UserStatus.CUSTOMER: ["flowers_url", "contracts_url", "orders_url"],
+}
+
+
+@dataclass
+class Response:
+    status: int
+    body: str
+
+
+@dataclass
+class UrlStats:
+    latencies: list[float] = field(default_factory=list)  # Секунды, только успешные запросы
+    errors: int = 0
+
+    def merge(self, other: "UrlStats"):
+        self.latencies.extend(other.latencies)
+        self.errors += other.errors
+
+
+class VirtualUser:
+    # Один клиент нагрузочного теста: своё HTTP-соединение (keep-alive) и свои cookie.
+    # Ответы 3xx считаются успешными и не переходятся, 4xx, 5xx и ошибки соединения - ошибки
+    def __init__(self, base_url: str, rng: random.Random, options: dict):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.rng = rng
+        self.options = options
+        self.cookies = {}
+        self.csrf_token = None
+        self.connection = None
+        self.stats = defaultdict(UrlStats)
+
+    def request(self, url_name: str, method: str = "GET", params: dict | str = None,
+                data: dict = None) -> Response | None:
+        path = self.prefix + reverse(url_name)
+        if params:
+            path += "?" + (params if isinstance(params, str) else urlencode(params))
+        headers = {"Cookie": "; ".join(f"{name}={value}" for name, value in self.cookies.items())}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.options["timeout"])
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read().decode("utf-8", "replace")
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            self.stats[url_name].errors += 1
+            return None
+        latency = time.perf_counter() - started
+        self._store_cookies(response.headers.get_all("Set-Cookie") or [])
+        if response.status >= 400:
+            self.stats[url_name].errors += 1
+        else:
+            self.stats[url_name].latencies.append(latency)
+        if match := CSRF_INPUT.search(content):
+            self.csrf_token = match.group(1)
+        return Response(response.status, content)
+
+    def _store_cookies(self, headers: list[str]):
+        for header in headers:
+            for name, morsel in SimpleCookie(header).items():
+                if morsel["max-age"] == "0":  # delete_cookie()
+                    self.cookies.pop(name, None)
+                else:
+                    self.cookies[name] = morsel.value
+
+    def set_status(self, status: UserStatus):
+        if status.value is None:
+            self.cookies.pop("user_status", None)
+        else:
+            self.cookies["user_status"] = status.value
+
+    def submit(self, url_name: str, make_data) -> Response | None:
+        # Открывает форму, заполняет её make_data(варианты выпадающих списков) и отправляет
+        page = self.request(url_name)
+        if page is None or page.status != 200:
+            return page
+        choices = {name: OPTION.findall(options) for name, options in SELECT.findall(page.body)}
+        data = make_data(choices)
+        data["csrfmiddlewaretoken"] = self.csrf_token
+        return self.request(url_name, "POST", data=data)
+
+    def think(self):
+        if self.options["think_time"]:
+            time.sleep(self.rng.expovariate(1000 / self.options["think_time"]))
+
+    def browse_tables(self, status: UserStatus):
+        # Пара случайных таблиц, доступных статусу, иногда со следующей страницей
+        for url_name in self.rng.sample(STATUS_TABLES[status], k=2):
+            page = self.request(url_name)
+            self.think()
+            if page is not None and self.rng.random() < 0.3 and (match := NEXT_PAGE.search(page.body)):
+                self.request(url_name, params=html.unescape(match.group(1)))
+                self.think()
+
+    def browse_all_tables(self, status: UserStatus):
+        self.request("index_url")
+        self.think()
+        self.browse_tables(status)
+
+    def create_order(self, status: UserStatus):
+        # Заказ добавляется в сессию формой и фиксируется кнопкой Commit
+        def make_order(choices: dict) -> dict:
+            return {
+                "contract_id": self.rng.choice(choices["contract_id"]),
+                "flower_name": html.unescape(self.rng.choice(choices["flower_name"])),
+                "quantity": self.rng.randint(1, 100),
+            }
+
+        response = self.submit("create_order_url", make_order)
+        self.think()
+        if response is not None and response.status == 302:
+            self.request("commit_url", "POST", data={"csrfmiddlewaretoken": self.csrf_token,
+                                                     "curr_path": reverse("orders_url")})
+            self.think()
+
+    def login(self, status: UserStatus):
+        self.submit("login_url", lambda choices: {"login": self.options["login"],
+                                                  "password": self.options["password"]})
+        self.think()
+        self.request("index_url")
+        self.request("exit_url")
+        self.think()
+
+    def run(self, scenarios: dict[str, Scenario], deadline: float):
+        names = list(scenarios)
+        weights = [scenarios[name].weight for name in names]
+        while time.monotonic() < deadline:
+            scenario = scenarios[self.rng.choices(names, weights)[0]]
+            self.set_status(scenario.status)
+            getattr(self, scenario.method)(scenario.status)
+        if self.connection is not None:
+            self.connection.close()
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    # Ближайший ранг: значение, не меньше которого fraction всех значений
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class Command(BaseCommand):
+    help = ("Нагрузочный тест запущенного сервера (runserver, uvicorn, gunicorn): clients клиентов "
+            "в течение duration секунд выполняют сценарии, выбранные по весам. Для сервера без MySQL "
+            "в MODEL_DATABASE можно указать BACKEND sqlite")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000", help="Адрес сервера")
+        parser.add_argument("--clients", type=int, default=10, help="Одновременных клиентов")
+        parser.add_argument("--duration", type=float, default=30, help="Длительность теста, с")
+        parser.add_argument("--think-time", type=float, default=0,
+                            help="Средняя пауза клиента между действиями, мс")
+        parser.add_argument("--scenario", nargs="+", choices=list(SCENARIOS),
+                            help="Только эти сценарии, по умолчанию все")
+        parser.add_argument("--weight", nargs="+", default=[], metavar="СЦЕНАРИЙ=ВЕС",
+                            help="Другой вес сценария, например manager_create_order=50")
+        parser.add_argument("--login", default="employee0", help="Логин для сценария login")
+        parser.add_argument("--password", default="password", help="Пароль для сценария login")
+        parser.add_argument("--timeout", type=float, default=30, help="Таймаут запроса, с")
+        parser.add_argument("--seed", type=int, help="Seed случайного выбора сценариев")
+        parser.add_argument("--output", help="Файл для результатов в JSON")
+
+    def handle(self, *args, **options):
+        scenarios = {name: SCENARIOS[name] for name in options["scenario"] or SCENARIOS}
+        for item in options["weight"]:
+            name, _, weight = item.partition("=")
+            if name not in scenarios or not weight.isdigit():
+                raise CommandError(f"Неверный вес сценария: {item}")
+            scenarios[name] = Scenario(int(weight), scenarios[name].status, scenarios[name].method)
+
+        rng = random.Random(options["seed"])
+        users = [VirtualUser(options["url"], random.Random(rng.random()), options) for _ in range(options["clients"])]
+        self.stdout.write(f"{len(users)} клиентов, {options['duration']:.0f} с, {options['url']}")
+        started = time.monotonic()
+        deadline = started + options["duration"]
+        threads = [threading.Thread(target=user.run, args=(scenarios, deadline), daemon=True) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        stats = defaultdict(UrlStats)
+        for user in users:
+            for url_name, url_stats in user.stats.items():
+                stats[url_name].merge(url_stats)
+        report = self.make_report(stats, elapsed)
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+
+    @staticmethod
+    def make_report(stats: dict[str, UrlStats], elapsed: float) -> dict:
+        urls = {}
+        total = UrlStats()
+        for url_name, url_stats in sorted(stats.items()):
+            total.merge(url_stats)
+            urls[url_name] = Command.summarize(url_stats, elapsed)
+        return {"elapsed_s": round(elapsed, 3), "total": Command.summarize(total, elapsed), "urls": urls}
+
+    @staticmethod
+    def summarize(stats: UrlStats, elapsed: float) -> dict:
+        latencies = sorted(stats.latencies)
+        requests = len(latencies) + stats.errors
+        return {
+            "requests": requests,
+            "rps": round(requests / elapsed, 2),
+            "error_rate": round(stats.errors / requests, 4) if requests else 0.0,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+
+    def print_report(self, report: dict):
+        rows = {**report["urls"], "всего": report["total"]}
+        width = max(len(name) for name in rows)
+        self.stdout.write(f"{'URL':<{width}}  {'запросов':>8}  {'в с':>8}  {'ошибок':>7}  "
+                          f"{'p50, мс':>8}  {'p95, мс':>8}  {'p99, мс':>8}")
+        for name, row in rows.items():
+            self.stdout.write(f"{name:<{width}}  {row['requests']:>8}  {row['rps']:>8.1f}  "
+                              f"{row['error_rate']:>7.1%}  {row['p50_ms']:>8.1f}  "
+                              f"{row['p95_ms']:>8.1f}  {row['p99_ms']:>8.1f}")
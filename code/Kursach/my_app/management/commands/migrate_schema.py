@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from my_app import schema_migrations
+from my_app.backends import DatabaseError, error_message
+from my_app.model_objects import Connection
+
+
+class Command(BaseCommand):
+    help = ("Применяет к БД из settings.MODEL_DATABASE неприменённые миграции схемы из DATABASE_SCHEMA_DIR/migrations. "
+            "Для SQLite это происходит и само при подключении")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--list", action="store_true", help="Только показать применённые и новые миграции")
+
+    def handle(self, *args, **options):
+        backend = Connection.get_backend()
+        if not schema_migrations.MIGRATIONS_DIR.is_dir():
+            raise CommandError(f"Нет каталога миграций {schema_migrations.MIGRATIONS_DIR}, см. settings.DATABASE_SCHEMA_DIR")
+        connection = backend.connect()
+        try:
+            if options["list"]:
+                applied = schema_migrations.get_applied(connection)
+                for migration in schema_migrations.get_migrations(backend.name):
+                    mark = "x" if migration.version in applied else " "
+                    self.stdout.write(f"[{mark}] {migration.version} ({migration.path.name})")
+                return
+            pending = schema_migrations.get_pending(connection, backend.name)
+            if not pending:
+                self.stdout.write("Новых миграций нет")
+            for migration in pending:
+                try:
+                    schema_migrations.apply(connection, migration)
+                except DatabaseError as error:
+                    raise CommandError(f"{migration.path.name}: {error_message(error)}")
+                self.stdout.write(f"{migration.version}: применена")
+        finally:
+            connection.close()
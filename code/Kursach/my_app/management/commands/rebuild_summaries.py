@@ -0,0 +1,15 @@
+import time
+from django.core.management.base import BaseCommand
+from my_app.model_objects import Connection, Summaries
+
+
+class Command(BaseCommand):
+    help = ("Пересчитывает сводные таблицы отчётов по всем заказам. Нужно после изменения заказов, "
+            "цветов или договоров в обход моделей, manage.py bulk_load делает это сам")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with Connection.transaction():
+            Summaries.rebuild()
+        Connection.release()
+        self.stdout.write(f"Сводки пересчитаны за {time.monotonic() - started:.1f} с")
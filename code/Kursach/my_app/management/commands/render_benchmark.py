@@ -0,0 +1,81 @@
+import datetime
+import time
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.test import RequestFactory
+from my_app.model_objects import ContractObj, FlowerObj
+from my_app.table_renderer import TableRenderer
+
+# Строки таблицы в том виде, в котором они рендерились шаблоном до TableRenderer
+TEMPLATE_ROWS = """{% load custom_filters %}
+{% for obj in objects %}
+<tr>
+    {% for field in obj %}
+    <td>{{ field }}</td>
+    {% endfor %}
+    <td>
+        <form action="{% url table_url %}" method="post">
+            {% csrf_token %}
+            <button type="submit">Удалить</button>
+            {% for field in request_unique_fields %}
+                <input type="hidden" name="{{field}}" value="{{obj | getattr:field}}">
+            {% endfor %}
+        </form>
+    </td>
+    <td>
+        <form action="{% url edit_url %}" method="get">
+            {% csrf_token %}
+            <button type="submit">Изменить</button>
+            {% for field in request_unique_fields %}
+                <input type="hidden" name="{{field}}" value="{{obj | getattr:field}}">
+            {% endfor %}
+        </form>
+    </td>
+</tr>
+{% endfor %}"""
+
+TABLES = {
+    "flowers": (FlowerObj, "flowers_url", "edit_flower_url",
+                lambda i: FlowerObj(i, f"Цветок <{i}>", i % 100, i % 50)),
+    "contracts": (ContractObj, "contracts_url", "edit_contract_url",
+                  lambda i: ContractObj(i, i % 1000, datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 1000),
+                                        datetime.date(2021, 1, 1) + datetime.timedelta(days=i % 1000))),
+}
+
+
+class Command(BaseCommand):
+    help = "Сравнивает время рендеринга строк таблицы шаблоном и TableRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=10_000)
+        parser.add_argument("--repeat", type=int, default=5, help="Берётся лучшее время из repeat запусков")
+
+    def handle(self, *args, **options):
+        template = engines["django"].from_string(TEMPLATE_ROWS)
+        for name, (row_class, table_url, edit_url, make_row) in TABLES.items():
+            objects = [make_row(i) for i in range(1, options["rows"] + 1)]
+            request = RequestFactory().get("/")
+            request.session = {}  # Нужна контекстному процессору staged_changes
+            key_fields = [row_class.primary_field]
+            context = {
+                "objects": objects,
+                "table_url": table_url,
+                "edit_url": edit_url,
+                "request_unique_fields": key_fields,
+            }
+            template_time = self.best_time(lambda: template.render(context, request), options["repeat"])
+            renderer_time = self.best_time(
+                lambda: TableRenderer(request, table_url, edit_url, key_fields).render_rows(objects),
+                options["repeat"])
+            self.stdout.write(f"{name}: {len(objects)} строк, шаблон {template_time * 1000:.0f} мс, "
+                              f"TableRenderer {renderer_time * 1000:.0f} мс "
+                              f"(в {template_time / renderer_time:.1f} раза быстрее)")
+
+    @staticmethod
+    def best_time(function, repeat: int) -> float:
+        times = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - started)
+        return min(times)
@@ -0,0 +1,54 @@
+import dataclasses
+import datetime
+import gc
+import tracemalloc
+from django.core.management.base import BaseCommand
+from my_app.model_objects import (ProviderObj, FlowerObj, CustomerObj, ContractObj, OrderObj,
+                                  EmployeeObj, CustomerUserObj)
+
+ROW_CLASSES = [ProviderObj, FlowerObj, CustomerObj, ContractObj, OrderObj, EmployeeObj, CustomerUserObj]
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает память, которую занимают объекты строк (dataclass со __slots__), "
+            "с обычными dataclass и с кортежами курсора")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=200_000, help="Сколько строк создавать для каждого класса")
+
+    def handle(self, *args, **options):
+        count = options["rows"]
+        self.stdout.write(f"{'Класс':<16}{'кортеж':>10}{'dataclass':>12}{'slots':>10}{'экономия':>11}  (байт на строку)")
+        for row_class in ROW_CLASSES:
+            rows = self.make_rows(row_class, count)
+            plain_class = dataclasses.make_dataclass(
+                row_class.__name__, [(field.name, field.type) for field in dataclasses.fields(row_class)])
+            tuple_size = self.measure(lambda: [tuple(row) for row in rows]) / count
+            plain_size = self.measure(lambda: [plain_class(*row) for row in rows]) / count
+            slots_size = self.measure(lambda: [row_class(*row) for row in rows]) / count
+            saving = 1 - slots_size / plain_size
+            self.stdout.write(f"{row_class.__name__:<16}{tuple_size:>10.0f}{plain_size:>12.0f}"
+                              f"{slots_size:>10.0f}{saving:>10.0%}")
+
+    @staticmethod
+    def make_rows(row_class, count: int) -> list[list]:
+        # Значения создаются заранее и общие для всех вариантов, поэтому в замер попадают только сами объекты
+        values = {
+            int: range(count),
+            str: [f"value {i}" for i in range(count)],
+            datetime.date: [datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 1000) for i in range(count)],
+        }
+        columns = [values[field.type] for field in dataclasses.fields(row_class)]
+        return [list(row) for row in zip(*columns)]
+
+    @staticmethod
+    def measure(build) -> int:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            objects = build()
+            size = tracemalloc.get_traced_memory()[0]
+            del objects
+        finally:
+            tracemalloc.stop()
+        return size
@@ -0,0 +1,130 @@
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from .model_objects import Connection, ReadRouting, current_routing
+from .query_log import QueryLog, current_log, logger
+
+# Middleware работают и синхронно, и асинхронно: под ASGI Django не переводит их в потоки,
+# и запрос занимает поток только на время синхронного кода (см. async_views)
+
+
+class ConnectionPoolMiddleware:
+    # Возвращает в пул соединение, взятое запросом
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        try:
+            return self.get_response(request)
+        finally:
+            Connection.release()
+
+    async def __acall__(self, request):
+        try:
+            return await self.get_response(request)
+        finally:
+            # Синхронные представления под ASGI выполняются в потоке sync_to_async запроса,
+            # соединение берётся в нём и возвращается тоже в нём. Асинхронные представления
+            # возвращают соединения сами (async_views.run_in_db_thread)
+            await sync_to_async(Connection.release)()
+
+
+class QueryLogMiddleware:
+    # Записывает запросы к БД моделей (my_app.models) за время обработки HTTP-запроса.
+    # Итоги отдаются в заголовках X-DB-*, повторяющиеся запросы пишутся в лог как возможные N+1.
+    # Запросы потокового ответа выполняются после middleware и не учитываются
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        log = QueryLog()
+        token = current_log.set(log)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_log.reset(token)
+        return self.add_totals(request, response, log)
+
+    async def __acall__(self, request):
+        # Потоки sync_to_async получают копию контекста с тем же объектом log
+        log = QueryLog()
+        token = current_log.set(log)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_log.reset(token)
+        return self.add_totals(request, response, log)
+
+    @staticmethod
+    def add_totals(request, response, log: QueryLog):
+        response.headers["X-DB-Queries"] = str(log.count)
+        response.headers["X-DB-Time-Ms"] = f"{log.duration_ms:.1f}"
+        response.headers["X-DB-Rows"] = str(log.rows)
+        repeated = log.repeated_shapes()
+        if repeated:
+            response.headers["X-DB-Repeated"] = str(len(repeated))
+            for shape, count in repeated:
+                logger.warning("Возможный N+1 в %s %s: %d раз %s", request.method, request.path, count, shape)
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    # Отдаёт чтения запроса репликам из settings.MODEL_DATABASE["REPLICAS"]. После фиксации изменений
+    # сессия REPLICA_LAG_SECONDS секунд читает с основной БД, чтобы пользователь видел свои изменения,
+    # даже если реплика ещё их не получила. Потоковые ответы читаются уже после middleware - с основной БД
+    sync_capable = True
+    async_capable = True
+
+    session_key = "read_primary_until"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.MODEL_DATABASE.get("REPLICAS"):
+            return self.get_response(request)
+        routing = ReadRouting(use_primary=request.session.get(self.session_key, 0) > time.time())
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing.wrote:
+            self.read_primary(request)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.MODEL_DATABASE.get("REPLICAS"):
+            return await self.get_response(request)
+        # Сессия загружается из БД Django, поэтому читается и меняется в потоке
+        read_primary_until = await sync_to_async(request.session.get)(self.session_key, 0)
+        routing = ReadRouting(use_primary=read_primary_until > time.time())
+        token = current_routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing.wrote:
+            await sync_to_async(self.read_primary)(request)
+        return response
+
+    def read_primary(self, request):
+        request.session[self.session_key] = time.time() + settings.MODEL_DATABASE["REPLICA_LAG_SECONDS"]
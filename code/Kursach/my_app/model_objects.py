@@ -1,9 +1,20 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
 from dataclasses import dataclass
+from functools import lru_cache
 import datetime
 from enum import Enum
-import mysql.connector
+import itertools
+import threading
+import time
+import weakref
+from django.conf import settings
 from mysql.connector import CMySQLConnection
-from mysql.connector.connection_cext import CMySQLCursor
+from .backends import BaseBackend, DatabaseError, get_backend
+from .connection_pool import ConnectionPool, PoolExhaustedError
+from .lookup_cache import LookupCache
+from .query_log import QueryCursor
 
 
 class UserStatus(Enum):
@@ -15,80 +26,466 @@ class UserStatus(Enum):
     ANONYMOUS = None
 
 
+@dataclass
+class ReadRouting:
+    # Куда идут чтения текущего HTTP-запроса (см. middleware.ReplicaRoutingMiddleware).
+    # Объект общий для потоков запроса, поэтому запись в одном потоке видна в остальных
+    use_primary: bool = False  # Сессия недавно записывала, а реплики могут отставать
+    wrote: bool = False  # Запрос зафиксировал транзакцию
+
+
+current_routing: ContextVar[ReadRouting | None] = ContextVar("current_routing", default=None)
+
+
 class Connection:
-    connection: CMySQLConnection = None
+    # Каждый запрос (поток) получает своё соединение из пула при первом обращении к БД
+    # и возвращает его в конце запроса (см. middleware.ConnectionPoolMiddleware).
+    # Чтения вне транзакций в HTTP-запросах идут на реплику из settings.MODEL_DATABASE["REPLICAS"],
+    # если они настроены: запрос берёт соединение из пула одной реплики, следующий запрос - другой
+    backend: BaseBackend = None
+    pool: ConnectionPool = None
+    replica_pools: list[ConnectionPool] = None
+    _replica_counter = itertools.count()
+    _replica_down_until: dict[int, float] = {}  # Номер реплики -> до какого времени к ней не подключаться
+    _pool_lock = threading.Lock()
+    _local = threading.local()
+    _prepared = weakref.WeakKeyDictionary()  # соединение -> (connection_id, {SQL: prepared-курсор})
+    prepared_per_connection = 256  # Больше курсоров на соединение не хранится (max_prepared_stmt_count сервера)
+    _prepared_lock = threading.Lock()
+
+    @classmethod
+    def get_backend(cls) -> BaseBackend:
+        with cls._pool_lock:
+            if cls.backend is None:
+                cls.backend = get_backend(settings.MODEL_DATABASE)
+            return cls.backend
+
+    @classmethod
+    def get_pool(cls) -> ConnectionPool:
+        backend = cls.get_backend()
+        with cls._pool_lock:
+            if cls.pool is None:
+                cls.pool = cls._make_pool(backend)
+            return cls.pool
+
+    @classmethod
+    def get_replica_pools(cls) -> list[ConnectionPool]:
+        with cls._pool_lock:
+            if cls.replica_pools is None:
+                config = settings.MODEL_DATABASE
+                cls.replica_pools = [cls._make_pool(get_backend({**config, **replica, "REPLICAS": []}))
+                                     for replica in config.get("REPLICAS", [])]
+            return cls.replica_pools
+
+    @staticmethod
+    def _make_pool(backend: BaseBackend) -> ConnectionPool:
+        config = settings.MODEL_DATABASE
+        return ConnectionPool(
+            connect=backend.connect,
+            size=config["POOL_SIZE"],
+            timeout=config["POOL_TIMEOUT"],
+            ping_interval=config["PING_INTERVAL"],
+            reconnect_attempts=config["RECONNECT_ATTEMPTS"],
+        )
+
+    @classmethod
+    def get_connection(cls) -> CMySQLConnection:
+        if getattr(cls._local, "connection", None) is None:
+            cls._local.connection = cls.get_pool().checkout()
+            cls._local.cursor = None
+        return cls._local.connection
+
+    @classmethod
+    def get_read_connection(cls) -> CMySQLConnection:
+        # Соединение для чтения: реплика, если чтение можно отдать реплике, иначе основное соединение запроса
+        if not cls._can_read_replica():
+            return cls.get_connection()
+        if getattr(cls._local, "read_connection", None) is None:
+            replica = cls._checkout_replica()
+            if replica is None:
+                return cls.get_connection()
+            cls._local.read_pool, cls._local.read_connection = replica
+        return cls._local.read_connection
+
+    @classmethod
+    def checkout_read(cls) -> tuple[ConnectionPool, CMySQLConnection]:
+        # Отдельное соединение для чтения и пул, в который его вернуть, например для потокового чтения
+        replica = cls._checkout_replica() if cls._can_read_replica() else None
+        if replica is not None:
+            return replica
+        pool = cls.get_pool()
+        return pool, pool.checkout()
+
+    @classmethod
+    def _checkout_replica(cls) -> tuple[ConnectionPool, CMySQLConnection] | None:
+        # Реплики перебираются по кругу. Недоступная реплика пропускается PING_INTERVAL секунд,
+        # а если недоступны все, читается основная БД
+        pools = cls.get_replica_pools()
+        start = next(cls._replica_counter)
+        for i in range(len(pools)):
+            index = (start + i) % len(pools)
+            if cls._replica_down_until.get(index, 0) > time.monotonic():
+                continue
+            try:
+                return pools[index], pools[index].checkout()
+            except PoolExhaustedError:
+                continue
+            except DatabaseError:
+                cls._replica_down_until[index] = time.monotonic() + settings.MODEL_DATABASE["PING_INTERVAL"]
+        return None
+
+    @classmethod
+    def _can_read_replica(cls) -> bool:
+        # Реплике отдаются только чтения HTTP-запросов вне транзакций: чтение внутри транзакции должно
+        # видеть её же изменения, а команды manage.py читают то, что только что записали
+        routing = current_routing.get()
+        if routing is None or routing.use_primary or not settings.MODEL_DATABASE.get("REPLICAS"):
+            return False
+        connection = getattr(cls._local, "connection", None)
+        return not getattr(cls._local, "in_transaction", False) and not (connection and connection.in_transaction)
+
+    @classmethod
+    def get_cursor(cls) -> QueryCursor:
+        connection = cls.get_connection()
+        if cls._local.cursor is None:
+            cls._local.cursor = QueryCursor(connection.cursor())
+        return cls._local.cursor
+
+    @classmethod
+    def execute_prepared(cls, sql: str, params: tuple = ()) -> QueryCursor:
+        # Запрос выполняется как серверный prepared statement. Сервер разбирает его один раз
+        # на соединение, а курсор с ним переиспользуется следующими запросами с тем же SQL.
+        # Результат нужно дочитывать до конца, иначе соединение будет занято
+        return cls._execute_prepared_on(cls.get_connection(), sql, params)
+
+    @classmethod
+    def execute_read(cls, sql: str, params: tuple = ()) -> QueryCursor:
+        # Как execute_prepared, но на соединении для чтения (get_read_connection)
+        return cls._execute_prepared_on(cls.get_read_connection(), sql, params)
 
     @classmethod
-    def get_cursor(cls) -> CMySQLCursor:
-        if cls.connection is None:
-            cls.connection = mysql.connector.connect(
-                user="root",
-                password="aboba",
-                host="database",
-                port="3306",
-                database="kursach"
-            )
-        return cls.connection.cursor()
+    def _execute_prepared_on(cls, connection: CMySQLConnection, sql: str, params: tuple) -> QueryCursor:
+        with cls._prepared_lock:
+            connection_id, cursors = cls._prepared.get(connection, (None, None))
+            if connection_id != connection.connection_id:  # Новое соединение или переподключение
+                cursors = OrderedDict()
+                cls._prepared[connection] = (connection.connection_id, cursors)
+        cursor = cursors.get(sql)
+        if cursor is None:
+            cursor = cursors[sql] = QueryCursor(connection.cursor(prepared=True))
+            if len(cursors) > cls.prepared_per_connection:
+                # Запросы со списками IN разной длины дают много разных SQL. Давно не использованный
+                # курсор закрывается, и сервер освобождает его prepared statement
+                cursors.popitem(last=False)[1].close()
+        else:
+            cursors.move_to_end(sql)
+        cursor.execute(sql, params)
+        return cursor
+
+    @classmethod
+    @contextmanager
+    def transaction(cls):
+        connection = cls.get_connection()
+        cls._local.in_transaction = True
+        try:
+            yield connection
+        except BaseException:
+            connection.rollback()
+            cls._local.on_commit = []
+            cls._local.changed_tables = set()
+            raise
+        finally:
+            cls._local.in_transaction = False
+        connection.commit()
+        tables, cls._local.changed_tables = cls._get_changed_tables(), set()
+        cls._bump_lookups(tables)
+        routing = current_routing.get()
+        if routing is not None:  # Следующие чтения запроса и сессии - с основной БД
+            routing.use_primary = routing.wrote = True
+        callbacks, cls._local.on_commit = cls._get_on_commit(), []
+        for callback in callbacks:
+            callback()
+
+    @classmethod
+    def on_commit(cls, callback):
+        # callback выполнится после фиксации текущей транзакции в transaction()
+        cls._get_on_commit().append(callback)
+
+    @classmethod
+    def table_changed(cls, *tables: str):
+        # Версии таблиц в БД (для ETag) меняют триггеры (database/migrations/0006_version_shards.sql).
+        # Версии справочников меняются после фиксации транзакции в transaction(), один раз на таблицу.
+        # Изменения в обход transaction() справочники замечают при сверке с версией в БД (LookupCache)
+        cls._get_changed_tables().update(tables)
+
+    @staticmethod
+    def _bump_lookups(tables: set[str]):
+        # Только после фиксации, иначе другой процесс успел бы закэшировать
+        # незафиксированные данные под новой версией
+        for table in sorted(tables):
+            LookupCache.bump(table)
+
+    @classmethod
+    def _get_on_commit(cls) -> list:
+        if not hasattr(cls._local, "on_commit"):
+            cls._local.on_commit = []
+        return cls._local.on_commit
+
+    @classmethod
+    def _get_changed_tables(cls) -> set[str]:
+        if not hasattr(cls._local, "changed_tables"):
+            cls._local.changed_tables = set()
+        return cls._local.changed_tables
+
+    @classmethod
+    def release(cls):
+        cls._local.on_commit = []  # Транзакция не была зафиксирована через transaction() и откатывается пулом
+        cls._local.changed_tables = set()
+        read_connection = getattr(cls._local, "read_connection", None)
+        if read_connection is not None:
+            cls._local.read_connection = None
+            cls._local.read_pool.release(read_connection)
+        connection = getattr(cls._local, "connection", None)
+        if connection is None:
+            return
+        cls._local.connection = None
+        cls._local.cursor = None
+        cls.get_pool().release(connection)
+
+    @classmethod
+    def reset(cls):
+        # Закрывает пул, следующее обращение к БД подключится заново по settings.MODEL_DATABASE.
+        # Нужно командам, которые подменяют БД, например manage.py benchmark
+        cls.release()
+        with cls._pool_lock:
+            for pool in [cls.pool, *(cls.replica_pools or [])]:
+                if pool is not None:
+                    pool.close()
+            cls.pool = None
+            cls.replica_pools = None
+            cls._replica_down_until.clear()
+            cls.backend = None
+        LookupCache.forget_db_versions()
+
+
+def pad_in_list(values: list) -> list:
+    # Значения для IN (...), дополненные повтором последнего до степени двойки: от числа значений
+    # зависит текст запроса, а с ним и число prepared statements на соединение
+    size = 1 << (len(values) - 1).bit_length()
+    return [*values, *values[-1:] * (size - len(values))]
+
+
+class Summaries:
+    # Сводные таблицы отчётов (database/migrations/0003_report_summaries.sql) меняются на разницу:
+    # перед изменением или удалением заказов их вклад вычитается, после изменения или создания -
+    # прибавляется. Заказы выбираются по индексу колонки из conditions, поэтому стоимость
+    # не зависит от размера всей истории заказов. Строки сводок, в которых не осталось заказов, удаляются
+    tables = {
+        # таблица -> (колонки ключа, выражения ключа по строкам заказов)
+        "contract_total": (["contract_id"], ["booking.contract_id"]),
+        "customer_month_revenue": (["customer_id", "month"], ["contract.customer_id", "register_month"]),
+        "provider_month_revenue": (["provider_id", "month"], ["flower.provider_id", "register_month"]),
+    }
+    # Условие -> колонка, по кодам в которой выбираются заказы
+    conditions = {
+        "booking": "booking.booking_id",
+        "flower": "booking.flower_id",
+        "contract": "booking.contract_id",
+        "provider": "flower.provider_id",
+        "customer": "contract.customer_id",
+    }
+    value_columns = ["booking_count", "quantity", "amount"]
+    batch_size = 512  # Кодов в одном запросе
+
+    @classmethod
+    def add(cls, condition: str, ids: list):
+        cls._apply(condition, 1, ids)
+
+    @classmethod
+    def subtract(cls, condition: str, ids: list):
+        # Вызывается до изменения заказов, пока их строки ещё в БД
+        cls._apply(condition, -1, ids)
+
+    @classmethod
+    def rebuild(cls):
+        # Полный пересчёт, например после manage.py bulk_load, который пишет в таблицы в обход моделей
+        for table in cls.tables:
+            Connection.execute_prepared(f"DELETE FROM {table}")
+        for sql in cls._compile_delta_statements(None, 1, 0, Connection.get_backend().name):
+            Connection.execute_prepared(sql)
+        Connection.table_changed(*cls.tables)
+
+    @classmethod
+    def _apply(cls, condition: str, sign: int, ids: list):
+        if not ids:
+            return
+        backend_name = Connection.get_backend().name
+        for start in range(0, len(ids), cls.batch_size):
+            batch = pad_in_list(list(ids[start:start + cls.batch_size]))
+            for sql in cls._compile_delta_statements(condition, sign, len(batch), backend_name):
+                Connection.execute_prepared(sql, batch)
+        Connection.table_changed(*cls.tables)
+
+    @classmethod
+    def get_statements(cls) -> dict[str, str]:
+        # Запросы изменения сводок, для manage.py check_query_plans. Полный пересчёт
+        # читает все заказы намеренно и не проверяется
+        backend_name = Connection.get_backend().name
+        statements = {}
+        for condition in cls.conditions:
+            for sign in (1, -1):
+                for i, sql in enumerate(cls._compile_delta_statements(condition, sign, 1, backend_name)):
+                    statements[f"{condition}{sign:+d}.{i}"] = sql
+        return statements
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def _compile_delta_statements(cls, condition: str | None, sign: int, size: int, backend_name: str) -> list[str]:
+        # condition None - все заказы
+        backend = Connection.get_backend()
+        register_month = backend.month_start("contract.register_date")
+        statements = []
+        for table, (key_columns, key_expressions) in cls.tables.items():
+            keys = ", ".join(key_expressions).replace("register_month", register_month)
+            where = "1 = 1" if condition is None else f"{cls.conditions[condition]} IN ({', '.join(['%s'] * size)})"
+            # Колонки ключа входят в первичный ключ сводки и не могут быть NULL, а у заказов
+            # и договоров внешние ключи необязательны. Такие заказы в сводки не попадают
+            for expression in key_expressions:
+                where += f" AND {expression.replace('register_month', 'contract.register_date')} IS NOT NULL"
+            source = f"""
+                FROM booking
+                JOIN flower ON flower.flower_id = booking.flower_id
+                JOIN contract ON contract.contract_id = booking.contract_id
+                WHERE {where}
+            """
+            statements.append(f"""
+                INSERT INTO {table}({", ".join(key_columns)}, {", ".join(cls.value_columns)})
+                SELECT {keys}, {sign} * COUNT(*), {sign} * COALESCE(SUM(booking.quantity), 0),
+                    {sign} * COALESCE(SUM(booking.quantity * flower.price), 0)
+                {source}
+                GROUP BY {keys}
+                {backend.add_on_duplicate(table, key_columns, cls.value_columns)}
+            """)
+            if sign < 0:
+                statements.append(f"""
+                    DELETE FROM {table}
+                    WHERE booking_count = 0 AND ({", ".join(key_columns)}) IN (SELECT {keys} {source})
+                """)
+        return statements
+
+
+class StaleRowError(Exception):
+    # Строку изменили или удалили после того, как её прочитали для формы редактирования
+    def __init__(self, table: str, key: tuple):
+        super().__init__(f"строку {table} с ключом {', '.join(map(str, key))} уже изменили или удалили")
+
+
+def same_value(old, new) -> bool:
+    # Значения из сессии (UnitOfWork) приходят из JSON: даты и коды из выпадающих списков - строками,
+    # поэтому значения сравниваются в строковом виде
+    if old is None or new is None:
+        return old is new
+    return str(old) == str(new)
 
 
 class BaseModelObj:
+    # Строки таблиц - dataclass(slots=True): у объекта нет __dict__, что заметно при чтении больших таблиц.
+    # slots=True пересоздаёт класс, поэтому в наследниках нельзя вызывать super() без аргументов.
+    # update() сравнивает новые значения с полями объекта и пишет только изменённые колонки,
+    # проверяя в WHERE, что строка в БД всё ещё совпадает с объектом (оптимистическая блокировка)
+    __slots__ = ()
     primary_field: str  # Определить, если одна таблица с одним главным ключом
     table_name: str  # Определить, если одна таблица
-    mysql = Connection.get_cursor()
+    cascade_tables: list[str] = []  # Таблицы, строки которых удаляются каскадно вместе со строкой этой таблицы
+    statements: dict[str, str] = {}  # Собираются один раз при создании класса
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "table_name" in cls.__dict__:
+            cls.statements = {
+                "remove": f"DELETE FROM {cls.table_name} WHERE {cls.primary_field} = %s",
+            }
 
     def update(self, *new_params):
         # Метод для объектов с одной таблицей с одним главным ключом.
         # Если это не так, то переопределить
-        set_fields = ",".join([f"{field} = %s" for field in self.get_manual_fields()])
-        query = f"""
-            UPDATE {self.table_name}
-            SET {set_fields}
-            WHERE {self.primary_field} = %s
+        self._write_changes(self.get_changes(*new_params))
+
+    def get_changes(self, *new_params) -> dict:
+        # Поля из get_manual_fields(), новые значения которых отличаются от значений объекта
+        return {field: value for field, value in zip(self.get_manual_fields(), new_params)
+                if not same_value(getattr(self, field), value)}
+
+    def _write_changes(self, changes: dict):
+        if not changes:  # Форму сохранили без изменений
+            return
+        checked = [field for field in self.get_manual_fields() if field != self.primary_field]
+        self._update_row(self.table_name, changes, {self.primary_field: getattr(self, self.primary_field)}, checked)
+
+    def _update_row(self, table: str, changes: dict, key: dict, checked: list[str]):
+        # UPDATE колонок changes строки key, если её поля checked равны полям объекта.
+        # rowcount - число строк, найденных по WHERE (в MySQL с флагом FOUND_ROWS, см. backends),
+        # поэтому 0 значит, что строку изменили или удалили
+        sql = self._compile_update_statement(table, tuple(changes), tuple(key), tuple(checked),
+                                             Connection.get_backend().name)
+        params = (*changes.values(), *key.values(), *[getattr(self, field) for field in checked])
+        if Connection.execute_prepared(sql, params).rowcount == 0:
+            raise StaleRowError(table, tuple(key.values()))
+        Connection.table_changed(table)
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _compile_update_statement(table: str, fields: tuple, key_fields: tuple, checked: tuple,
+                                  backend_name: str) -> str:
+        # Колонки могут быть NULL, поэтому старые значения сравниваются с учётом NULL
+        backend = Connection.get_backend()
+        conditions = [f"{field} = %s" for field in key_fields] + [backend.null_safe_equal(field) for field in checked]
+        return f"""
+            UPDATE {table}
+            SET {", ".join(f"{field} = %s" for field in fields)}
+            WHERE {" AND ".join(conditions)}
         """
-        primary_value = getattr(self, self.primary_field)
-        self.mysql.execute(query, (*new_params, primary_value))
+
+    @classmethod
+    def get_statements(cls) -> dict[str, str]:
+        # Запросы объекта для manage.py check_query_plans, UPDATE - с изменением всех полей
+        statements = dict(cls.statements)
+        if "table_name" in cls.__dict__:
+            fields = tuple(cls.get_manual_fields())
+            checked = tuple(field for field in fields if field != cls.primary_field)
+            statements["update"] = cls._compile_update_statement(cls.table_name, fields, (cls.primary_field,), checked,
+                                                                 Connection.get_backend().name)
+        return statements
 
     def remove(self):
         # Метод для объектов с одной таблицей с одним главным ключом.
         # Если это не так, то переопределить
-        query = f"""
-            DELETE FROM {self.table_name}
-            WHERE {self.primary_field} = %s
-        """
         primary_value = getattr(self, self.primary_field)
-        self.mysql.execute(query, primary_value)
+        Connection.execute_prepared(self.statements["remove"], (primary_value,))
+        Connection.table_changed(self.table_name, *self.cascade_tables)
 
     def __iter__(self):
-        pass
+        # Значения полей в порядке объявления, как колонки в SELECT
+        return (getattr(self, name) for name in self.__slots__)
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         pass
 
 
-@dataclass
+@dataclass(slots=True)
 class ProviderObj(BaseModelObj):
     provider_id: int
     name: str
     address: str
 
     def update(self, name: str, address: str):
-        self.__update_name(name)
-        self.__update_address(address)
-
-    def __update_name(self, name: str):
-        self.mysql.execute("""
-            UPDATE provider_name
-            SET name = %s
-            WHERE provider_id = %s
-        """, (name, self.provider_id))
-
-    def __update_address(self, address: str):
-        self.mysql.execute("""
-            UPDATE provider_address
-            SET address = %s
-            WHERE provider_id = %s AND address = %s
-        """, (address, self.provider_id, self.address))
+        # Запрос только к таблицам, в которых что-то изменилось
+        changes = self.get_changes(name, address)
+        if "name" in changes:
+            self._update_row("provider_name", {"name": name}, {"provider_id": self.provider_id}, ["name"])
+        if "address" in changes:
+            self._update_row("provider_address", {"address": address}, {"provider_id": self.provider_id}, ["address"])
 
     def remove(self):
         if self.__count_address() == 1:
@@ -97,42 +494,50 @@ class ProviderObj(BaseModelObj):
             self.__remove_address()
 
     def __count_address(self) -> int:
-        self.mysql.execute("""
-            SELECT COUNT(*) 
-            FROM provider_address 
+        cursor = Connection.execute_prepared("""
+            SELECT COUNT(*)
+            FROM provider_address
             WHERE provider_id = %s
         """, (self.provider_id,))
-        count = self.mysql.fetchone()[0]
+        count = cursor.fetchall()[0][0]
         return count
 
     def __remove_name(self):
-        self.mysql.execute("""
+        Summaries.subtract("provider", [self.provider_id])
+        Connection.execute_prepared("""
             DELETE FROM provider_name
             WHERE provider_id = %s
         """, (self.provider_id,))
+        # Адреса и цветы поставщика, а с цветами и их заказы, удаляются каскадно
+        Connection.table_changed("provider_name", "provider_address", "flower", "booking")
 
     def __remove_address(self):
-        self.mysql.execute("""
+        Connection.execute_prepared("""
             DELETE FROM provider_address
             WHERE provider_id = %s AND address = %s
         """, (self.provider_id, self.address))
+        Connection.table_changed("provider_address")
+
+    @classmethod
+    def get_statements(cls) -> dict[str, str]:
+        backend_name = Connection.get_backend().name
+        return {
+            "update_name": cls._compile_update_statement("provider_name", ("name",), ("provider_id",), ("name",),
+                                                         backend_name),
+            "update_address": cls._compile_update_statement("provider_address", ("address",), ("provider_id",),
+                                                            ("address",), backend_name),
+        }
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["name", "address"]
 
-    def __iter__(self):
-        return iter([
-            self.provider_id,
-            self.name,
-            self.address
-        ])
-
 
-@dataclass
+@dataclass(slots=True)
 class FlowerObj(BaseModelObj):
     primary_field = "flower_id"
     table_name = "flower"
+    cascade_tables = ["booking"]
 
     flower_id: int
     name: str
@@ -140,22 +545,25 @@ class FlowerObj(BaseModelObj):
     provider_id: int
 
     def update(self, name: str, price: int, provider_id: int):
-        super().update(name, price, provider_id)
+        # Цена и поставщик входят в суммы заказов цветка в сводках, название - нет
+        changes = self.get_changes(name, price, provider_id)
+        affects_summaries = "price" in changes or "provider_id" in changes
+        if affects_summaries:
+            Summaries.subtract("flower", [self.flower_id])
+        self._write_changes(changes)
+        if affects_summaries:
+            Summaries.add("flower", [self.flower_id])
 
-    def __iter__(self):
-        return iter([
-            self.flower_id,
-            self.name,
-            self.price,
-            self.provider_id
-        ])
+    def remove(self):
+        Summaries.subtract("flower", [self.flower_id])
+        BaseModelObj.remove(self)
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["name", "price", "provider_id"]
 
 
-@dataclass
+@dataclass(slots=True)
 class CustomerObj(BaseModelObj):
     customer_id: int
     name: str
@@ -163,22 +571,13 @@ class CustomerObj(BaseModelObj):
     address: str
 
     def update(self, name, phone, address):
-        self.__update_name(name)
-        self.__update_info(phone, address)
-
-    def __update_name(self, name: str):
-        self.mysql.execute("""
-            UPDATE customer_name
-            SET name = %s
-            WHERE customer_id = %s
-        """, (name, self.customer_id))
-
-    def __update_info(self, phone: str, address: str):
-        self.mysql.execute("""
-            UPDATE customer_info
-            SET phone = %s AND address = %s
-            WHERE customer_id = %s AND phone = %s
-        """, (phone, address, self.customer_id, self.phone))
+        # Запрос только к таблицам, в которых что-то изменилось
+        changes = self.get_changes(name, phone, address)
+        if "name" in changes:
+            self._update_row("customer_name", {"name": name}, {"customer_id": self.customer_id}, ["name"])
+        info = {field: changes[field] for field in ("phone", "address") if field in changes}
+        if info:
+            self._update_row("customer_info", info, {"customer_id": self.customer_id}, ["phone", "address"])
 
     def remove(self):
         if self.__count_info() == 1:
@@ -187,42 +586,49 @@ class CustomerObj(BaseModelObj):
             self.__remove_info()
 
     def __count_info(self) -> int:
-        self.mysql.execute("""
+        cursor = Connection.execute_prepared("""
             SELECT COUNT(*)
             FROM customer_info
             WHERE customer_id = %s
         """, (self.customer_id,))
-        return self.mysql.fetchone()[0]
+        return cursor.fetchall()[0][0]
 
     def __remove_name(self):
-        self.mysql.execute("""
+        Summaries.subtract("customer", [self.customer_id])
+        Connection.execute_prepared("""
             DELETE FROM customer_name
             WHERE customer_id = %s
         """, (self.customer_id,))
+        # Информация и договоры заказчика, а с договорами и их заказы, удаляются каскадно
+        Connection.table_changed("customer_name", "customer_info", "contract", "booking")
 
     def __remove_info(self):
-        self.mysql.execute("""
+        Connection.execute_prepared("""
             DELETE FROM customer_info
             WHERE customer_id = %s AND phone = %s
         """, (self.customer_id, self.phone))
+        Connection.table_changed("customer_info")
 
-    def __iter__(self):
-        return iter([
-            self.customer_id,
-            self.name,
-            self.phone,
-            self.address
-        ])
+    @classmethod
+    def get_statements(cls) -> dict[str, str]:
+        backend_name = Connection.get_backend().name
+        return {
+            "update_name": cls._compile_update_statement("customer_name", ("name",), ("customer_id",), ("name",),
+                                                         backend_name),
+            "update_info": cls._compile_update_statement("customer_info", ("phone", "address"), ("customer_id",),
+                                                         ("phone", "address"), backend_name),
+        }
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["name", "phone", "address"]
 
 
-@dataclass
+@dataclass(slots=True)
 class ContractObj(BaseModelObj):
     primary_field = "contract_id"
     table_name = "contract"
+    cascade_tables = ["booking"]
 
     contract_id: int
     customer_id: int
@@ -230,22 +636,25 @@ class ContractObj(BaseModelObj):
     execution_date: datetime.date
 
     def update(self, customer_id: int, register_date: datetime.date, execution_date: datetime.date):
-        super().update(customer_id, register_date, execution_date)
+        # Заказчик и месяц регистрации - ключи сводок по месяцам, дата исполнения в сводки не входит
+        changes = self.get_changes(customer_id, register_date, execution_date)
+        affects_summaries = "customer_id" in changes or "register_date" in changes
+        if affects_summaries:
+            Summaries.subtract("contract", [self.contract_id])
+        self._write_changes(changes)
+        if affects_summaries:
+            Summaries.add("contract", [self.contract_id])
 
-    def __iter__(self):
-        return iter([
-            self.contract_id,
-            self.customer_id,
-            self.register_date,
-            self.execution_date
-        ])
+    def remove(self):
+        Summaries.subtract("contract", [self.contract_id])
+        BaseModelObj.remove(self)
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["customer_id", "register_date", "execution_date"]
 
 
-@dataclass
+@dataclass(slots=True)
 class OrderObj(BaseModelObj):
     primary_field = "booking_id"
     table_name = "booking"
@@ -256,22 +665,23 @@ class OrderObj(BaseModelObj):
     quantity: int
 
     def update(self, contract_id: int, flower_id: int, quantity: int):
-        super().update(contract_id, flower_id, quantity)
+        changes = self.get_changes(contract_id, flower_id, quantity)
+        if not changes:
+            return
+        Summaries.subtract("booking", [self.booking_id])
+        self._write_changes(changes)
+        Summaries.add("booking", [self.booking_id])
 
-    def __iter__(self):
-        return iter([
-            self.booking_id,
-            self.contract_id,
-            self.flower_id,
-            self.quantity
-        ])
+    def remove(self):
+        Summaries.subtract("booking", [self.booking_id])
+        BaseModelObj.remove(self)
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["contract_id", "flower_id", "quantity"]
 
 
-@dataclass
+@dataclass(slots=True)
 class EmployeeObj(BaseModelObj):
     primary_field = "login"
     table_name = "employee"
@@ -281,21 +691,14 @@ class EmployeeObj(BaseModelObj):
     job_title: str
 
     def update(self, login: str, password: str, job_title: str):
-        super().update(login, password, job_title)
-
-    def __iter__(self):
-        return iter([
-            self.login,
-            self.password,
-            self.job_title,
-        ])
+        BaseModelObj.update(self, login, password, job_title)
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["login", "password", "job_title"]
 
 
-@dataclass
+@dataclass(slots=True)
 class CustomerUserObj(BaseModelObj):
     primary_field = "login"
     table_name = "customer_user"
@@ -305,15 +708,64 @@ class CustomerUserObj(BaseModelObj):
     customer_id: int
 
     def update(self, login: str, password: str, customer_id: int):
-        super().update(login, password, customer_id)
-
-    def __iter__(self):
-        return iter([
-            self.login,
-            self.password,
-            self.customer_id,
-        ])
+        BaseModelObj.update(self, login, password, customer_id)
 
     @staticmethod
     def get_manual_fields() -> list[str]:
         return ["login", "password", "customer_id"]
+
+
+# Строки моделей чтения: строка таблицы вместе с названиями из связанных таблиц.
+# Изменяются через объекты строк самих таблиц (OrderObj, ContractObj)
+
+@dataclass(slots=True)
+class OrderDetailsObj(BaseModelObj):
+    booking_id: int
+    contract_id: int
+    customer_name: str
+    flower_name: str
+    provider_name: str
+    price: int
+    quantity: int
+    total: int  # quantity * price
+
+
+@dataclass(slots=True)
+class ContractDetailsObj(BaseModelObj):
+    contract_id: int
+    customer_id: int
+    customer_name: str
+    register_date: datetime.date
+    execution_date: datetime.date
+    booking_count: int
+    amount: int
+
+
+# Строки отчётов только читаются: сводные таблицы меняет Summaries вместе с заказами
+
+@dataclass(slots=True)
+class ContractTotalObj(BaseModelObj):
+    contract_id: int
+    booking_count: int
+    quantity: int
+    amount: int
+
+
+@dataclass(slots=True)
+class CustomerRevenueObj(BaseModelObj):
+    customer_id: int
+    name: str
+    month: datetime.date
+    booking_count: int
+    quantity: int
+    amount: int
+
+
+@dataclass(slots=True)
+class ProviderRevenueObj(BaseModelObj):
+    provider_id: int
+    name: str
+    month: datetime.date
+    booking_count: int
+    quantity: int
+    amount: int
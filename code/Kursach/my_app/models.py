@@ -1,120 +1,522 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from .backends import DatabaseError, error_message
 from .model_objects import *
 
 
+@dataclass
+class Page:
+    objects: list[BaseModelObj]
+    has_next: bool
+    has_prev: bool
+
+
+@dataclass
+class TableQuery:
+    # Фильтры и сортировка таблицы. Значения фильтров уже приведены к типу колонки
+    filters: list[tuple[str, str, object]] = field(default_factory=list)  # (поле, "=" | ">=" | "<=" | "prefix", значение)
+    sort: str | None = None  # Поле из filter_columns, "-поле" - по убыванию
+
+    def __bool__(self) -> bool:
+        return bool(self.filters or self.sort)
+
+    def get_shape(self) -> tuple:
+        # Всё, от чего зависит текст запроса, без значений
+        return self.sort, tuple((name, op) for name, op, value in self.filters)
+
+
+@dataclass
+class BulkResult:
+    ids: list = field(default_factory=list)  # Коды созданных строк в порядке входных строк, None для строк с ошибкой
+    errors: list[tuple[int, str]] = field(default_factory=list)  # (номер входной строки, текст ошибки)
+
+
 class BaseDBModel:
-    mysql: CMySQLCursor
+    model_obj: type[BaseModelObj]
+    select_query: str  # SELECT ... FROM ... без WHERE, ORDER BY и LIMIT
+    key_columns: list[str]  # Колонки первичного ключа в том же порядке, что и get_primary_fields()
+    tables: list[str]  # Таблицы из select_query, по их версиям строится ETag страницы
+    statements: dict[str, str] = {}  # Запросы модели, собираются один раз при создании класса
+    # Поля, по которым можно фильтровать и сортировать таблицу: поле -> (колонка, тип).
+    # "int" и "date" - равенство и диапазон, "prefix" - начало строки. Колонки должны быть
+    # проиндексированы (database/migrations), в запрос попадают только колонки из этого списка
+    filter_columns: dict[str, tuple[str, str]] = {}
+    # Поля filter_columns, по которым можно сортировать, None - все. Сортировка по колонке другой таблицы,
+    # чем колонки ключа, не идёт по индексу: БД пришлось бы соединить и отсортировать все строки
+    sort_fields: list[str] | None = None
+    not_null_fields: list[str] = []  # Поля сортировки с колонкой NOT NULL, для них страница читается одним запросом
+    bulk_batch_size = 1000
+    in_batch_size = 512  # Ключей в одном запросе remove_many() и update_many()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if "select_query" in cls.__dict__:
+            cls.statements = {**cls.statements, **cls._compile_read_statements()}
+
+    @classmethod
+    def _compile_read_statements(cls) -> dict[str, str]:
+        order = ", ".join(cls.key_columns)
+        order_desc = ", ".join(f"{column} DESC" for column in cls.key_columns)
+        key_equals = " AND ".join(f"{column} = %s" for column in cls.key_columns)
+        return {
+            "all": cls.select_query,
+            "get": f"{cls.select_query} WHERE {key_equals}",
+            "page_first": f"{cls.select_query} ORDER BY {order} LIMIT %s",
+            "page_after": f"{cls.select_query} WHERE {cls._keyset_condition('>')} ORDER BY {order} LIMIT %s",
+            "page_before": f"{cls.select_query} WHERE {cls._keyset_condition('<')} ORDER BY {order_desc} LIMIT %s",
+            "versions": f"SELECT table_name, version, updated_at FROM table_version "
+                        f"WHERE table_name IN ({', '.join(repr(table) for table in cls.tables)})",
+        }
+
+    @classmethod
+    def _keyset_condition(cls, op: str, columns: list[str] = None) -> str:
+        # (a, b) > (x, y) раскрывается в a > x OR (a = x AND b > y),
+        # чтобы MySQL мог использовать range-доступ по индексу первичного ключа
+        columns = columns or cls.key_columns
+        disjuncts = []
+        for i, column in enumerate(columns):
+            equals = [f"{prev} = %s" for prev in columns[:i]]
+            disjuncts.append("(" + " AND ".join([*equals, f"{column} {op} %s"]) + ")")
+        return " OR ".join(disjuncts)
+
+    @classmethod
+    @lru_cache(maxsize=512)
+    def _compile_query_statement(cls, direction: str, shape: tuple, segment: str, backend_name: str) -> str:
+        # Запрос страницы ("first", "after", "before") или всей таблицы ("all") с фильтрами и сортировкой.
+        # Ключ страницы при сортировке - (значение поля сортировки, первичный ключ...).
+        # segment - какие строки относительно ключа читает запрос (см. _get_segments)
+        sort, filters = shape
+        backend = Connection.get_backend()
+        conditions = []
+        for name, op in filters:
+            column = cls.filter_columns[name][0]
+            conditions.append(backend.prefix_match(column) if op == "prefix" else f"{column} {op} %s")
+        columns = list(cls.key_columns)
+        descending = False
+        if sort is not None:
+            descending = sort.startswith("-")
+            if cls._get_sort_column(sort) is not None:
+                columns.insert(0, cls._get_sort_column(sort))
+        if direction == "before":
+            descending = not descending
+        if direction in ("after", "before"):
+            op = "<" if descending else ">"
+            conditions.append({
+                "key": f"({cls._keyset_condition(op, columns)})",
+                "null_key": f"{columns[0]} IS NULL AND ({cls._keyset_condition(op, columns[1:])})",
+                "nulls": f"{columns[0]} IS NULL",
+                "not_nulls": f"{columns[0]} IS NOT NULL",
+            }[segment])
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        if direction == "all" and sort is None:
+            return f"{cls.select_query}{where}"
+        order = ", ".join(f"{column} DESC" if descending else column for column in columns)
+        limit = "" if direction == "all" else " LIMIT %s"
+        return f"{cls.select_query}{where} ORDER BY {order}{limit}"
 
-    def __init__(self, cursor):
-        self.mysql = cursor
+    @classmethod
+    def _get_sort_column(cls, sort: str) -> str | None:
+        # Колонка, которая добавляется перед колонками ключа. Сортировка по первой колонке ключа
+        # меняет только направление
+        column = cls.filter_columns[sort.lstrip("-")][0]
+        return None if column == cls.key_columns[0] else column
+
+    def get_sort_fields(self) -> list[str]:
+        return list(self.filter_columns) if self.sort_fields is None else self.sort_fields
+
+    def get_query_statement(self, direction: str, query: TableQuery, segment: str = "key") -> str:
+        if query.sort is not None and query.sort.lstrip("-") not in self.get_sort_fields():
+            raise ValueError(f"{self.name}: сортировка по {query.sort} не разрешена")
+        return self._compile_query_statement(direction, query.get_shape(), segment, Connection.get_backend().name)
+
+    def _get_segments(self, direction: str, query: TableQuery, key: tuple) -> list[tuple[str, list]]:
+        # (segment, параметры ключа) запросов страницы по порядку. NULL в колонке сортировки меньше
+        # любого значения: MySQL и SQLite ставят NULL первыми по возрастанию и последними по убыванию.
+        # Условие вида "NULL после ключа или не NULL" не читается по индексу одним диапазоном, поэтому
+        # строки с NULL и без читаются разными запросами, следующий - если предыдущий не набрал страницу
+        if len(key) == len(self.get_primary_fields()) or query.sort.lstrip("-") in self.not_null_fields:
+            return [("key", self._keyset_params(key))]
+        descending = query.sort.startswith("-") != (direction == "before")
+        if key[0] is None:
+            segments = [("null_key", self._keyset_params(key[1:]))]
+            return segments if descending else [*segments, ("not_nulls", [])]
+        segments = [("key", self._keyset_params(key))]
+        return [*segments, ("nulls", [])] if descending else segments
+
+    def get_page_fields(self, query: TableQuery = None) -> list[str]:
+        # Поля объекта, из которых состоит ключ страницы (?after=...&after=...).
+        # Только первое из них, поле сортировки, может быть None
+        if query is None or query.sort is None or self._get_sort_column(query.sort) is None:
+            return self.get_primary_fields()
+        return [query.sort.lstrip("-"), *self.get_primary_fields()]
+
+    def _filter_params(self, query: TableQuery) -> list:
+        backend = Connection.get_backend()
+        return [backend.prefix_pattern(value) if op == "prefix" else value for name, op, value in query.filters]
+
+    @staticmethod
+    def _keyset_params(key: tuple) -> list:
+        # Параметры для _keyset_condition: x, x, y, ...
+        return [key[j] for i in range(len(key)) for j in (*range(i), i)]
+
+    def __init__(self, name: str):
+        self.name = name  # Имя модели в Database
+
+    @property
+    def mysql(self) -> QueryCursor:
+        return Connection.get_cursor()
+
+    def _execute(self, statement: str, params: tuple = ()) -> QueryCursor:
+        return Connection.execute_prepared(self.statements[statement], params)
+
+    def _execute_read(self, statement: str, params: tuple = ()) -> QueryCursor:
+        # Чтение, которое можно отдать реплике (Connection.get_read_connection)
+        return Connection.execute_read(self.statements[statement], params)
 
     def create(self, *args):
+        # Возвращает код созданной строки
         raise NotImplementedError
 
-    def all(self) -> list[BaseModelObj]:
+    def create_many(self, rows: list[tuple], batch_size: int = None) -> BulkResult:
+        # Массовое создание строк многострочными INSERT по batch_size строк.
+        # Если пачка не вставилась, она откатывается и вставляется построчно, чтобы найти строки с ошибками.
+        # Транзакцию фиксирует вызывающий (например, через Connection.transaction())
+        batch_size = batch_size or self.bulk_batch_size
+        result = BulkResult()
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            try:
+                with self._savepoint():
+                    ids = self._create_batch(batch)
+                result.ids.extend(ids)
+                continue
+            except DatabaseError:
+                pass
+            for i, row in enumerate(batch, start):
+                try:
+                    with self._savepoint():
+                        result.ids.append(self.create(*row))
+                except DatabaseError as error:
+                    result.ids.append(None)
+                    result.errors.append((i, error_message(error)))
+        return result
+
+    def _create_batch(self, rows: list[tuple]) -> list:
+        raise NotImplementedError
+
+    def remove_many(self, keys: list[list]):
+        # Удаление строк по ключам (значения get_primary_fields()) запросами DELETE ... WHERE ключ IN (...)
+        # по in_batch_size ключей, без чтения строк. Транзакцию фиксирует вызывающий
         raise NotImplementedError
 
-    def get(self, *primary_values) -> BaseModelObj:
+    def update_many(self, keys: list[list], values: dict):
+        # Одни и те же значения (поле -> значение) для всех строк keys запросами UPDATE ... WHERE ключ IN (...)
         raise NotImplementedError
 
+    def _in_batches(self, keys: list) -> list[list]:
+        # Ключи без повторов пачками по in_batch_size, см. pad_in_list
+        keys = list(dict.fromkeys(tuple(key) if isinstance(key, list) else key for key in keys))
+        return [pad_in_list(keys[start:start + self.in_batch_size]) for start in range(0, len(keys), self.in_batch_size)]
+
+    @staticmethod
+    def _in_condition(columns: list[str], count: int) -> str:
+        # Условие "ключ из columns - один из count ключей". Для ключа из нескольких колонок - OR
+        # по строкам: сравнение (a, b) IN ((x, y), ...) SQLite не поддерживает, а так индекс используют обе СУБД
+        if len(columns) == 1:
+            return f"{columns[0]} IN ({', '.join(['%s'] * count)})"
+        row = "(" + " AND ".join(f"{column} = %s" for column in columns) + ")"
+        return " OR ".join([row] * count)
+
+    def _insert_values(self, table: str, columns: list[str], rows: list[tuple], on_duplicate: str = "") -> int:
+        # Один INSERT на все строки. Возвращает код первой вставленной строки
+        row_marks = "(" + ",".join(["%s"] * len(columns)) + ")"
+        query = f"""
+            INSERT INTO {table}({",".join(columns)})
+            VALUES {",".join([row_marks] * len(rows))}
+            {on_duplicate}
+        """
+        self.mysql.execute(query, [value for row in rows for value in row])
+        return Connection.get_backend().first_inserted_id(self.mysql, len(rows))
+
+    @contextmanager
+    def _savepoint(self):
+        self.mysql.execute("SAVEPOINT bulk_create")
+        try:
+            yield
+        except DatabaseError:
+            self.mysql.execute("ROLLBACK TO SAVEPOINT bulk_create")
+            raise
+        self.mysql.execute("RELEASE SAVEPOINT bulk_create")
+
+    def all(self) -> list[BaseModelObj]:
+        return [self.model_obj(*fields) for fields in self._execute_read("all").fetchall()]
+
+    def get(self, *primary_values) -> BaseModelObj | None:
+        rows = self._execute_read("get", primary_values).fetchall()
+        if not rows:
+            return None
+        return self.model_obj(*rows[0])
+
     def get_primary_fields(self) -> list[str]:
         raise NotImplementedError
 
+    def get_read_model(self) -> "BaseDBModel":
+        # Модель, через которую таблица выводится на страницу. Её строки содержат поля get_primary_fields()
+        return self
+
+    def get_versions(self) -> list[tuple]:
+        # (таблица, версия, время изменения) для таблиц модели. Сами таблицы не читаются.
+        # Версия таблицы хранится частями (database/migrations/0006_version_shards.sql) и складывается здесь:
+        # у MAX() и SUM() в SQLite нет типа колонки, и время вернулось бы строкой
+        versions = {}
+        for table, version, updated_at in self._execute_read("versions").fetchall():
+            total, last_updated_at = versions.get(table, (0, updated_at))
+            versions[table] = (total + version, max(last_updated_at, updated_at))
+        return [(table, *versions[table]) for table in sorted(versions)]
+
+    def page(self, after: tuple = None, before: tuple = None, limit: int = 50, query: TableQuery = None) -> Page:
+        # Постраничное чтение по первичному ключу (keyset pagination).
+        # after/before - значения ключа (get_page_fields) последней/первой строки соседней страницы.
+        # В отличие от OFFSET, стоимость любой страницы равна стоимости первой.
+        # Лишняя строка в LIMIT показывает, есть ли следующая страница.
+        # query отбирает и сортирует строки в БД, с ним ключ страницы начинается с поля сортировки
+        if query:
+            rows = self._read_query_page(after, before, limit, query)
+        elif before is not None:
+            rows = self._execute_read("page_before", (*self._keyset_params(before), limit + 1)).fetchall()
+        elif after is not None:
+            rows = self._execute_read("page_after", (*self._keyset_params(after), limit + 1)).fetchall()
+        else:
+            rows = self._execute_read("page_first", (limit + 1,)).fetchall()
+        has_more = len(rows) > limit
+        objects = [self.model_obj(*fields) for fields in rows[:limit]]
+        if before is not None:
+            objects.reverse()
+            return Page(objects, has_next=bool(objects), has_prev=has_more)
+        return Page(objects, has_next=has_more, has_prev=after is not None)
+
+    def _read_query_page(self, after: tuple | None, before: tuple | None, limit: int, query: TableQuery) -> list:
+        direction = "before" if before is not None else "after" if after is not None else "first"
+        key = before if before is not None else after
+        segments = [("key", [])] if key is None else self._get_segments(direction, query, key)
+        rows = []
+        for segment, key_params in segments:
+            params = (*self._filter_params(query), *key_params, limit + 1 - len(rows))
+            rows += Connection.execute_read(self.get_query_statement(direction, query, segment), params).fetchall()
+            if len(rows) > limit:
+                break
+        return rows
+
+    def iterate(self, batch_size: int = 1000, query: TableQuery = None):
+        # Потоковое чтение всей таблицы (или строк, отобранных query) пачками по batch_size строк.
+        # Небуферизованный курсор не держит результат в памяти целиком, но занимает соединение
+        # до конца чтения, поэтому из пула берётся отдельное соединение, а не соединение запроса
+        pool, connection = Connection.checkout_read()
+        try:
+            cursor = QueryCursor(connection.cursor(buffered=False))
+            if query:
+                cursor.execute(self.get_query_statement("all", query), self._filter_params(query))
+            else:
+                cursor.execute(self.statements["all"])
+            while rows := cursor.fetchmany(batch_size):
+                yield [self.model_obj(*fields) for fields in rows]
+        finally:
+            pool.release(connection)
+
 
 class OneTableModel(BaseDBModel):
     primary_field: str
     manual_fields: list[str]
     table_name: str
     model_obj: type[BaseModelObj]
+    summary_condition: str | None = None  # Условие Summaries по коду строки, если строки входят в сводки отчётов
+    summary_fields: list[str] = []  # Поля, от которых зависят сводки
+
+    def __init_subclass__(cls, **kwargs):
+        if "table_name" in cls.__dict__:
+            # Колонки перечисляются явно, в порядке полей объекта строки
+            cls.select_query = f"SELECT {', '.join(cls.model_obj.__slots__)} FROM {cls.table_name}"
+            cls.key_columns = [cls.primary_field]
+            cls.tables = [cls.table_name]
+            cls.statements = {
+                **cls.statements,
+                "create": f"INSERT INTO {cls.table_name}({', '.join(cls.manual_fields)}) "
+                          f"VALUES ({', '.join(['%s'] * len(cls.manual_fields))})",
+            }
+        super().__init_subclass__(**kwargs)
 
     def create(self, *args):
-        query = f"""
-            INSERT INTO {self.table_name}({",".join(self.manual_fields)})
-            VALUES({",".join(["%s"] * len(self.manual_fields))})
-        """
-        self.mysql.execute(query, args)
-
-    def all(self):
-        query = f"""
-            SELECT * FROM {self.table_name}
-        """
-        self.mysql.execute(query)
-        res = []
-        for fields in self.mysql.fetchall():
-            res.append(self.model_obj(*fields))
-        return res
-
-    def get(self, primary_value) -> BaseModelObj:
-        query = f"""
-            SELECT * FROM {self.table_name}
-            WHERE {self.primary_field} = %s
-        """
-        self.mysql.execute(query, (primary_value,))
-        return self.model_obj(*self.mysql.fetchone())
+        self.mysql.execute(self.statements["create"], args)  # lastrowid берётся у обычного курсора
+        Connection.table_changed(self.table_name)
+        return self._generated_ids([args], self.mysql.lastrowid)[0]
+
+    def _create_batch(self, rows: list[tuple]) -> list:
+        first_id = self._insert_values(self.table_name, self.manual_fields, rows)
+        Connection.table_changed(self.table_name)
+        return self._generated_ids(rows, first_id)
+
+    def remove_many(self, keys: list[list]):
+        batches = self._in_batches([key[0] for key in keys])
+        for batch in batches:
+            if self.summary_condition is not None:
+                Summaries.subtract(self.summary_condition, batch)
+            Connection.execute_prepared(f"""
+                DELETE FROM {self.table_name}
+                WHERE {self._in_condition([self.primary_field], len(batch))}
+            """, batch)
+        if batches:
+            Connection.table_changed(self.table_name, *self.model_obj.cascade_tables)
+
+    def update_many(self, keys: list[list], values: dict):
+        fields = [field for field in self.manual_fields if field in values]  # В запрос попадают только свои поля
+        batches = self._in_batches([key[0] for key in keys])
+        if not fields or not batches:
+            return
+        affects_summaries = self.summary_condition is not None and set(fields) & set(self.summary_fields)
+        set_fields = ", ".join(f"{field} = %s" for field in fields)
+        for batch in batches:
+            if affects_summaries:
+                Summaries.subtract(self.summary_condition, batch)
+            Connection.execute_prepared(f"""
+                UPDATE {self.table_name}
+                SET {set_fields}
+                WHERE {self._in_condition([self.primary_field], len(batch))}
+            """, (*[values[field] for field in fields], *batch))
+            if affects_summaries:
+                Summaries.add(self.summary_condition, batch)
+        Connection.table_changed(self.table_name)
+
+    def _generated_ids(self, rows: list[tuple], first_id: int) -> list:
+        if self.primary_field in self.manual_fields:  # Ключ задаётся вручную, например логин
+            index = self.manual_fields.index(self.primary_field)
+            return [row[index] for row in rows]
+        # Для INSERT с известным числом строк InnoDB выделяет значения AUTO_INCREMENT подряд
+        return list(range(first_id, first_id + len(rows)))
 
     def get_primary_fields(self) -> list[str]:
         return [self.primary_field]
 
 
 class _Provider(BaseDBModel):
+    model_obj = ProviderObj
     primary_fields = ["provider_id", "address"]
-
-    def create(self, name: str, address: str) -> None:
-        if not self.__provider_exist(name):
-            self.mysql.execute("""
-                INSERT INTO provider_name(name)
-                VALUES (%s)
-            """, (name,))
-        provider_id = self.get_provider_id(name)
+    select_query = """
+        SELECT provider_name.provider_id, provider_name.name, provider_address.address
+        FROM provider_name
+        JOIN provider_address
+        ON provider_name.provider_id = provider_address.provider_id
+    """
+    key_columns = ["provider_address.provider_id", "provider_address.address"]
+    tables = ["provider_name", "provider_address"]
+    filter_columns = {
+        "provider_id": ("provider_address.provider_id", "int"),
+        "name": ("provider_name.name", "prefix"),
+    }
+    sort_fields = ["provider_id"]
+    statements = {
+        "name_ids": "SELECT name, provider_id FROM provider_name",
+    }
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.name_ids = LookupCache("provider_name", "name_ids", self._load_name_ids)
+        self.id_names = LookupCache("provider_name", "id_names", self._load_id_names)
+
+    def create(self, name: str, address: str) -> int:
+        # Если поставщик с таким названием уже есть, upsert возвращает его код,
+        # поэтому отдельные проверка существования и поиск кода не нужны
+        backend = Connection.get_backend()
+        self.mysql.execute(f"""
+            INSERT INTO provider_name(name)
+            VALUES (%s)
+            {backend.upsert_returning_key("name", "provider_id")}
+        """, (name,))
+        provider_id = backend.returned_key(self.mysql)
+        Connection.table_changed("provider_name", "provider_address")
         self.mysql.execute("""
             INSERT INTO provider_address(provider_id, address)
             VALUES (%s, %s)
         """, (provider_id, address))
-
-    def all(self) -> list[ProviderObj]:
-        self.mysql.execute("""
-            SELECT provider_name.provider_id, provider_name.name, provider_address.address
+        return provider_id
+
+    def _create_batch(self, rows: list[tuple]) -> list:
+        # Сначала все новые названия одним INSERT, затем коды всех названий пачки одним SELECT,
+        # затем все адреса одним INSERT
+        names = list(dict.fromkeys(name for name, address in rows))
+        self._insert_values("provider_name", ["name"], [(name,) for name in names],
+                            Connection.get_backend().ignore_duplicates("name", "provider_id"))
+        self.mysql.execute(f"""
+            SELECT name, provider_id
             FROM provider_name
-            JOIN provider_address
-            ON provider_name.provider_id = provider_address.provider_id
-        """)
-        res = []
-        for fields in self.mysql.fetchall():
-            res.append(ProviderObj(*fields))
-        return res
-
-    def get(self, provider_id, address):
-        self.mysql.execute("""
-                    SELECT provider_name.provider_id, provider_name.name, provider_address.address
-                    FROM provider_name
-                    JOIN provider_address
-                    ON provider_name.provider_id = provider_address.provider_id
-                    WHERE provider_name.provider_id = %s AND provider_address.address = %s
-        """, (provider_id, address))
-        return ProviderObj(*self.mysql.fetchone())
+            WHERE name IN ({",".join(["%s"] * len(names))})
+        """, names)
+        provider_ids = dict(self.mysql.fetchall())
+        Connection.table_changed("provider_name", "provider_address")
+        ids = [provider_ids[name] for name, address in rows]
+        self._insert_values("provider_address", ["provider_id", "address"],
+                            [(provider_id, address) for provider_id, (name, address) in zip(ids, rows)])
+        return ids
+
+    def remove_many(self, keys: list[list]):
+        # Как ProviderObj.remove, но для всех строк сразу: одним запросом удаляются адреса,
+        # затем одним запросом - поставщики, у которых не осталось адресов, без подсчёта адресов по строкам
+        batches = self._in_batches(keys)
+        for batch in batches:
+            Connection.execute_prepared(f"""
+                DELETE FROM provider_address
+                WHERE {self._in_condition(["provider_id", "address"], len(batch))}
+            """, [value for key in batch for value in key])
+        if not batches:
+            return
+        Connection.table_changed("provider_address")
+        for batch in self._in_batches([provider_id for provider_id, address in keys]):
+            provider_ids = [row[0] for row in Connection.execute_prepared(f"""
+                SELECT provider_id
+                FROM provider_name
+                WHERE {self._in_condition(["provider_id"], len(batch))} AND NOT EXISTS (
+                    SELECT 1 FROM provider_address WHERE provider_address.provider_id = provider_name.provider_id
+                )
+            """, batch).fetchall()]
+            if not provider_ids:
+                continue
+            Summaries.subtract("provider", provider_ids)
+            provider_ids = pad_in_list(provider_ids)
+            Connection.execute_prepared(f"""
+                DELETE FROM provider_name
+                WHERE {self._in_condition(["provider_id"], len(provider_ids))}
+            """, provider_ids)
+            # Цветы поставщиков, а с цветами и их заказы, удаляются каскадно
+            Connection.table_changed("provider_name", "flower", "booking")
+
+    def update_many(self, keys: list[list], values: dict):
+        # Название у поставщика одно на все адреса и уникально, поэтому меняется только адрес
+        batches = self._in_batches(keys)
+        if "address" not in values or not batches:
+            return
+        for batch in batches:
+            Connection.execute_prepared(f"""
+                UPDATE provider_address
+                SET address = %s
+                WHERE {self._in_condition(["provider_id", "address"], len(batch))}
+            """, (values["address"], *[value for key in batch for value in key]))
+        Connection.table_changed("provider_address")
 
     def all_names(self) -> list[str]:
-        self.mysql.execute("""
-            SELECT name
-            FROM provider_name
-        """)
-        return [row[0] for row in self.mysql.fetchall()]
-
-    def __provider_exist(self, name) -> bool:
-        self.mysql.execute("""
-            SELECT COUNT(*) 
-            FROM provider_name 
-            WHERE name = %s
-        """, (name,))
-        count = self.mysql.fetchone()[0]
-        return count != 0
+        return list(self.name_ids.get())
 
     def get_provider_id(self, name) -> int:
-        self.mysql.execute("""
-            SELECT provider_id
-            FROM provider_name
-            WHERE name = %s
-        """, (name,))
-        return self.mysql.fetchone()[0]
+        return self.name_ids.get()[name]
+
+    def get_provider_name(self, provider_id: int) -> str | None:
+        return self.id_names.get().get(provider_id)
+
+    def _load_name_ids(self) -> dict[str, int]:
+        return dict(self._execute("name_ids").fetchall())
+
+    def _load_id_names(self) -> dict[int, str]:
+        # Обратный справочник строится из name_ids той же таблицы, без отдельного запроса
+        return {id_: name for name, id_ in self.name_ids.get().items()}
 
     def get_primary_fields(self) -> list[str]:
         return self.primary_fields
@@ -125,77 +527,159 @@ class _Flower(OneTableModel):
     table_name = FlowerObj.table_name
     primary_field = FlowerObj.primary_field
     manual_fields = FlowerObj.get_manual_fields()
+    summary_condition = "flower"
+    summary_fields = ["price", "provider_id"]
+    filter_columns = {
+        "flower_id": ("flower_id", "int"),
+        "name": ("name", "prefix"),
+        "price": ("price", "int"),
+        "provider_id": ("provider_id", "int"),
+    }
+    statements = {
+        "name_ids": "SELECT name, flower_id FROM flower",
+    }
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.name_ids = LookupCache("flower", "name_ids", self._load_name_ids)
+        self.id_names = LookupCache("flower", "id_names", self._load_id_names)
 
     def create(self, name: str, price: int, provider_id: int):
-        super().create(name, price, provider_id)
+        return super().create(name, price, provider_id)
 
     def all_names(self) -> list[str]:
-        self.mysql.execute("""
-            SELECT name
-            FROM flower
-        """)
-        return [row[0] for row in self.mysql.fetchall()]
+        return list(self.name_ids.get())
 
     def get_flower_id(self, name: str) -> int:
-        self.mysql.execute("""
-            SELECT flower_id
-            FROM flower
-            WHERE name = %s
-        """, (name,))
-        return self.mysql.fetchone()[0]
+        return self.name_ids.get()[name]
+
+    def get_flower_name(self, flower_id: int) -> str | None:
+        return self.id_names.get().get(flower_id)
+
+    def _load_name_ids(self) -> dict[str, int]:
+        return dict(self._execute("name_ids").fetchall())
+
+    def _load_id_names(self) -> dict[int, str]:
+        return {id_: name for name, id_ in self.name_ids.get().items()}
 
 
 class _Customer(BaseDBModel):
+    model_obj = CustomerObj
     primary_fields = ["customer_id", "phone"]
-
-    def create(self, name: str, phone: str, address: str):
-        if not self.__customer_exist(name):
-            self.mysql.execute("""
-                INSERT INTO customer_name(name)
-                VALUES (%s)
-            """, (name,))
-        customer_id = self.get_customer_id(name)
+    select_query = """
+        SELECT customer_name.customer_id, customer_name.name,
+            customer_info.phone, customer_info.address
+        FROM customer_name
+        JOIN customer_info
+        ON customer_name.customer_id = customer_info.customer_id
+    """
+    key_columns = ["customer_info.customer_id", "customer_info.phone"]
+    tables = ["customer_name", "customer_info"]
+    filter_columns = {
+        "customer_id": ("customer_info.customer_id", "int"),
+        "name": ("customer_name.name", "prefix"),
+        "phone": ("customer_info.phone", "prefix"),
+    }
+    sort_fields = ["customer_id", "phone"]
+    statements = {
+        "name_ids": "SELECT name, customer_id FROM customer_name",
+    }
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.name_ids = LookupCache("customer_name", "name_ids", self._load_name_ids)
+        self.id_names = LookupCache("customer_name", "id_names", self._load_id_names)
+
+    def create(self, name: str, phone: str, address: str) -> int:
+        # См. _Provider.create
+        backend = Connection.get_backend()
+        self.mysql.execute(f"""
+            INSERT INTO customer_name(name)
+            VALUES (%s)
+            {backend.upsert_returning_key("name", "customer_id")}
+        """, (name,))
+        customer_id = backend.returned_key(self.mysql)
+        Connection.table_changed("customer_name", "customer_info")
         self.mysql.execute("""
             INSERT INTO customer_info(customer_id, phone, address)
             VALUES (%s, %s, %s)
         """, (customer_id, phone, address))
-
-    def all(self) -> list[CustomerObj]:
-        self.mysql.execute("""
-                    SELECT customer_name.customer_id, customer_name.name, 
-                        customer_info.phone, customer_info.address
-                    FROM customer_name
-                    JOIN customer_info
-                    ON customer_name.customer_id = customer_info.customer_id
-                """)
-        res = []
-        for fields in self.mysql.fetchall():
-            res.append(CustomerObj(*fields))
-        return res
-
-    def __customer_exist(self, name) -> bool:
-        self.mysql.execute("""
-            SELECT COUNT(*) 
-            FROM customer_name 
-            WHERE name = %s
-        """, (name,))
-        count = self.mysql.fetchone()[0]
-        return count != 0
+        return customer_id
+
+    def _create_batch(self, rows: list[tuple]) -> list:
+        # См. _Provider._create_batch
+        names = list(dict.fromkeys(name for name, phone, address in rows))
+        self._insert_values("customer_name", ["name"], [(name,) for name in names],
+                            Connection.get_backend().ignore_duplicates("name", "customer_id"))
+        self.mysql.execute(f"""
+            SELECT name, customer_id
+            FROM customer_name
+            WHERE name IN ({",".join(["%s"] * len(names))})
+        """, names)
+        customer_ids = dict(self.mysql.fetchall())
+        Connection.table_changed("customer_name", "customer_info")
+        ids = [customer_ids[name] for name, phone, address in rows]
+        self._insert_values("customer_info", ["customer_id", "phone", "address"],
+                            [(customer_id, phone, address) for customer_id, (name, phone, address) in zip(ids, rows)])
+        return ids
+
+    def remove_many(self, keys: list[list]):
+        # См. _Provider.remove_many
+        batches = self._in_batches(keys)
+        for batch in batches:
+            Connection.execute_prepared(f"""
+                DELETE FROM customer_info
+                WHERE {self._in_condition(["customer_id", "phone"], len(batch))}
+            """, [value for key in batch for value in key])
+        if not batches:
+            return
+        Connection.table_changed("customer_info")
+        for batch in self._in_batches([customer_id for customer_id, phone in keys]):
+            customer_ids = [row[0] for row in Connection.execute_prepared(f"""
+                SELECT customer_id
+                FROM customer_name
+                WHERE {self._in_condition(["customer_id"], len(batch))} AND NOT EXISTS (
+                    SELECT 1 FROM customer_info WHERE customer_info.customer_id = customer_name.customer_id
+                )
+            """, batch).fetchall()]
+            if not customer_ids:
+                continue
+            Summaries.subtract("customer", customer_ids)
+            customer_ids = pad_in_list(customer_ids)
+            Connection.execute_prepared(f"""
+                DELETE FROM customer_name
+                WHERE {self._in_condition(["customer_id"], len(customer_ids))}
+            """, customer_ids)
+            # Договоры заказчиков, а с договорами и их заказы, удаляются каскадно
+            Connection.table_changed("customer_name", "contract", "booking")
+
+    def update_many(self, keys: list[list], values: dict):
+        # См. _Provider.update_many. Телефон - часть ключа строки и не меняется
+        batches = self._in_batches(keys)
+        if "address" not in values or not batches:
+            return
+        for batch in batches:
+            Connection.execute_prepared(f"""
+                UPDATE customer_info
+                SET address = %s
+                WHERE {self._in_condition(["customer_id", "phone"], len(batch))}
+            """, (values["address"], *[value for key in batch for value in key]))
+        Connection.table_changed("customer_info")
 
     def get_customer_id(self, name) -> int:
-        self.mysql.execute("""
-            SELECT customer_id
-            FROM customer_name
-            WHERE name = %s
-        """, (name,))
-        return self.mysql.fetchone()[0]
+        return self.name_ids.get()[name]
+
+    def get_customer_name(self, customer_id: int) -> str | None:
+        return self.id_names.get().get(customer_id)
 
     def all_names(self) -> list[str]:
-        self.mysql.execute("""
-            SELECT name
-            FROM customer_name
-        """)
-        return [row[0] for row in self.mysql.fetchall()]
+        return list(self.name_ids.get())
+
+    def _load_name_ids(self) -> dict[str, int]:
+        return dict(self._execute("name_ids").fetchall())
+
+    def _load_id_names(self) -> dict[int, str]:
+        return {id_: name for name, id_ in self.name_ids.get().items()}
 
     def get_primary_fields(self) -> list[str]:
         return self.primary_fields
@@ -205,17 +689,60 @@ class _Contract(OneTableModel):
     model_obj = ContractObj
     table_name = ContractObj.table_name
     manual_fields = ContractObj.get_manual_fields()
+    summary_condition = "contract"
+    summary_fields = ["customer_id", "register_date"]
     primary_field = ContractObj.primary_field
+    filter_columns = {
+        "contract_id": ("contract_id", "int"),
+        "customer_id": ("customer_id", "int"),
+        "register_date": ("register_date", "date"),
+        "execution_date": ("execution_date", "date"),
+    }
+    statements = {
+        "ids": "SELECT contract_id FROM contract",
+    }
 
     def create(self, customer_id: int, register_date: datetime.date, execution_date: datetime.date):
         return super().create(customer_id, register_date, execution_date)
 
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.ids = LookupCache("contract", "ids", self._load_ids)
+
+    def get_read_model(self) -> BaseDBModel:
+        return Database.ContractDetails
+
     def all_ids(self) -> list[int]:
-        self.mysql.execute("""
-            SELECT contract_id
-            FROM contract
-        """)
-        return [row[0] for row in self.mysql.fetchall()]
+        return self.ids.get()
+
+    def _load_ids(self) -> list[int]:
+        return [row[0] for row in self._execute("ids").fetchall()]
+
+
+class _ContractDetails(BaseDBModel):
+    # Договоры с названием заказчика и итогами из сводки contract_total, см. _OrderDetails
+    model_obj = ContractDetailsObj
+    select_query = """
+        SELECT contract.contract_id, contract.customer_id, customer_name.name,
+            contract.register_date, contract.execution_date,
+            COALESCE(contract_total.booking_count, 0), COALESCE(contract_total.amount, 0)
+        FROM contract
+        LEFT JOIN customer_name ON customer_name.customer_id = contract.customer_id
+        LEFT JOIN contract_total ON contract_total.contract_id = contract.contract_id
+    """
+    key_columns = ["contract.contract_id"]
+    tables = ["contract", "customer_name", "contract_total"]
+    filter_columns = {
+        "contract_id": ("contract.contract_id", "int"),
+        "customer_id": ("contract.customer_id", "int"),
+        "customer_name": ("customer_name.name", "prefix"),
+        "register_date": ("contract.register_date", "date"),
+        "execution_date": ("contract.execution_date", "date"),
+    }
+    sort_fields = ["contract_id", "customer_id", "register_date", "execution_date"]
+
+    def get_primary_fields(self) -> list[str]:
+        return ["contract_id"]
 
 
 class _Order(OneTableModel):
@@ -223,9 +750,55 @@ class _Order(OneTableModel):
     primary_field = OrderObj.primary_field
     table_name = OrderObj.table_name
     manual_fields = OrderObj.get_manual_fields()
+    summary_condition = "booking"
+    summary_fields = OrderObj.get_manual_fields()
+    filter_columns = {
+        "booking_id": ("booking_id", "int"),
+        "contract_id": ("contract_id", "int"),
+        "flower_id": ("flower_id", "int"),
+        "quantity": ("quantity", "int"),
+    }
+
+    def get_read_model(self) -> BaseDBModel:
+        return Database.OrderDetails
 
     def create(self, contract_id: int, flower_id: int, quantity: int):
-        super().create(contract_id, flower_id, quantity)
+        booking_id = super().create(contract_id, flower_id, quantity)
+        Summaries.add("booking", [booking_id])
+        return booking_id
+
+    def _create_batch(self, rows: list[tuple]) -> list:
+        ids = super()._create_batch(rows)
+        Summaries.add("booking", ids)
+        return ids
+
+
+class _OrderDetails(BaseDBModel):
+    # Заказы с названиями цветка, поставщика и заказчика и суммой строки одним запросом с JOIN,
+    # для вывода таблицы заказов. Изменяются заказы через _Order. Внешние ключи booking и contract
+    # допускают NULL, поэтому JOIN внешние: заказ без цветка или договора тоже попадает в таблицу
+    model_obj = OrderDetailsObj
+    select_query = """
+        SELECT booking.booking_id, booking.contract_id, customer_name.name, flower.name, provider_name.name,
+            flower.price, booking.quantity, booking.quantity * flower.price
+        FROM booking
+        LEFT JOIN flower ON flower.flower_id = booking.flower_id
+        LEFT JOIN provider_name ON provider_name.provider_id = flower.provider_id
+        LEFT JOIN contract ON contract.contract_id = booking.contract_id
+        LEFT JOIN customer_name ON customer_name.customer_id = contract.customer_id
+    """
+    key_columns = ["booking.booking_id"]
+    tables = ["booking", "flower", "provider_name", "contract", "customer_name"]
+    filter_columns = {
+        "booking_id": ("booking.booking_id", "int"),
+        "contract_id": ("booking.contract_id", "int"),
+        "flower_name": ("flower.name", "prefix"),
+        "quantity": ("booking.quantity", "int"),
+    }
+    sort_fields = ["booking_id", "contract_id", "quantity"]
+
+    def get_primary_fields(self) -> list[str]:
+        return ["booking_id"]
 
 
 class _Employee(OneTableModel):
@@ -233,20 +806,13 @@ class _Employee(OneTableModel):
     table_name = EmployeeObj.table_name
     manual_fields = EmployeeObj.get_manual_fields()
     primary_field = EmployeeObj.primary_field
+    filter_columns = {
+        "login": ("login", "prefix"),
+        "job_title": ("job_title", "prefix"),
+    }
 
     def create(self, login: str, password: str, job_title: str):
-        super().create(login, password, job_title)
-
-    def get(self, login: str) -> EmployeeObj | None:
-        self.mysql.execute("""
-            SELECT * FROM employee
-            WHERE login = %s
-        """, (login,))
-        obj = self.mysql.fetchone()
-        if obj is None:
-            return None
-        else:
-            return EmployeeObj(*obj)
+        return super().create(login, password, job_title)
 
 
 class _CustomerUser(OneTableModel):
@@ -254,20 +820,72 @@ class _CustomerUser(OneTableModel):
     table_name = CustomerUserObj.table_name
     manual_fields = CustomerUserObj.get_manual_fields()
     primary_field = CustomerUserObj.primary_field
+    filter_columns = {
+        "login": ("login", "prefix"),
+        "customer_id": ("customer_id", "int"),
+    }
 
     def create(self, login: str, password: str, customer_id: int):
-        super().create(login, password, customer_id)
+        return super().create(login, password, customer_id)
+
+
+class BaseReportModel(BaseDBModel):
+    # Отчёт по сводной таблице. Строки только читаются, их меняет Summaries
+    primary_fields: list[str]
+
+    def get_primary_fields(self) -> list[str]:
+        return self.primary_fields
 
-    def get(self, login: str) -> CustomerUserObj | None:
-        self.mysql.execute("""
-            SELECT * FROM customer_user
-            WHERE login = %s
-        """, (login,))
-        obj = self.mysql.fetchone()
-        if obj is None:
-            return None
-        else:
-            return CustomerUserObj(*obj)
+
+class _ContractTotal(BaseReportModel):
+    model_obj = ContractTotalObj
+    primary_fields = ["contract_id"]
+    select_query = "SELECT contract_id, booking_count, quantity, amount FROM contract_total"
+    key_columns = ["contract_id"]
+    tables = ["contract_total"]
+    filter_columns = {
+        "contract_id": ("contract_id", "int"),
+        "amount": ("amount", "int"),
+    }
+    not_null_fields = ["amount"]
+
+
+class _CustomerRevenue(BaseReportModel):
+    model_obj = CustomerRevenueObj
+    primary_fields = ["customer_id", "month"]
+    select_query = """
+        SELECT customer_month_revenue.customer_id, customer_name.name, customer_month_revenue.month,
+            customer_month_revenue.booking_count, customer_month_revenue.quantity, customer_month_revenue.amount
+        FROM customer_month_revenue
+        JOIN customer_name
+        ON customer_name.customer_id = customer_month_revenue.customer_id
+    """
+    key_columns = ["customer_month_revenue.customer_id", "customer_month_revenue.month"]
+    tables = ["customer_month_revenue", "customer_name"]
+    filter_columns = {
+        "customer_id": ("customer_month_revenue.customer_id", "int"),
+        "month": ("customer_month_revenue.month", "date"),
+    }
+    not_null_fields = ["month"]
+
+
+class _ProviderRevenue(BaseReportModel):
+    model_obj = ProviderRevenueObj
+    primary_fields = ["provider_id", "month"]
+    select_query = """
+        SELECT provider_month_revenue.provider_id, provider_name.name, provider_month_revenue.month,
+            provider_month_revenue.booking_count, provider_month_revenue.quantity, provider_month_revenue.amount
+        FROM provider_month_revenue
+        JOIN provider_name
+        ON provider_name.provider_id = provider_month_revenue.provider_id
+    """
+    key_columns = ["provider_month_revenue.provider_id", "provider_month_revenue.month"]
+    tables = ["provider_month_revenue", "provider_name"]
+    filter_columns = {
+        "provider_id": ("provider_month_revenue.provider_id", "int"),
+        "month": ("provider_month_revenue.month", "date"),
+    }
+    not_null_fields = ["month"]
 
 
 class Database:
@@ -276,18 +894,29 @@ class Database:
     Customer: _Customer
     Contract: _Contract
     Order: _Order
+    OrderDetails: _OrderDetails
+    ContractDetails: _ContractDetails
     Employee: _Employee
     CustomerUser: _CustomerUser
-    connection: type[Connection]
+    ContractTotal: _ContractTotal
+    CustomerRevenue: _CustomerRevenue
+    ProviderRevenue: _ProviderRevenue
 
     @classmethod
     def init_models(cls):
-        cls.connection = Connection
-        cursor = Connection.get_cursor()
-        cls.Provider = _Provider(cursor)
-        cls.Flower = _Flower(cursor)
-        cls.Customer = _Customer(cursor)
-        cls.Contract = _Contract(cursor)
-        cls.Order = _Order(cursor)
-        cls.Employee = _Employee(cursor)
-        cls.CustomerUser = _CustomerUser(cursor)
+        cls.Provider = _Provider("Provider")
+        cls.Flower = _Flower("Flower")
+        cls.Customer = _Customer("Customer")
+        cls.Contract = _Contract("Contract")
+        cls.Order = _Order("Order")
+        cls.OrderDetails = _OrderDetails("OrderDetails")
+        cls.ContractDetails = _ContractDetails("ContractDetails")
+        cls.Employee = _Employee("Employee")
+        cls.CustomerUser = _CustomerUser("CustomerUser")
+        cls.ContractTotal = _ContractTotal("ContractTotal")
+        cls.CustomerRevenue = _CustomerRevenue("CustomerRevenue")
+        cls.ProviderRevenue = _ProviderRevenue("ProviderRevenue")
+
+    @classmethod
+    def get_model(cls, name: str) -> BaseDBModel:
+        return getattr(cls, name)
@@ -0,0 +1,112 @@
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Журнал запросов текущего HTTP-запроса. Вне запроса (команды manage.py) - None, и запросы не записываются
+current_log = contextvars.ContextVar("query_log", default=None)
+
+
+@dataclass(slots=True)
+class QueryRecord:
+    shape: str  # SQL без лишних пробелов и со свёрнутыми списками IN (%s, %s, ...)
+    params_shape: str  # Типы параметров, например "int, str"
+    duration: float = 0  # Секунды, включая чтение результата
+    rows: int = 0  # Прочитанные строки для SELECT, изменённые строки для остальных запросов
+
+
+@dataclass
+class QueryLog:
+    records: list[QueryRecord] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.records)
+
+    @property
+    def duration(self) -> float:
+        return sum(record.duration for record in self.records)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+    @property
+    def rows(self) -> int:
+        return sum(record.rows for record in self.records)
+
+    def repeated_shapes(self) -> list[tuple[str, int]]:
+        # Одинаковые запросы, выполненные не меньше DUPLICATE_THRESHOLD раз за запрос, - признак N+1
+        threshold = settings.QUERY_LOG["DUPLICATE_THRESHOLD"]
+        counts = Counter(record.shape for record in self.records)
+        return [(shape, count) for shape, count in counts.most_common() if count >= threshold]
+
+
+@lru_cache(maxsize=1024)
+def get_shape(sql: str) -> str:
+    # Запросы с разным числом значений в IN (...) или строк в INSERT считаются одинаковыми
+    shape = re.sub(r"\s+", " ", sql).strip()
+    shape = re.sub(r"%s(?:\s*,\s*%s)+", "%s...", shape)
+    return re.sub(r"\(%s\.\.\.\)(?:\s*,\s*\(%s\.\.\.\))+", "(%s...)...", shape)
+
+
+class QueryCursor:
+    # Обёртка курсора mysql.connector, записывающая запросы в current_log.
+    # Остальные атрибуты (lastrowid, rowcount и т.д.) берутся у самого курсора
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.record = None  # Запись последнего запроса, к ней добавляются строки, прочитанные fetch*
+
+    def execute(self, sql: str, params=()):
+        log = current_log.get()
+        if log is None:
+            self.record = None
+            return self.cursor.execute(sql, params)
+        self.record = QueryRecord(get_shape(sql), ", ".join(type(param).__name__ for param in params or ()))
+        log.records.append(self.record)
+        started = time.perf_counter()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self.record.duration += time.perf_counter() - started
+            if self.cursor.description is None:  # Запрос без результата
+                self.record.rows = max(self.cursor.rowcount, 0)
+
+    def fetchone(self):
+        row = self._fetch(self.cursor.fetchone)
+        self._add_rows(0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size: int = 1):
+        rows = self._fetch(self.cursor.fetchmany, size)
+        self._add_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._fetch(self.cursor.fetchall)
+        self._add_rows(len(rows))
+        return rows
+
+    def _fetch(self, method, *args):
+        if self.record is None:
+            return method(*args)
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self.record.duration += time.perf_counter() - started
+
+    def _add_rows(self, count: int):
+        if self.record is not None:
+            self.record.rows += count
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
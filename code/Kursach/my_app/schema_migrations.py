@@ -0,0 +1,91 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from django.conf import settings
+
+# Изменения схемы после create_db.sql из settings.DATABASE_SCHEMA_DIR. Файл NNNN_описание.sql применяется к MySQL,
+# NNNN_описание.<бэкенд>.sql, если есть, - вместо него к другому бэкенду (например, .sqlite.sql).
+# Применённые версии записываются в schema_migrations
+MIGRATIONS_DIR = settings.DATABASE_SCHEMA_DIR / "migrations"
+MIGRATION_NAME = re.compile(r"^(\d{4}_\w+?)(?:\.(\w+))?\.sql$")
+TRIGGER_BODY = re.compile(r"(?is)\s*CREATE\s+TRIGGER\b.*\bBEGIN\b")
+
+CREATE_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version VARCHAR(255) PRIMARY KEY,
+        applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+
+@dataclass
+class Migration:
+    version: str  # Имя файла без расширений, например 0001_address_keys
+    path: Path
+
+    def statements(self) -> list[str]:
+        # Запросы разделены ";". Тело триггера SQLite (BEGIN ... END) содержит ";" и остаётся одним запросом
+        script = re.sub(r"--[^\n]*", "", self.path.read_text(encoding="utf-8"))
+        statements, current = [], ""
+        for part in script.split(";"):
+            current += part
+            if TRIGGER_BODY.match(current) and not re.search(r"(?i)\bEND\s*$", current):
+                current += ";"
+                continue
+            if current.strip():
+                statements.append(current.strip())
+            current = ""
+        return statements
+
+
+def get_migrations(backend_name: str) -> list[Migration]:
+    # Без каталога миграции молча не применялись бы, поэтому его отсутствие - ошибка
+    if not MIGRATIONS_DIR.is_dir():
+        raise FileNotFoundError(f"Нет каталога миграций {MIGRATIONS_DIR} (settings.DATABASE_SCHEMA_DIR)")
+    files = {}
+    for path in MIGRATIONS_DIR.glob("*.sql"):
+        match = MIGRATION_NAME.match(path.name)
+        if match is None:
+            continue
+        version, variant = match.groups()
+        if variant == backend_name or (variant is None and version not in files):
+            files[version] = path
+    return [Migration(version, files[version]) for version in sorted(files)]
+
+
+def get_applied(connection) -> set[str]:
+    cursor = connection.cursor()
+    cursor.execute(CREATE_MIGRATIONS_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    applied = {version for version, in cursor.fetchall()}
+    connection.commit()
+    return applied
+
+
+def get_pending(connection, backend_name: str) -> list[Migration]:
+    applied = get_applied(connection)
+    return [migration for migration in get_migrations(backend_name) if migration.version not in applied]
+
+
+def apply(connection, migration: Migration):
+    # В MySQL DDL фиксируется сразу, поэтому при ошибке уже выполненные запросы миграции
+    # остаются в силе, а версия не записывается. В SQLite миграция применяется целиком или никак
+    cursor = connection.cursor()
+    cursor.execute("BEGIN")
+    try:
+        for statement in migration.statements():
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO schema_migrations(version) VALUES (%s)", (migration.version,))
+    except BaseException:
+        connection.rollback()
+        raise
+    connection.commit()
+
+
+def migrate(connection, backend_name: str) -> list[str]:
+    # Применяет все неприменённые миграции по порядку, возвращает их версии
+    applied = []
+    for migration in get_pending(connection, backend_name):
+        apply(connection, migration)
+        applied.append(migration.version)
+    return applied
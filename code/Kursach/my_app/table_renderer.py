@@ -0,0 +1,56 @@
+import json
+from django.conf import settings
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.utils.formats import localize
+from django.utils.html import conditional_escape
+from .model_objects import BaseModelObj
+
+
+class TableRenderer:
+    # Строки таблицы (<tr>...</tr>) для base_table.html без шаблонизатора.
+    # URL форм, CSRF-токен и неизменная разметка кнопок собираются один раз на страницу,
+    # на каждую строку остаются только значения ячеек и ключа.
+    # Значения выводятся как {{ value }} в шаблоне: с локализацией и экранированием
+
+    def __init__(self, request, table_url: str, edit_url: str | None, key_fields: list[str], can_edit: bool = True):
+        self.key_fields = key_fields
+        self.can_edit = can_edit  # Без права на изменение кнопки "Удалить" и "Изменить" не выводятся
+        self.plain_ints = not settings.USE_THOUSAND_SEPARATOR  # Тогда localize(int) == str(int)
+        self.formatted = {}  # Уже отформатированные даты и другие значения, они часто повторяются
+        if not can_edit:
+            return
+        csrf_input = f'<input type="hidden" name="csrfmiddlewaretoken" value="{conditional_escape(get_token(request))}">'
+        self.remove_form_start = (f'<td><form action="{conditional_escape(reverse(table_url))}" method="post">'
+                                  f'{csrf_input}<button type="submit">Удалить</button>')
+        # CSRF-токен в GET-форме попадал бы в адрес страницы редактирования, поэтому не выводится
+        self.edit_form_start = (f'<td><form action="{conditional_escape(reverse(edit_url))}" method="get">'
+                                f'<button type="submit">Изменить</button>')
+
+    def render_rows(self, objects: list[BaseModelObj]) -> str:
+        return "".join([self.render_row(obj) for obj in objects])
+
+    def render_row(self, obj: BaseModelObj) -> str:
+        cells = "".join([f"<td>{self.format(value)}</td>" for value in obj])
+        if not self.can_edit:
+            return f"<tr>{cells}</tr>\n"
+        # Флажок выбора строки для формы действий над выбранными строками (bulk-form в base_table.html),
+        # значение - ключ строки в JSON
+        key = json.dumps([getattr(obj, field) for field in self.key_fields], default=str, ensure_ascii=False)
+        checkbox = f'<td><input type="checkbox" name="keys" value="{conditional_escape(key)}" form="bulk-form"></td>'
+        key_inputs = "".join([f'<input type="hidden" name="{field}" value="{self.format(getattr(obj, field))}">'
+                              for field in self.key_fields])
+        return (f"<tr>{checkbox}{cells}"
+                f"{self.remove_form_start}{key_inputs}</form></td>"
+                f"{self.edit_form_start}{key_inputs}</form></td></tr>\n")
+
+    def format(self, value) -> str:
+        value_type = type(value)
+        if value_type is str:
+            return conditional_escape(value)
+        if value_type is int and self.plain_ints:
+            return str(value)
+        formatted = self.formatted.get(value)
+        if formatted is None:
+            formatted = self.formatted[value] = conditional_escape(localize(value))
+        return formatted
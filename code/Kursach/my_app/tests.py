@@ -1,3 +1,643 @@
-from django.test import TestCase
+from contextlib import closing
+import datetime
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from mysql.connector.constants import ClientFlag
+from .backends import DatabaseError, MySQLBackend
+from .forms import TableFilterForm
+from .lookup_cache import LookupCache
+from .model_objects import Connection, ReadRouting, StaleRowError, Summaries, current_routing
+from .models import Database, TableQuery
+from .query_log import QueryLog, current_log
+from .unit_of_work import UnitOfWork
+from . import views
 
-# Create your tests here.
+
+class ModelDatabaseTestCase(TestCase):
+    # Модели работают с временной БД SQLite: схема создаётся из create_db.sql и миграций при подключении
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.database_path = Path(directory.name) / "model.sqlite3"
+        overrides = override_settings(
+            MODEL_DATABASE={**settings.MODEL_DATABASE, "BACKEND": "sqlite", "NAME": self.database_path, "REPLICAS": []},
+            CACHES={**settings.CACHES, "lookups": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        Connection.reset()
+        self.addCleanup(Connection.reset)
+
+    def create_contract(self) -> tuple[int, int]:
+        # Поставщик, цветок, заказчик и договор. Возвращает коды договора и цветка
+        with Connection.transaction():
+            provider_id = Database.Provider.create("Поляна", "ул. Цветочная, 1")
+            flower_id = Database.Flower.create("Ромашка", 100, provider_id)
+            customer_id = Database.Customer.create("ООО Заказчик", "89990000000", "ул. Садовая, 2")
+            contract_id = Database.Contract.create(customer_id, datetime.date(2023, 3, 3), datetime.date(2023, 4, 4))
+        return contract_id, flower_id
+
+    def get_version(self, table: str) -> int:
+        return Connection.execute_prepared("SELECT SUM(version) FROM table_version WHERE table_name = %s", (table,)).fetchall()[0][0]
+
+
+class TableVersionTests(ModelDatabaseTestCase):
+    # Версии меняют триггеры (database/migrations/0006_version_shards.sql), по одной на записанную строку
+    def read_committed_version(self, table: str) -> int:
+        # Версия, которую видят другие соединения
+        with closing(sqlite3.connect(self.database_path)) as connection:
+            return connection.execute("SELECT SUM(version) FROM table_version WHERE table_name = ?", (table,)).fetchone()[0]
+
+    def test_version_changes_on_commit(self):
+        contract_id, flower_id = self.create_contract()
+        before = self.get_version("booking")
+        with Connection.transaction():
+            for quantity in range(1, 4):
+                Database.Order.create(contract_id, flower_id, quantity)
+            self.assertEqual(self.read_committed_version("booking"), before)
+        self.assertEqual(self.read_committed_version("booking"), before + 3)
+
+    def test_rollback_keeps_version(self):
+        contract_id, flower_id = self.create_contract()
+        before = self.get_version("booking")
+        with self.assertRaises(ZeroDivisionError):
+            with Connection.transaction():
+                Database.Order.create(contract_id, flower_id, 1)
+                1 / 0
+        with Connection.transaction():
+            pass
+        self.assertEqual(self.get_version("booking"), before)
+
+    def test_write_outside_application_changes_versions(self):
+        flower_id = self.create_contract()[1]
+        self.assertEqual(Database.Flower.get_flower_name(flower_id), "Ромашка")
+        versions = Database.Flower.get_versions()
+        with closing(sqlite3.connect(self.database_path)) as connection:
+            connection.execute("UPDATE flower SET name = 'Лютик' WHERE flower_id = ?", (flower_id,))
+            connection.commit()
+        self.assertNotEqual(Database.Flower.get_versions(), versions)
+        with mock.patch.object(LookupCache, "revalidate_seconds", 0):
+            self.assertEqual(Database.Flower.get_flower_name(flower_id), "Лютик")
+
+    def test_concurrent_order_writes(self):
+        contract_id, flower_id = self.create_contract()
+        before = self.get_version("booking")
+        threads_count, orders_count = 4, 10
+        errors = []
+
+        def write_orders():
+            try:
+                for quantity in range(1, orders_count + 1):
+                    with Connection.transaction():
+                        Database.Order.create(contract_id, flower_id, quantity)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                Connection.release()
+
+        threads = [threading.Thread(target=write_orders) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(Database.Order.all()), threads_count * orders_count)
+        self.assertEqual(self.get_version("booking"), before + threads_count * orders_count)
+
+
+class PreparedCursorTests(ModelDatabaseTestCase):
+    def test_least_recently_used_cursor_is_closed(self):
+        connection = Connection.get_connection()
+        with mock.patch.object(Connection, "prepared_per_connection", 2):
+            first = Connection.execute_prepared("SELECT 1")
+            first.fetchall()
+            second = Connection.execute_prepared("SELECT 2")
+            second.fetchall()
+            Connection.execute_prepared("SELECT 1").fetchall()
+            Connection.execute_prepared("SELECT 3").fetchall()  # Вытесняет SELECT 2
+            self.assertEqual(list(Connection._prepared[connection][1]), ["SELECT 1", "SELECT 3"])
+            with self.assertRaises(DatabaseError):  # Вытесненный курсор закрыт
+                second.execute("SELECT 2")
+            self.assertIs(Connection.execute_prepared("SELECT 1"), first)
+            first.fetchall()
+
+
+class UpsertTests(ModelDatabaseTestCase):
+    # create() с уже существующим названием возвращает код существующей строки и добавляет только адрес
+    def count(self, table: str) -> int:
+        return Connection.execute_prepared(f"SELECT COUNT(*) FROM {table}").fetchall()[0][0]
+
+    def test_existing_provider_name(self):
+        with Connection.transaction():
+            provider_id = Database.Provider.create("Поляна", "ул. Цветочная, 1")
+            self.assertEqual(Database.Provider.create("Поляна", "ул. Луговая, 3"), provider_id)
+            self.assertEqual(Database.Provider.create("Поляна", None), provider_id)
+            self.assertEqual(Database.Provider.create_many([("Поляна", "ул. Полевая, 4"), ("Луг", None)]).ids[0],
+                             provider_id)
+        self.assertEqual(self.count("provider_name"), 2)
+        self.assertEqual(self.count("provider_address"), 5)
+        self.assertEqual(Database.Provider.get_provider_id("Поляна"), provider_id)
+
+    def test_existing_customer_name(self):
+        with Connection.transaction():
+            customer_id = Database.Customer.create("ООО Заказчик", "89990000000", "ул. Садовая, 2")
+            self.assertEqual(Database.Customer.create("ООО Заказчик", "89991111111", None), customer_id)
+            self.assertEqual(Database.Customer.create_many([("ООО Заказчик", "89992222222", "ул. Полевая, 4")]).ids,
+                             [customer_id])
+        self.assertEqual(self.count("customer_name"), 1)
+        self.assertEqual(self.count("customer_info"), 3)
+        self.assertEqual(Database.Customer.get_customer_id("ООО Заказчик"), customer_id)
+
+
+class LookupTests(ModelDatabaseTestCase):
+    def test_names_by_id_follow_changes(self):
+        flower_id = self.create_contract()[1]
+        provider_id = Database.Flower.get(flower_id).provider_id
+        self.assertEqual(Database.Provider.get_provider_name(provider_id), "Поляна")
+        self.assertEqual(Database.Flower.get_flower_name(flower_id), "Ромашка")
+        self.assertIsNone(Database.Flower.get_flower_name(flower_id + 1))
+        with Connection.transaction():
+            Database.Flower.get(flower_id).update("Лютик", 100, provider_id)
+        self.assertEqual(Database.Flower.get_flower_name(flower_id), "Лютик")
+
+
+class PaginationTests(ModelDatabaseTestCase):
+    # Ключ страницы при сортировке - (значение поля, код). Цены повторяются и бывают NULL,
+    # NULL идут первыми по возрастанию и последними по убыванию
+    prices = [None, 100, None, 50, 100, 100, None, 70]
+
+    def setUp(self):
+        super().setUp()
+        with Connection.transaction():
+            provider_id = Database.Provider.create("Поляна", "ул. Цветочная, 1")
+            self.flower_ids = [Database.Flower.create(f"Цветок {i}", price, provider_id)
+                               for i, price in enumerate(self.prices)]
+
+    def expected_ids(self, sort: str) -> list[int]:
+        rows = sorted(zip(self.prices, self.flower_ids), key=lambda row: (row[0] is not None, row[0] or 0, row[1]))
+        if sort.lstrip("-") == "flower_id":
+            rows = sorted(rows, key=lambda row: row[1])
+        ids = [flower_id for price, flower_id in rows]
+        return ids[::-1] if sort.startswith("-") else ids
+
+    def page_key(self, query: TableQuery, flower_id: int) -> tuple:
+        obj = Database.Flower.get(flower_id)
+        return tuple(getattr(obj, field) for field in Database.Flower.get_page_fields(query))
+
+    def walk(self, query: TableQuery, name: str, key: tuple = None) -> list[int]:
+        # Все страницы по 3 строки вперёд (after) или назад (before) от ключа
+        ids = []
+        while True:
+            page = Database.Flower.page(**{name: key}, limit=3, query=query)
+            page_ids = [obj.flower_id for obj in page.objects]
+            ids = ids + page_ids if name == "after" else page_ids + ids
+            if not (page.has_next if name == "after" else page.has_prev):
+                return ids
+            key = self.page_key(query, page_ids[-1] if name == "after" else page_ids[0])
+
+    def test_pages_cover_rows_once_in_order(self):
+        for sort in ("price", "-price", "flower_id", "-flower_id"):
+            with self.subTest(sort=sort):
+                query, expected = TableQuery(sort=sort), self.expected_ids(sort)
+                self.assertEqual(self.walk(query, "after"), expected)
+                self.assertEqual(self.walk(query, "before", self.page_key(query, expected[-1])), expected[:-1])
+
+    def test_filtered_pages_skip_null_values(self):
+        query = TableQuery(filters=[("price", ">=", 70)], sort="-price")
+        prices = dict(zip(self.flower_ids, self.prices))
+        expected = [flower_id for flower_id in self.expected_ids("-price") if (prices[flower_id] or 0) >= 70]
+        self.assertEqual(self.walk(query, "after"), expected)
+
+    def test_page_links_encode_null_sort_values(self):
+        self.client.cookies["user_status"] = "Head manager"
+        expected = self.expected_ids("price")
+        links, path = [], "/flowers/?sort=price"
+        with mock.patch.object(views.FlowersView, "page_size", 2):
+            while path:
+                response = self.client.get(path)
+                links.append(response.context["next_query"])
+                path = response.context["next_query"] and f"/flowers/?{response.context['next_query']}"
+        self.assertEqual(len(links), 4)
+        self.assertIsNone(links[-1])
+        for i, link in enumerate(links[:-1]):
+            params = parse_qs(link)
+            self.assertNotIn("None", link)
+            flower_id = expected[2 * i + 1]
+            if self.prices[self.flower_ids.index(flower_id)] is None:
+                self.assertEqual((params["after_null"], params["after"]), (["1"], [str(flower_id)]))
+            else:
+                self.assertEqual(params["after"][-1], str(flower_id))
+                self.assertNotIn("after_null", params)
+
+
+class FilterTests(ModelDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        with Connection.transaction():
+            provider_id = Database.Provider.create("Поляна", "ул. Цветочная, 1")
+            for name, price in [("Роза", 100), ("Ромашка", 50), ("Р*за_%", 70), ("Лютик", 50), ("роза", 120)]:
+                Database.Flower.create(name, price, provider_id)
+
+    def filtered_names(self, data: dict) -> list[str]:
+        query = TableFilterForm(Database.Flower, {}, data).get_query()
+        return [obj.name for obj in Database.Flower.page(limit=100, query=query).objects]
+
+    def test_each_filter_narrows_rows(self):
+        self.assertEqual(self.filtered_names({"name": "Ро"}), ["Роза", "Ромашка"])
+        self.assertEqual(self.filtered_names({"name": "Р*"}), ["Р*за_%"])
+        self.assertEqual(self.filtered_names({"name": "Р*за_"}), ["Р*за_%"])
+        self.assertEqual(self.filtered_names({"price_from": "50", "price_to": "50"}), ["Ромашка", "Лютик"])
+        self.assertEqual(self.filtered_names({"price_from": "70"}), ["Роза", "Р*за_%", "роза"])
+        self.assertEqual(self.filtered_names({"price_to": "70", "name": "Р"}), ["Ромашка", "Р*за_%"])
+        self.assertEqual(self.filtered_names({"price_from": "70", "sort": "-price"}), ["роза", "Роза", "Р*за_%"])
+
+    def test_date_filter_narrows_rows(self):
+        with Connection.transaction():
+            customer_id = Database.Customer.create("ООО Заказчик", "89990000000", "ул. Садовая, 2")
+            for day in (1, 2, 3):
+                Database.Contract.create(customer_id, datetime.date(2023, 3, day), datetime.date(2023, 4, day))
+        data = {"register_date_from": "2023-03-02", "execution_date_to": "2023-04-02"}
+        query = TableFilterForm(Database.Contract, {}, data).get_query()
+        objects = Database.Contract.page(limit=100, query=query).objects
+        self.assertEqual([obj.register_date for obj in objects], [datetime.date(2023, 3, 2)])
+
+    def test_invalid_values_fall_back(self):
+        # Поле с ошибкой не применяется, остальные фильтры работают
+        all_names = self.filtered_names({})
+        self.assertEqual(self.filtered_names({"sort": "password"}), all_names)
+        self.assertEqual(self.filtered_names({"price_from": "дорого"}), all_names)
+        self.assertEqual(self.filtered_names({"price_from": "дорого", "price_to": "50"}), ["Ромашка", "Лютик"])
+        self.assertEqual(TableFilterForm(Database.Customer, {}, {"sort": "name"}).get_query().sort, None)
+        with self.assertRaises(ValueError):
+            Database.Customer.get_query_statement("after", TableQuery(sort="name"))
+
+        self.client.cookies["user_status"] = "Head manager"
+        response = self.client.get("/flowers/", {"sort": "password", "price_from": "дорого"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["filter_form"].get_query(), TableQuery())
+        self.assertContains(response, "Лютик")
+        # Ключ страницы не той длины не применяется, ключ после последней строки даёт пустую страницу
+        response = self.client.get("/flowers/", {"after": ["я", "9"]})
+        self.assertContains(response, "Лютик")
+        response = self.client.get("/flowers/", {"after": "999"})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "Лютик")
+
+
+class QueryPlanTests(ModelDatabaseTestCase):
+    def test_no_full_scans_of_large_tables(self):
+        # manage.py check_query_plans завершается CommandError, если запрос просматривает большую таблицу целиком.
+        # У пустой БД SQLite нет статистики, и планы выбираются только по индексам схемы и миграций
+        call_command("check_query_plans", stdout=StringIO())
+
+
+class SummaryTests(ModelDatabaseTestCase):
+    # Сводки, изменённые на разницу, должны совпадать с полным пересчётом
+    def read_summaries(self) -> dict[str, list]:
+        return {table: sorted(Connection.execute_prepared(f"SELECT * FROM {table}").fetchall())
+                for table in Summaries.tables}
+
+    def assert_summaries_rebuilt_equal(self):
+        summaries = self.read_summaries()
+        with Connection.transaction():
+            Summaries.rebuild()
+        self.assertEqual(summaries, self.read_summaries())
+
+    def test_incremental_summaries_match_rebuild(self):
+        contract_id, flower_id = self.create_contract()
+        with Connection.transaction():
+            provider_id = Database.Provider.create("Луг", "ул. Луговая, 3")
+            other_flower_id = Database.Flower.create("Тюльпан", 70, provider_id)
+            customer_id = Database.Customer.create("ИП Покупатель", "89991111111", "ул. Полевая, 4")
+            other_contract_id = Database.Contract.create(customer_id, datetime.date(2023, 5, 5), datetime.date(2023, 6, 6))
+            order_ids = [Database.Order.create(contract_id, flower_id, 1),
+                         Database.Order.create(other_contract_id, other_flower_id, 2)]
+            order_ids += Database.Order.create_many([(contract_id, other_flower_id, 3), (other_contract_id, flower_id, 4)]).ids
+        self.assertEqual(len(self.read_summaries()["contract_total"]), 2)
+        self.assert_summaries_rebuilt_equal()
+
+        with Connection.transaction():
+            Database.Order.get(order_ids[0]).update(other_contract_id, flower_id, 5)
+            Database.Flower.get(flower_id).update("Ромашка", 120, provider_id)
+            Database.Contract.get(contract_id).update(customer_id, datetime.date(2023, 7, 7), datetime.date(2023, 8, 8))
+        self.assert_summaries_rebuilt_equal()
+
+        with Connection.transaction():
+            Database.Order.update_many([[order_ids[1]], [order_ids[2]]], {"quantity": 10})
+            Database.Order.remove_many([[order_ids[3]]])
+        self.assert_summaries_rebuilt_equal()
+
+        with Connection.transaction():
+            Database.Provider.get(provider_id, "ул. Луговая, 3").remove()  # Удаляет и цветы, и их заказы
+        self.assert_summaries_rebuilt_equal()
+        self.assertEqual(self.read_summaries()["provider_month_revenue"], [])
+
+    def test_orders_with_null_keys_skip_summaries(self):
+        # Договор без заказчика и цветок без поставщика не дают строк с NULL в ключе сводок
+        contract_id, flower_id = self.create_contract()
+        with Connection.transaction():
+            orphan_flower_id = Database.Flower.create("Пион", 50, None)
+            orphan_contract_id = Database.Contract.create(None, datetime.date(2023, 5, 5), datetime.date(2023, 6, 6))
+            order_ids = [Database.Order.create(orphan_contract_id, flower_id, 1),
+                         Database.Order.create(contract_id, orphan_flower_id, 2)]
+        summaries = self.read_summaries()
+        for rows in summaries.values():
+            self.assertNotIn(None, [value for row in rows for value in row])
+        self.assert_summaries_rebuilt_equal()
+
+        with Connection.transaction():
+            Database.Order.remove_many([[order_id] for order_id in order_ids])
+        self.assert_summaries_rebuilt_equal()
+
+
+class DetailsTableTests(ModelDatabaseTestCase):
+    def test_rows_with_null_keys_are_listed(self):
+        # Заказ без цветка или договора и договор без заказчика видны в таблицах с пустыми названиями
+        contract_id, flower_id = self.create_contract()
+        with Connection.transaction():
+            orphan_contract_id = Database.Contract.create(None, datetime.date(2023, 5, 5), datetime.date(2023, 6, 6))
+            order_ids = [Database.Order.create(contract_id, flower_id, 1),
+                         Database.Order.create(orphan_contract_id, flower_id, 2),
+                         Database.Order.create(contract_id, None, 3),
+                         Database.Order.create(None, flower_id, 4)]
+        orders = {obj.booking_id: obj for obj in Database.Order.get_read_model().page(limit=100).objects}
+        self.assertEqual(list(orders), order_ids)
+        self.assertEqual(orders[order_ids[0]].customer_name, "ООО Заказчик")
+        self.assertEqual([orders[order_id].customer_name for order_id in order_ids[1:]], [None, "ООО Заказчик", None])
+        self.assertEqual((orders[order_ids[2]].flower_name, orders[order_ids[2]].total), (None, None))
+        # Заказ без цветка в сводку договора не входит: его сумма неизвестна
+        contracts = Database.Contract.get_read_model().page(limit=100).objects
+        self.assertEqual([(obj.contract_id, obj.customer_name, obj.booking_count) for obj in contracts],
+                         [(contract_id, "ООО Заказчик", 1), (orphan_contract_id, None, 1)])
+
+        self.client.cookies["user_status"] = "Head manager"
+        response = self.client.get("/orders/", {"quantity_from": "2"})
+        for order_id in order_ids:
+            if order_id == order_ids[0]:
+                self.assertNotContains(response, f'name="booking_id" value="{order_id}"')
+            else:
+                self.assertContains(response, f'name="booking_id" value="{order_id}"')
+        response = self.client.get("/contracts/", {"sort": "customer_name"})
+        self.assertContains(response, f'name="contract_id" value="{orphan_contract_id}"')
+
+
+class ReplicaRoutingTests(ModelDatabaseTestCase):
+    # Реплика - копия основной БД, снятая до последней записи: она отстаёт на одного поставщика
+    def setUp(self):
+        super().setUp()
+        with Connection.transaction():
+            Database.Provider.create("Поляна", "ул. Цветочная, 1")
+        self.replica_path = self.database_path.with_name("replica.sqlite3")
+        with closing(sqlite3.connect(self.database_path)) as primary, closing(sqlite3.connect(self.replica_path)) as replica:
+            primary.backup(replica)
+        with Connection.transaction():
+            Database.Provider.create("Луг", "ул. Полевая, 3")
+        self.use_replicas([{"NAME": self.replica_path}])
+        self.client.cookies["user_status"] = "Head manager"
+
+    def use_replicas(self, replicas: list[dict]):
+        overrides = override_settings(MODEL_DATABASE={**settings.MODEL_DATABASE, "REPLICAS": replicas})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        Connection.reset()
+
+    def read_names(self) -> list[str]:
+        token = current_routing.set(ReadRouting())
+        try:
+            return [obj.name for obj in Database.Provider.all()]
+        finally:
+            current_routing.reset(token)
+            Connection.release()
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.read_names(), ["Поляна"])
+        response = self.client.get("/providers/")
+        self.assertContains(response, "Поляна")
+        self.assertNotContains(response, "Луг")
+        # Без маршрутизации (команды manage.py) и внутри транзакции читается основная БД
+        self.assertEqual([obj.name for obj in Database.Provider.all()], ["Поляна", "Луг"])
+        token = current_routing.set(ReadRouting())
+        try:
+            with Connection.transaction():
+                self.assertEqual([obj.name for obj in Database.Provider.all()], ["Поляна", "Луг"])
+        finally:
+            current_routing.reset(token)
+
+    def test_write_keeps_session_on_primary(self):
+        self.client.post("/providers/create", {"name": "Роща", "address": "ул. Лесная, 4"})
+        # До фиксации изменений сессия читает реплику
+        self.assertNotContains(self.client.get("/providers/"), "Луг")
+        self.client.post("/commit", {"curr_path": "/providers/"})
+        response = self.client.get("/providers/")
+        self.assertContains(response, "Луг")
+        self.assertContains(response, "Роща")
+        # После REPLICA_LAG_SECONDS сессия снова читает реплику
+        lag = settings.MODEL_DATABASE["REPLICA_LAG_SECONDS"]
+        with mock.patch("my_app.middleware.time.time", return_value=time.time() + lag + 1):
+            response = self.client.get("/providers/")
+        self.assertNotContains(response, "Луг")
+        # Другая сессия свои изменения не делала и читает реплику
+        self.client.cookies.pop(settings.SESSION_COOKIE_NAME)
+        self.assertNotContains(self.client.get("/providers/"), "Роща")
+
+    def test_replica_down_falls_back_to_primary(self):
+        self.use_replicas([{"NAME": self.database_path.with_name("missing") / "replica.sqlite3"}])
+        self.assertEqual(self.read_names(), ["Поляна", "Луг"])
+        self.assertEqual(list(Connection._replica_down_until), [0])
+        self.assertContains(self.client.get("/providers/"), "Луг")
+
+        # Реплика, отмеченная недоступной, не используется до истечения PING_INTERVAL
+        self.use_replicas([{"NAME": self.replica_path}])
+        Connection._replica_down_until[0] = time.monotonic() + 60
+        self.assertEqual(self.read_names(), ["Поляна", "Луг"])
+        Connection._replica_down_until[0] = time.monotonic() - 1
+        self.assertEqual(self.read_names(), ["Поляна"])
+
+    def test_lookups_load_from_primary(self):
+        token = current_routing.set(ReadRouting())
+        try:
+            self.assertEqual(sorted(Database.Provider.all_names()), ["Луг", "Поляна"])
+            self.assertEqual(Database.Provider.get_provider_name(2), "Луг")
+        finally:
+            current_routing.reset(token)
+            Connection.release()
+
+
+class BulkChangeTests(ModelDatabaseTestCase):
+    def create_orders(self, count: int) -> list[int]:
+        contract_id, flower_id = self.create_contract()
+        with Connection.transaction():
+            return Database.Order.create_many([(contract_id, flower_id, 1)] * count).ids
+
+    def get_quantities(self) -> dict[int, int]:
+        return {order.booking_id: order.quantity for order in Database.Order.all()}
+
+    def test_update_many_and_remove_many(self):
+        order_ids = self.create_orders(5)
+        with Connection.transaction():
+            Database.Order.update_many([[order_id] for order_id in order_ids[:3]], {"quantity": 7, "unknown": 1})
+        self.assertEqual(self.get_quantities(), {**dict.fromkeys(order_ids[:3], 7), **dict.fromkeys(order_ids[3:], 1)})
+        with Connection.transaction():
+            Database.Order.remove_many([[order_id] for order_id in order_ids[1:4]])
+        self.assertEqual(self.get_quantities(), {order_ids[0]: 7, order_ids[4]: 1})
+
+    def test_create_many_skips_only_bad_rows(self):
+        # Пачка со строкой, нарушающей внешний ключ, откатывается и вставляется построчно
+        contract_id, flower_id = self.create_contract()
+        rows = [(contract_id, flower_id, 1), (contract_id, flower_id, 2), (contract_id, flower_id, 3),
+                (contract_id, 999, 4), (contract_id, flower_id, 5)]
+        with Connection.transaction():
+            result = Database.Order.create_many(rows, batch_size=2)
+        self.assertEqual([order_id is None for order_id in result.ids], [False, False, False, True, False])
+        self.assertEqual([index for index, message in result.errors], [3])
+        self.assertEqual(self.get_quantities(), {order_id: quantity for order_id, quantity
+                                                 in zip(result.ids, [1, 2, 3, 4, 5]) if order_id is not None})
+        # Сводка договора не содержит строк откатившейся пачки
+        contract = Database.Contract.get_read_model().page(limit=1).objects[0]
+        self.assertEqual((contract.booking_count, contract.amount), (4, 11 * 100))
+
+    def test_table_post_stages_changes_until_commit(self):
+        order_ids = self.create_orders(3)
+        self.client.cookies["user_status"] = "Head manager"
+        keys = [json.dumps([order_id]) for order_id in order_ids[:2]]
+        response = self.client.post("/orders/", {"action": "update", "keys": keys, "bulk-quantity": "9"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(set(self.get_quantities().values()), {1})
+        self.client.post("/commit", {"curr_path": "/orders/"})
+        self.assertEqual(self.get_quantities(), {order_ids[0]: 9, order_ids[1]: 9, order_ids[2]: 1})
+
+        self.client.post("/orders/", {"action": "remove", "keys": [json.dumps([order_ids[2]])]})
+        self.client.post("/rollback", {"curr_path": "/orders/"})
+        self.assertEqual(len(self.get_quantities()), 3)
+        self.client.post("/orders/", {"action": "remove", "keys": [json.dumps([order_ids[2]])]})
+        self.client.post("/commit", {"curr_path": "/orders/"})
+        self.assertEqual(self.get_quantities(), {order_ids[0]: 9, order_ids[1]: 9})
+
+    def test_table_post_requires_edit_permission(self):
+        order_ids = self.create_orders(1)
+        self.client.cookies["user_status"] = "Accountant"
+        self.client.post("/orders/", {"action": "remove", "keys": [json.dumps([order_ids[0]])]})
+        self.client.post("/commit", {"curr_path": "/orders/"})
+        self.assertEqual(len(self.get_quantities()), 1)
+
+
+class UnitOfWorkTests(ModelDatabaseTestCase):
+    def test_failing_change_rolls_back_all_changes(self):
+        # Последнее изменение нарушает внешний ключ: предыдущие, уже выполненные в транзакции, откатываются
+        contract_id, flower_id = self.create_contract()
+        with Connection.transaction():
+            order_ids = Database.Order.create_many([(contract_id, flower_id, 1)] * 3).ids
+        versions = {table: self.get_version(table) for table in ("provider_name", "provider_address", "booking")}
+        self.assertNotIn(None, versions.values())
+        unit_of_work = UnitOfWork({})
+        unit_of_work.create(Database.Provider, ("Луг", "ул. Луговая, 3"))
+        unit_of_work.update_many(Database.Order, [[order_ids[0]]], {"quantity": 5})
+        unit_of_work.remove_many(Database.Order, [[order_ids[1]]])
+        unit_of_work.create(Database.Order, (contract_id, 999, 1))
+        with self.assertRaises(DatabaseError):
+            unit_of_work.commit()
+        self.assertEqual(Database.Provider.all_names(), ["Поляна"])
+        self.assertEqual({order.booking_id: order.quantity for order in Database.Order.all()}, dict.fromkeys(order_ids, 1))
+        self.assertEqual({table: self.get_version(table) for table in versions}, versions)
+        self.assertEqual(len(unit_of_work.changes), 4)
+
+    def test_commit_view_keeps_changes_after_error(self):
+        contract_id, flower_id = self.create_contract()
+        self.client.cookies["user_status"] = "Head manager"
+        session = self.client.session
+        unit_of_work = UnitOfWork(session)
+        unit_of_work.create(Database.Order, (contract_id, flower_id, 2))
+        unit_of_work.create(Database.Order, (contract_id, 999, 1))
+        session.save()
+        response = self.client.post("/commit", {"curr_path": "/orders/"}, follow=True)
+        self.assertContains(response, "Изменения не сохранены")
+        self.assertEqual(Database.Order.all(), [])
+        self.assertEqual(len(UnitOfWork(self.client.session).changes), 2)
+
+
+class OptimisticUpdateTests(ModelDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.flower = Database.Flower.get(self.create_contract()[1])
+
+    def logged_updates(self, function) -> list[str]:
+        # Запросы UPDATE, выполненные function
+        log = QueryLog()
+        token = current_log.set(log)
+        try:
+            function()
+        finally:
+            current_log.reset(token)
+        return [record.shape for record in log.records if record.shape.startswith("UPDATE")]
+
+    def test_update_writes_only_changed_columns(self):
+        flower = self.flower
+
+        def update():
+            with Connection.transaction():
+                flower.update(flower.name, 150, str(flower.provider_id))
+
+        updates = self.logged_updates(update)
+        self.assertEqual(len([shape for shape in updates if "flower SET" in shape]), 1)
+        self.assertIn("SET price = %s WHERE", updates[0])
+        self.assertEqual(Database.Flower.get(flower.flower_id).price, 150)
+
+    def test_unchanged_values_write_nothing(self):
+        flower = self.flower
+        with Connection.transaction():
+            Database.Flower.get(flower.flower_id).update("Василёк", flower.price, flower.provider_id)
+        self.assertEqual(self.logged_updates(lambda: flower.update(flower.name, flower.price, flower.provider_id)), [])
+
+    def test_update_to_equal_value_in_database(self):
+        # "0100" отличается от 100 как строка, но в колонке INT это то же значение: строка найдена,
+        # хотя не изменилась. В MySQL rowcount считает такие строки только с флагом FOUND_ROWS
+        flower = self.flower
+        with Connection.transaction():
+            flower.update(flower.name, "0100", flower.provider_id)
+        self.assertEqual(Database.Flower.get(flower.flower_id).price, 100)
+        self.assertIn(ClientFlag.FOUND_ROWS, MySQLBackend(settings.MODEL_DATABASE).connect_params["client_flags"])
+
+    def test_update_of_changed_row_raises(self):
+        flower = self.flower
+        with Connection.transaction():
+            Database.Flower.get(flower.flower_id).update("Василёк", flower.price, flower.provider_id)
+        with self.assertRaises(StaleRowError):
+            with Connection.transaction():
+                flower.update(flower.name, 150, flower.provider_id)
+        self.assertEqual(Database.Flower.get(flower.flower_id), type(flower)(flower.flower_id, "Василёк", 100, flower.provider_id))
+
+    def test_unit_of_work_commits_nothing_on_stale_row(self):
+        flower = self.flower
+        unit_of_work = UnitOfWork({})
+        unit_of_work.create(Database.Provider, ("Луг", "ул. Луговая, 3"))
+        unit_of_work.update(Database.Flower, [flower.flower_id], ("Ромашка", 150, flower.provider_id),
+                            [flower.flower_id, flower.name, flower.price, flower.provider_id])
+        with Connection.transaction():
+            Database.Flower.get(flower.flower_id).update(flower.name, 120, flower.provider_id)
+        with self.assertRaises(StaleRowError):
+            unit_of_work.commit()
+        self.assertEqual(Database.Provider.all_names(), ["Поляна"])
+        self.assertEqual(Database.Flower.get(flower.flower_id).price, 120)
+        self.assertEqual(len(unit_of_work.changes), 2)
+
+    def test_unit_of_work_updates_same_row_twice(self):
+        # Второе изменение строки сравнивается с результатом первого, а не со старыми полями из формы
+        flower = self.flower
+        old = [flower.flower_id, flower.name, flower.price, flower.provider_id]
+        unit_of_work = UnitOfWork({})
+        unit_of_work.update(Database.Flower, [flower.flower_id], ("Ромашка", 150, flower.provider_id), old)
+        unit_of_work.update(Database.Flower, [flower.flower_id], ("Лютик", 150, flower.provider_id), old)
+        unit_of_work.commit()
+        updated = Database.Flower.get(flower.flower_id)
+        self.assertEqual((updated.name, updated.price), ("Лютик", 150))
+        self.assertEqual(unit_of_work.changes, [])
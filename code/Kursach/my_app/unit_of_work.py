@@ -0,0 +1,108 @@
+import datetime
+from .models import Database, BaseDBModel
+from .model_objects import Connection
+
+
+class UnitOfWork:
+    # Изменения пользователя не выполняются сразу, а копятся в его сессии.
+    # commit() применяет их все в одной транзакции на соединении текущего запроса,
+    # rollback() просто их отбрасывает. Пользователи не видят и не трогают чужие изменения
+    session_key = "staged_changes"
+    action_names = {
+        "create": "Добавление",
+        "update": "Изменение",
+        "update_many": "Изменение строк",
+        "remove_many": "Удаление строк",
+    }
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def changes(self) -> list[dict]:
+        return self.session.get(self.session_key, [])
+
+    def create(self, model: BaseDBModel, params: tuple):
+        self._stage(model, "create", [], params)
+
+    def update(self, model: BaseDBModel, key: list, params: tuple, old: list = None):
+        # old - поля строки, которую видел пользователь. С ними commit() не читает строку заново,
+        # а UPDATE не выполнится, если строку успели изменить (см. BaseModelObj.update)
+        self._stage(model, "update", key, params, old)
+
+    def update_many(self, model: BaseDBModel, keys: list[list], values: dict):
+        # Для изменений многих строк key - список ключей, params - пары (поле, значение)
+        self._stage(model, "update_many", keys, list(values.items()))
+
+    def remove_many(self, model: BaseDBModel, keys: list[list]):
+        self._stage(model, "remove_many", keys, [])
+
+    def commit(self):
+        rows = {}
+        with Connection.transaction():
+            for change in self.changes:
+                self._apply(change, rows)
+        self.rollback()
+
+    def rollback(self):
+        self.session.pop(self.session_key, None)
+
+    def describe(self) -> list[str]:
+        descriptions = []
+        for change in self.changes:
+            action = self.action_names[change["action"]]
+            if change["action"].endswith("_many"):
+                values = ", ".join([f"{len(change['key'])} шт.", *(f"{field} = {value}" for field, value in change["params"])])
+            else:
+                values = ", ".join(str(value) for value in change["key"] + change["params"])
+            descriptions.append(f"{action} ({change['model']}): {values}")
+        return descriptions
+
+    def _stage(self, model: BaseDBModel, action: str, key: list, params: tuple, old: list = None):
+        change = {
+            "model": model.name,
+            "action": action,
+            "key": [self._to_json(value) for value in key],
+            "params": [self._to_json(value) for value in params],
+        }
+        if old is not None:
+            change["old"] = self._to_json(list(old))
+        self.session[self.session_key] = [*self.changes, change]
+
+    @staticmethod
+    def _apply(change: dict, rows: dict):
+        # rows - строки, уже изменённые в этой транзакции: (модель, ключ) -> объект с новыми значениями.
+        # Следующее изменение той же строки сравнивается с ними, а не со старыми полями из формы
+        model = Database.get_model(change["model"])
+        if change["action"] == "create":
+            model.create(*change["params"])
+            return
+        if change["action"] == "update_many":
+            model.update_many(change["key"], dict(change["params"]))
+            return
+        if change["action"] == "remove_many":
+            model.remove_many(change["key"])
+            return
+        key = (model.name, *map(str, change["key"]))
+        if key in rows:
+            obj = rows.pop(key)
+        elif "old" in change:
+            obj = model.model_obj(*change["old"])
+        else:
+            obj = model.get(*change["key"])
+            if obj is None:  # Строку уже удалили
+                return
+        obj.update(*change["params"])
+        for field, value in zip(obj.get_manual_fields(), change["params"]):
+            setattr(obj, field, value)
+        rows[(model.name, *(str(getattr(obj, field)) for field in model.get_primary_fields()))] = obj
+
+    @staticmethod
+    def _to_json(value):
+        # Сессия хранится в JSON, а MySQL принимает даты в виде строк 'YYYY-MM-DD'.
+        # Ключи и пары (поле, значение) изменений многих строк переводятся поэлементно
+        if isinstance(value, datetime.date):
+            return value.isoformat()
+        if isinstance(value, (list, tuple)):
+            return [UnitOfWork._to_json(item) for item in value]
+        return value
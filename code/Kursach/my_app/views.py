@@ -1,10 +1,24 @@
+import json
+from urllib.parse import urlencode
+import calendar
+import hashlib
+from django.conf import settings
+from django.contrib import messages
+from django.http import StreamingHttpResponse
 from django.shortcuts import render, redirect
-from .models import Database, BaseDBModel
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+from .models import Database, BaseDBModel, TableQuery
 from django.views import View
 from . import forms
 from .mixins import UserStatusRequiredMixin
 from .user_manager import UserManager
-from .model_objects import UserStatus
+from .backends import DatabaseError, error_message
+from .unit_of_work import UnitOfWork
+from .table_renderer import TableRenderer
+from .model_objects import StaleRowError, UserStatus
 from django.core.exceptions import ValidationError
 
 
@@ -22,13 +36,29 @@ class BaseTableView(UserStatusRequiredMixin, View):
     create_url: str
     edit_url: str
     title: str
+    bulk_form_class: type[forms.BaseBulkUpdateForm] | None = None  # Изменение выбранных строк, None - только удаление
+    page_size = 50
+    renderer_class = TableRenderer
+    rows_marker = "<!-- table rows -->"  # Место вставки строк в потоковом режиме, см. base_table.html
+    streaming = False  # Отдавать всю таблицу потоком вместо постраничного вывода. Также включается ?stream=1
+    allow_streaming = True
+    stream_batch_size = 1000
 
     def get(self, request):
-        objects = self.model.all()
+        # Страница не изменилась, если не изменились версии таблиц модели, роль пользователя,
+        # параметры запроса и его неприменённые изменения. Тогда браузер получает 304 без чтения данных
+        read_model = self.model.get_read_model()
+        versions = read_model.get_versions()
+        etag = self._make_etag(request, versions)
+        last_modified = self._get_last_modified(versions)
+        if not len(messages.get_messages(request)):  # Сообщения показываются один раз, такую страницу не кэшируем
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return self._set_validators(response, etag, last_modified)
+
         user_status = UserStatus(request.COOKIES.get("user_status"))
         can_edit = user_status in self.can_edit_statuses
         context = {
-            "objects": objects,
             "title": self.title,
             "create_url": self.create_url,
             "edit_url": self.edit_url,
@@ -37,14 +67,126 @@ class BaseTableView(UserStatusRequiredMixin, View):
             "request_unique_fields": self.model.get_primary_fields(),
             "can_edit": can_edit,
         }
-        return render(request, self.template_path, context)
+        # Фильтры и сортировка применяются в БД, из неё читаются только нужные строки
+        filter_form = forms.TableFilterForm(read_model, self._get_labels(read_model), request.GET)
+        query = filter_form.get_query()
+        context["filter_form"] = filter_form
+        if can_edit and self.bulk_form_class is not None:
+            context["bulk_form"] = self.bulk_form_class()
+        renderer = self.renderer_class(request, self.table_url, self.edit_url, self.model.get_primary_fields(), can_edit)
+        if self.allow_streaming and (self.streaming or request.GET.get("stream") == "1"):
+            context["streaming"] = True
+            response = StreamingHttpResponse(self._stream_table(request, context, renderer, read_model, query))
+            return self._set_validators(response, etag, last_modified)
+
+        page = read_model.page(
+            after=self._get_page_key(request, read_model, "after", query),
+            before=self._get_page_key(request, read_model, "before", query),
+            limit=self.page_size,
+            query=query,
+        )
+        context["table_rows"] = mark_safe(renderer.render_rows(page.objects))
+        # Страница после последней строки (её удалили или ключ в ссылке неверный) пуста - ссылок нет
+        context["next_query"] = (self._make_page_query(request, read_model, "after", page.objects[-1], query)
+                                 if page.has_next and page.objects else None)
+        context["prev_query"] = (self._make_page_query(request, read_model, "before", page.objects[0], query)
+                                 if page.has_prev and page.objects else None)
+        return self._set_validators(render(request, self.template_path, context), etag, last_modified)
+
+    def _stream_table(self, request, context: dict, renderer: TableRenderer, read_model: BaseDBModel,
+                      query: TableQuery):
+        # Страница рендерится без строк и отдаётся сразу, затем строки отдаются по мере чтения из БД
+        head, tail = render_to_string(self.template_path, context, request).split(self.rows_marker)
+        yield head
+        for objects in read_model.iterate(self.stream_batch_size, query):
+            yield renderer.render_rows(objects)
+        yield tail
+
+    def _get_labels(self, read_model: BaseDBModel) -> dict[str, str]:
+        # Заголовки колонок по полям объекта строки, они идут в одном порядке
+        return dict(zip(read_model.model_obj.__slots__, self.table_headers))
+
+    @staticmethod
+    def _make_etag(request, versions: list[tuple]) -> str:
+        state = repr((
+            [(table, version) for table, version, updated_at in versions],
+            request.COOKIES.get("user_status"),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME),  # Токен в формах страницы
+            request.get_full_path(),
+            UnitOfWork(request.session).changes,
+        ))
+        return f'"{hashlib.sha1(state.encode()).hexdigest()}"'
+
+    @staticmethod
+    def _get_last_modified(versions: list[tuple]) -> int | None:
+        # MySQL возвращает время без часового пояса, время сервера БД - UTC
+        if not versions:
+            return None
+        return calendar.timegm(max(updated_at for table, version, updated_at in versions).timetuple())
+
+    @staticmethod
+    def _set_validators(response, etag: str, last_modified: int | None):
+        response.headers["ETag"] = etag
+        if last_modified is not None:
+            response.headers["Last-Modified"] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)  # Браузер проверяет страницу при каждом открытии
+        return response
+
+    @staticmethod
+    def _get_page_key(request, read_model: BaseDBModel, name: str, query: TableQuery) -> tuple | None:
+        # Ключ страницы передаётся как ?after=<поле 1>&after=<поле 2>... Если поле сортировки
+        # в ключе NULL, его значения нет, а есть ?after_null=1: любая строка была бы и значением поля
+        key = tuple(request.GET.getlist(name))
+        if request.GET.get(f"{name}_null") == "1":
+            key = (None, *key)
+        if len(key) != len(read_model.get_page_fields(query)):
+            return None
+        return key
+
+    @staticmethod
+    def _make_page_query(request, read_model: BaseDBModel, name: str, obj, query: TableQuery) -> str:
+        # Ссылка на соседнюю страницу сохраняет фильтры и сортировку
+        params = [(key, value) for key, values in request.GET.lists()
+                  if key not in ("after", "before", "after_null", "before_null") for value in values]
+        values = [getattr(obj, field) for field in read_model.get_page_fields(query)]
+        if values[0] is None:
+            params += [(f"{name}_null", "1"), *[(name, value) for value in values[1:]]]
+        else:
+            params += [(name, value) for value in values]
+        return urlencode(params)
 
     def post(self, request):
-        data = [request.POST[field] for field in self.model.get_primary_fields()]
-        obj = self.model.get(*data)
-        obj.remove()
+        # Удаление строки (кнопка в строке) или удаление и изменение строк, выбранных флажками.
+        # Изменения копятся в UnitOfWork и применяются по Commit запросами на все строки сразу
+        if UserStatus(request.COOKIES.get("user_status")) not in self.can_edit_statuses:
+            return render(request, self.forbidden_template)
+        keys = self._get_post_keys(request)
+        unit_of_work = UnitOfWork(request.session)
+        if request.POST.get("action") == "update":
+            form = self.bulk_form_class(request.POST) if self.bulk_form_class is not None else None
+            if form is None or not form.is_valid() or not form.get_values():
+                messages.error(request, "Не заданы новые значения для выбранных строк")
+            elif keys:
+                unit_of_work.update_many(self.model, keys, form.get_values())
+        elif keys:
+            unit_of_work.remove_many(self.model, keys)
         return redirect(self.table_url)
 
+    def _get_post_keys(self, request) -> list[list]:
+        # Ключи выбранных строк - JSON-списки в keys, у кнопки в строке - поля ключа по отдельности
+        fields = self.model.get_primary_fields()
+        if "keys" not in request.POST:
+            return [[request.POST[field] for field in fields]] if all(field in request.POST for field in fields) else []
+        keys = []
+        for value in request.POST.getlist("keys"):
+            try:
+                key = json.loads(value)
+            except ValueError:
+                continue
+            if isinstance(key, list) and len(key) == len(fields):
+                keys.append(key)
+        return keys
+
 
 class ProvidersView(BaseTableView):
     model = Database.Provider
@@ -54,6 +196,7 @@ class ProvidersView(BaseTableView):
     create_url = "create_provider_url"
     edit_url = "edit_provider_url"
     title = "Поставщики"
+    bulk_form_class = forms.ProviderBulkUpdateForm
     allowed_statuses = [UserStatus.HEAD_MANAGER, UserStatus.ACCOUNTANT]
     can_edit_statuses = [UserStatus.HEAD_MANAGER]
 
@@ -66,6 +209,7 @@ class FlowersView(BaseTableView):
     create_url = "create_flower_url"
     edit_url = "edit_flower_url"
     title = "Цветы"
+    bulk_form_class = forms.FlowerBulkUpdateForm
     allowed_statuses = [UserStatus.HEAD_MANAGER, UserStatus.ACCOUNTANT, UserStatus.PURCHASE_MANAGER,
                         UserStatus.DELIVERY_MANAGER, UserStatus.CUSTOMER]
     can_edit_statuses = [UserStatus.HEAD_MANAGER]
@@ -79,6 +223,7 @@ class CustomersView(BaseTableView):
     create_url = "create_customer_url"
     edit_url = "edit_customer_url"
     title = "Заказчики"
+    bulk_form_class = forms.CustomerBulkUpdateForm
     allowed_statuses = [UserStatus.HEAD_MANAGER, UserStatus.DELIVERY_MANAGER]
     can_edit_statuses = [UserStatus.HEAD_MANAGER]
 
@@ -87,10 +232,12 @@ class ContractsView(BaseTableView):
     model = Database.Contract
     template_path = "my_app/tables/contracts.html"
     table_url = "contracts_url"
-    table_headers = ["Код договора", "Код заказчика", "Дата регистрации", "Дата исполнения"]
+    table_headers = ["Код договора", "Код заказчика", "Заказчик", "Дата регистрации", "Дата исполнения",
+                     "Заказов", "Сумма"]
     create_url = "create_contract_url"
     edit_url = "edit_contract_url"
     title = "Договоры"
+    bulk_form_class = forms.ContractBulkUpdateForm
     allowed_statuses = [UserStatus.HEAD_MANAGER, UserStatus.ACCOUNTANT, UserStatus.PURCHASE_MANAGER,
                         UserStatus.DELIVERY_MANAGER, UserStatus.CUSTOMER]
     can_edit_statuses = [UserStatus.HEAD_MANAGER, UserStatus.CUSTOMER]
@@ -99,11 +246,13 @@ class ContractsView(BaseTableView):
 class OrdersView(BaseTableView):
     model = Database.Order
     template_path = "my_app/tables/orders.html"
-    table_url = "contracts_url"
-    table_headers = ["Код", "Код договора", "Код цветка", "Количество рассады"]
+    table_url = "orders_url"
+    table_headers = ["Код", "Код договора", "Заказчик", "Цветок", "Поставщик", "Цена за рассаду",
+                     "Количество рассады", "Сумма"]
     create_url = "create_order_url"
     edit_url = "edit_order_url"
     title = "Заказы"
+    bulk_form_class = forms.OrderBulkUpdateForm
     allowed_statuses = [UserStatus.HEAD_MANAGER, UserStatus.ACCOUNTANT, UserStatus.PURCHASE_MANAGER,
                         UserStatus.DELIVERY_MANAGER, UserStatus.CUSTOMER]
     can_edit_statuses = [UserStatus.HEAD_MANAGER, UserStatus.CUSTOMER]
@@ -117,6 +266,7 @@ class EmployeesView(BaseTableView):
     create_url = "register_employee_url"
     edit_url = "edit_employee_url"
     title = "Сотрудники"
+    bulk_form_class = forms.EmployeeBulkUpdateForm
     allowed_statuses = [UserStatus.HEAD_MANAGER]
     can_edit_statuses = [UserStatus.HEAD_MANAGER]
 
@@ -127,12 +277,46 @@ class CustomersUsersView(BaseTableView):
     table_url = "customers_users_url"
     table_headers = ["Логин", "Пароль", "Код заказчика"]
     create_url = "register_customer_url"
-    edit_url = "edit_customer_url"
+    edit_url = "edit_customer_user_url"
     title = "Аккаунты заказчиков"
     allowed_statuses = [UserStatus.HEAD_MANAGER]
     can_edit_statuses = [UserStatus.HEAD_MANAGER]
 
 
+class BaseReportView(BaseTableView):
+    # Отчёты читают только сводные таблицы (Summaries), поэтому их время не зависит от числа заказов.
+    # Изменять строки отчёта нельзя
+    create_url = None
+    edit_url = None
+    allowed_statuses = [UserStatus.HEAD_MANAGER, UserStatus.ACCOUNTANT]
+    can_edit_statuses = []
+    http_method_names = ["get", "head", "options"]
+
+
+class ContractTotalsView(BaseReportView):
+    model = Database.ContractTotal
+    template_path = "my_app/tables/contract_totals.html"
+    table_url = "contract_totals_url"
+    table_headers = ["Код договора", "Заказов", "Количество рассады", "Сумма"]
+    title = "Итоги договоров"
+
+
+class CustomerRevenueView(BaseReportView):
+    model = Database.CustomerRevenue
+    template_path = "my_app/tables/customer_revenue.html"
+    table_url = "customer_revenue_url"
+    table_headers = ["Код заказчика", "Название", "Месяц", "Заказов", "Количество рассады", "Выручка"]
+    title = "Выручка по заказчикам"
+
+
+class ProviderRevenueView(BaseReportView):
+    model = Database.ProviderRevenue
+    template_path = "my_app/tables/provider_revenue.html"
+    table_url = "provider_revenue_url"
+    table_headers = ["Код поставщика", "Название", "Месяц", "Заказов", "Количество рассады", "Выручка"]
+    title = "Выручка по поставщикам"
+
+
 class BaseCreateView(UserStatusRequiredMixin, View):
     form_class: type[forms.BaseCreateForm]
     template_path: str
@@ -145,7 +329,7 @@ class BaseCreateView(UserStatusRequiredMixin, View):
     def post(self, request):
         form = self.form_class(request.POST)
         if form.is_valid():
-            form.save_to_db()
+            form.save_to_db(UnitOfWork(request.session))
             return redirect(self.redirect_url)
         else:
             return render(request, self.template_path, {"form": form})
@@ -202,14 +386,19 @@ class RegisterCustomerForm(BaseCreateView):
 
 class Commit(View):
     def post(self, request):
-        Database.connection.connection.commit()
+        try:
+            UnitOfWork(request.session).commit()
+        except DatabaseError as error:
+            messages.error(request, f"Изменения не сохранены: {error_message(error)}")
+        except StaleRowError as error:
+            messages.error(request, f"Изменения не сохранены: {error}. Откройте строку заново")
         prev_path = request.POST["curr_path"]
         return redirect(prev_path)
 
 
 class Rollback(View):
     def post(self, request):
-        Database.connection.connection.rollback()
+        UnitOfWork(request.session).rollback()
         prev_path = request.POST["curr_path"]
         return redirect(prev_path)
 
@@ -253,32 +442,36 @@ class BaseUpdateView(View):
     def get(self, request):
         primary_params = dict()
         for field in self.model.get_primary_fields():
-            primary_params["__old_" + field] = request.GET[field]
+            primary_params[field] = request.GET[field]
         form = self.form_class(primary_params)
-        context = {
-            "form": form,
-            "primary_params": primary_params,
-            "title": self.title,
-            "edit_url": self.edit_url
-        }
-        return render(request, self.template_path, context)
+        if form.obj is None:
+            messages.error(request, "Строка не найдена, возможно, её уже удалили")
+            return redirect(self.redirect_url)
+        return self._render(request, form)
 
     def post(self, request):
+        # Поля строки приходят из формы подписанными, поэтому строка не читается из БД повторно
         primary_params = dict()
         for field in self.model.get_primary_fields():
             primary_params[field] = request.POST["__old_" + field]
-        form = self.form_class(primary_params, request.POST)
+        form = self.form_class(primary_params, request.POST, snapshot=request.POST.get("__snapshot"))
+        if form.obj is None:
+            messages.error(request, "Строка не найдена, возможно, её уже удалили")
+            return redirect(self.redirect_url)
         if form.is_valid():
-            form.save_to_db()
+            form.save_to_db(UnitOfWork(request.session))
             return redirect(self.redirect_url)
-        else:
-            context = {
-                "form": form,
-                "primary_params": primary_params,
-                "title": self.title,
-                "edit_url": self.edit_url
-            }
-            return render(request, self.template_path, context)
+        return self._render(request, form)
+
+    def _render(self, request, form: forms.BaseUpdateForm):
+        context = {
+            "form": form,
+            "primary_params": {"__old_" + field: value for field, value in form.primary_params.items()},
+            "snapshot": form.get_snapshot(),
+            "title": self.title,
+            "edit_url": self.edit_url
+        }
+        return render(request, self.template_path, context)
 
 
 class ProviderUpdateView(BaseUpdateView):
@@ -0,0 +1,15 @@
+-- Версии таблиц для условных GET-запросов (ETag) в представлениях таблиц.
+-- Версии меняют триггеры таблиц (0006_version_shards) и manage.py bulk_load после загрузки.
+-- Миграция не падает, если таблица уже есть в БД
+
+CREATE TABLE IF NOT EXISTS table_version (
+	table_name VARCHAR(64),
+	version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+	updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+
+	PRIMARY KEY (table_name)
+);
+
+INSERT IGNORE INTO table_version(table_name)
+VALUES ('provider_name'), ('provider_address'), ('flower'), ('customer_name'), ('customer_info'),
+       ('contract'), ('booking'), ('employee'), ('customer_user');
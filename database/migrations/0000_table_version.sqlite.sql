@@ -0,0 +1,14 @@
+-- Вариант 0000_table_version.sql для SQLite. ON UPDATE у колонок нет, updated_at меняют
+-- те же запросы, что меняют версию
+
+CREATE TABLE IF NOT EXISTS table_version (
+	table_name VARCHAR(64),
+	version INTEGER NOT NULL DEFAULT 0,
+	updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+	PRIMARY KEY (table_name)
+);
+
+INSERT OR IGNORE INTO table_version(table_name)
+VALUES ('provider_name'), ('provider_address'), ('flower'), ('customer_name'), ('customer_info'),
+       ('contract'), ('booking'), ('employee'), ('customer_user');
@@ -0,0 +1,67 @@
+-- Названия поставщиков и заказчиков уникальны: create() и create_many() ищут код по названию.
+-- Строки с одинаковыми названиями объединяются в строку с наименьшим кодом: ссылки на дубликаты
+-- переводятся на неё, а дубликаты удаляются. Телефоны дубликата, которые уже есть у этой строки,
+-- удаляются, чтобы пара (код, телефон) осталась уникальной (см. 0001_address_keys).
+-- Индекс создаётся, только если уникального индекса по name ещё нет
+
+UPDATE provider_address
+JOIN provider_name AS duplicate ON duplicate.provider_id = provider_address.provider_id
+JOIN (SELECT name, MIN(provider_id) AS provider_id FROM provider_name GROUP BY name) AS first
+	ON first.name = duplicate.name AND first.provider_id <> duplicate.provider_id
+SET provider_address.provider_id = first.provider_id;
+
+UPDATE flower
+JOIN provider_name AS duplicate ON duplicate.provider_id = flower.provider_id
+JOIN (SELECT name, MIN(provider_id) AS provider_id FROM provider_name GROUP BY name) AS first
+	ON first.name = duplicate.name AND first.provider_id <> duplicate.provider_id
+SET flower.provider_id = first.provider_id;
+
+DELETE duplicate
+FROM provider_name AS duplicate
+JOIN provider_name AS first ON first.name = duplicate.name AND first.provider_id < duplicate.provider_id;
+
+DELETE info
+FROM customer_info AS info
+JOIN customer_name AS duplicate ON duplicate.customer_id = info.customer_id
+JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id
+JOIN customer_info AS kept ON kept.customer_id = first.customer_id AND kept.phone = info.phone;
+
+UPDATE customer_info
+JOIN customer_name AS duplicate ON duplicate.customer_id = customer_info.customer_id
+JOIN (SELECT name, MIN(customer_id) AS customer_id FROM customer_name GROUP BY name) AS first
+	ON first.name = duplicate.name AND first.customer_id <> duplicate.customer_id
+SET customer_info.customer_id = first.customer_id;
+
+UPDATE contract
+JOIN customer_name AS duplicate ON duplicate.customer_id = contract.customer_id
+JOIN (SELECT name, MIN(customer_id) AS customer_id FROM customer_name GROUP BY name) AS first
+	ON first.name = duplicate.name AND first.customer_id <> duplicate.customer_id
+SET contract.customer_id = first.customer_id;
+
+UPDATE customer_user
+JOIN customer_name AS duplicate ON duplicate.customer_id = customer_user.customer_id
+JOIN (SELECT name, MIN(customer_id) AS customer_id FROM customer_name GROUP BY name) AS first
+	ON first.name = duplicate.name AND first.customer_id <> duplicate.customer_id
+SET customer_user.customer_id = first.customer_id;
+
+DELETE duplicate
+FROM customer_name AS duplicate
+JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id;
+
+SET @add_index = IF(EXISTS (
+	SELECT * FROM information_schema.statistics
+	WHERE table_schema = DATABASE() AND table_name = 'provider_name' AND column_name = 'name'
+		AND non_unique = 0 AND seq_in_index = 1
+), 'DO 0', 'ALTER TABLE provider_name ADD UNIQUE provider_name_name (name)');
+PREPARE add_index FROM @add_index;
+EXECUTE add_index;
+DEALLOCATE PREPARE add_index;
+
+SET @add_index = IF(EXISTS (
+	SELECT * FROM information_schema.statistics
+	WHERE table_schema = DATABASE() AND table_name = 'customer_name' AND column_name = 'name'
+		AND non_unique = 0 AND seq_in_index = 1
+), 'DO 0', 'ALTER TABLE customer_name ADD UNIQUE customer_name_name (name)');
+PREPARE add_index FROM @add_index;
+EXECUTE add_index;
+DEALLOCATE PREPARE add_index;
@@ -0,0 +1,53 @@
+-- Вариант 0000_unique_names.sql для SQLite: UPDATE без JOIN и индекс через IF NOT EXISTS
+
+UPDATE provider_address
+SET provider_id = (SELECT MIN(first.provider_id) FROM provider_name AS first
+                   JOIN provider_name AS duplicate ON duplicate.name = first.name
+                   WHERE duplicate.provider_id = provider_address.provider_id)
+WHERE provider_id IN (SELECT duplicate.provider_id FROM provider_name AS duplicate
+                      JOIN provider_name AS first ON first.name = duplicate.name AND first.provider_id < duplicate.provider_id);
+
+UPDATE flower
+SET provider_id = (SELECT MIN(first.provider_id) FROM provider_name AS first
+                   JOIN provider_name AS duplicate ON duplicate.name = first.name
+                   WHERE duplicate.provider_id = flower.provider_id)
+WHERE provider_id IN (SELECT duplicate.provider_id FROM provider_name AS duplicate
+                      JOIN provider_name AS first ON first.name = duplicate.name AND first.provider_id < duplicate.provider_id);
+
+DELETE FROM provider_name
+WHERE provider_id IN (SELECT duplicate.provider_id FROM provider_name AS duplicate
+                      JOIN provider_name AS first ON first.name = duplicate.name AND first.provider_id < duplicate.provider_id);
+
+DELETE FROM customer_info
+WHERE EXISTS (SELECT * FROM customer_name AS duplicate
+              JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id
+              JOIN customer_info AS kept ON kept.customer_id = first.customer_id
+              WHERE duplicate.customer_id = customer_info.customer_id AND kept.phone = customer_info.phone);
+
+UPDATE customer_info
+SET customer_id = (SELECT MIN(first.customer_id) FROM customer_name AS first
+                   JOIN customer_name AS duplicate ON duplicate.name = first.name
+                   WHERE duplicate.customer_id = customer_info.customer_id)
+WHERE customer_id IN (SELECT duplicate.customer_id FROM customer_name AS duplicate
+                      JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id);
+
+UPDATE contract
+SET customer_id = (SELECT MIN(first.customer_id) FROM customer_name AS first
+                   JOIN customer_name AS duplicate ON duplicate.name = first.name
+                   WHERE duplicate.customer_id = contract.customer_id)
+WHERE customer_id IN (SELECT duplicate.customer_id FROM customer_name AS duplicate
+                      JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id);
+
+UPDATE customer_user
+SET customer_id = (SELECT MIN(first.customer_id) FROM customer_name AS first
+                   JOIN customer_name AS duplicate ON duplicate.name = first.name
+                   WHERE duplicate.customer_id = customer_user.customer_id)
+WHERE customer_id IN (SELECT duplicate.customer_id FROM customer_name AS duplicate
+                      JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id);
+
+DELETE FROM customer_name
+WHERE customer_id IN (SELECT duplicate.customer_id FROM customer_name AS duplicate
+                      JOIN customer_name AS first ON first.name = duplicate.name AND first.customer_id < duplicate.customer_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS provider_name_name ON provider_name (name);
+CREATE UNIQUE INDEX IF NOT EXISTS customer_name_name ON customer_name (name);
@@ -0,0 +1,13 @@
+-- Ключи и индексы таблиц адресов поставщиков и данных заказчиков.
+-- Строка provider_address и customer_info определяется парой (код, адрес/телефон):
+-- по ней ищут get(), update() и remove(), а постраничный вывод сортирует по ней.
+-- Суррогатный первичный ключ заменяет скрытый ключ InnoDB и нужен построчной репликации.
+-- Индексы по provider_name.name и customer_name.name создаёт 0000_unique_names
+
+ALTER TABLE provider_address
+	ADD COLUMN address_id INT AUTO_INCREMENT PRIMARY KEY FIRST,
+	ADD INDEX provider_address_key (provider_id, address(255));
+
+ALTER TABLE customer_info
+	ADD COLUMN info_id INT AUTO_INCREMENT PRIMARY KEY FIRST,
+	ADD UNIQUE customer_info_key (customer_id, phone);
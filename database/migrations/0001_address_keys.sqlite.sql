@@ -0,0 +1,12 @@
+-- Вариант 0001_address_keys.sql для SQLite. Суррогатный ключ у таблиц SQLite уже есть (rowid),
+-- а первичный ключ существующей таблице не добавить. Индексы по внешним ключам MySQL
+-- создаёт сам, а SQLite без них просматривает всю дочернюю таблицу при каскадном удалении
+
+CREATE INDEX provider_address_key ON provider_address (provider_id, address);
+CREATE UNIQUE INDEX customer_info_key ON customer_info (customer_id, phone);
+
+CREATE INDEX flower_provider_id ON flower (provider_id);
+CREATE INDEX contract_customer_id ON contract (customer_id);
+CREATE INDEX booking_contract_id ON booking (contract_id);
+CREATE INDEX booking_flower_id ON booking (flower_id);
+CREATE INDEX customer_user_customer_id ON customer_user (customer_id);
@@ -0,0 +1,10 @@
+-- Индексы колонок, по которым таблицы фильтруются и сортируются (filter_columns в models.py).
+-- Записи вторичного индекса содержат и первичный ключ, поэтому индекс по одной колонке
+-- подходит и для сортировки (колонка, первичный ключ) при постраничном выводе.
+-- Названия, логины и коды внешних ключей уже проиндексированы
+
+CREATE INDEX flower_price ON flower (price);
+CREATE INDEX customer_info_phone ON customer_info (phone);
+CREATE INDEX contract_register_date ON contract (register_date);
+CREATE INDEX contract_execution_date ON contract (execution_date);
+CREATE INDEX booking_quantity ON booking (quantity);
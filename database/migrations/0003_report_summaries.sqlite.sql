@@ -0,0 +1,62 @@
+-- Вариант 0003_report_summaries.sql для SQLite: другое выражение для первого дня месяца
+
+CREATE TABLE contract_total (
+	contract_id INT,
+	booking_count INT NOT NULL,
+	quantity BIGINT NOT NULL,
+	amount BIGINT NOT NULL,
+
+	PRIMARY KEY (contract_id)
+);
+
+CREATE TABLE customer_month_revenue (
+	customer_id INT,
+	month DATE,
+	booking_count INT NOT NULL,
+	quantity BIGINT NOT NULL,
+	amount BIGINT NOT NULL,
+
+	PRIMARY KEY (customer_id, month)
+);
+
+CREATE TABLE provider_month_revenue (
+	provider_id INT,
+	month DATE,
+	booking_count INT NOT NULL,
+	quantity BIGINT NOT NULL,
+	amount BIGINT NOT NULL,
+
+	PRIMARY KEY (provider_id, month)
+);
+
+CREATE INDEX contract_total_amount ON contract_total (amount);
+CREATE INDEX customer_month_revenue_month ON customer_month_revenue (month);
+CREATE INDEX provider_month_revenue_month ON provider_month_revenue (month);
+
+INSERT INTO table_version(table_name)
+VALUES ('contract_total'), ('customer_month_revenue'), ('provider_month_revenue');
+
+INSERT INTO contract_total(contract_id, booking_count, quantity, amount)
+SELECT booking.contract_id, COUNT(*), COALESCE(SUM(booking.quantity), 0), COALESCE(SUM(booking.quantity * flower.price), 0)
+FROM booking
+JOIN flower ON flower.flower_id = booking.flower_id
+WHERE booking.contract_id IS NOT NULL
+GROUP BY booking.contract_id;
+
+INSERT INTO customer_month_revenue(customer_id, month, booking_count, quantity, amount)
+SELECT contract.customer_id, date(contract.register_date, 'start of month'),
+	COUNT(*), COALESCE(SUM(booking.quantity), 0), COALESCE(SUM(booking.quantity * flower.price), 0)
+FROM booking
+JOIN flower ON flower.flower_id = booking.flower_id
+JOIN contract ON contract.contract_id = booking.contract_id
+WHERE contract.customer_id IS NOT NULL AND contract.register_date IS NOT NULL
+GROUP BY 1, 2;
+
+INSERT INTO provider_month_revenue(provider_id, month, booking_count, quantity, amount)
+SELECT flower.provider_id, date(contract.register_date, 'start of month'),
+	COUNT(*), COALESCE(SUM(booking.quantity), 0), COALESCE(SUM(booking.quantity * flower.price), 0)
+FROM booking
+JOIN flower ON flower.flower_id = booking.flower_id
+JOIN contract ON contract.contract_id = booking.contract_id
+WHERE flower.provider_id IS NOT NULL AND contract.register_date IS NOT NULL
+GROUP BY 1, 2;
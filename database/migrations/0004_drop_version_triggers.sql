@@ -0,0 +1,32 @@
+-- Версии таблиц меняет приложение после фиксации транзакции (Connection.transaction).
+-- Триггеры меняли их построчно внутри транзакции и держали блокировку строки table_version до её конца,
+-- из-за чего транзакции, меняющие одну таблицу, выполнялись по очереди.
+-- Триггеры с версиями по частям, без этой очереди, создаёт 0006_version_shards
+
+DROP TRIGGER IF EXISTS provider_name_insert_version;
+DROP TRIGGER IF EXISTS provider_name_update_version;
+DROP TRIGGER IF EXISTS provider_name_delete_version;
+DROP TRIGGER IF EXISTS provider_address_insert_version;
+DROP TRIGGER IF EXISTS provider_address_update_version;
+DROP TRIGGER IF EXISTS provider_address_delete_version;
+DROP TRIGGER IF EXISTS flower_insert_version;
+DROP TRIGGER IF EXISTS flower_update_version;
+DROP TRIGGER IF EXISTS flower_delete_version;
+DROP TRIGGER IF EXISTS customer_name_insert_version;
+DROP TRIGGER IF EXISTS customer_name_update_version;
+DROP TRIGGER IF EXISTS customer_name_delete_version;
+DROP TRIGGER IF EXISTS customer_info_insert_version;
+DROP TRIGGER IF EXISTS customer_info_update_version;
+DROP TRIGGER IF EXISTS customer_info_delete_version;
+DROP TRIGGER IF EXISTS contract_insert_version;
+DROP TRIGGER IF EXISTS contract_update_version;
+DROP TRIGGER IF EXISTS contract_delete_version;
+DROP TRIGGER IF EXISTS booking_insert_version;
+DROP TRIGGER IF EXISTS booking_update_version;
+DROP TRIGGER IF EXISTS booking_delete_version;
+DROP TRIGGER IF EXISTS employee_insert_version;
+DROP TRIGGER IF EXISTS employee_update_version;
+DROP TRIGGER IF EXISTS employee_delete_version;
+DROP TRIGGER IF EXISTS customer_user_insert_version;
+DROP TRIGGER IF EXISTS customer_user_update_version;
+DROP TRIGGER IF EXISTS customer_user_delete_version;
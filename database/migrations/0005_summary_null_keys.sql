@@ -0,0 +1,7 @@
+-- Заказы без договора, договоры без заказчика и цветы без поставщика в сводки не входят
+-- (model_objects.Summaries). SQLite допускает NULL в составном первичном ключе, и такие строки
+-- могли попасть в сводки до этой миграции
+
+DELETE FROM contract_total WHERE contract_id IS NULL;
+DELETE FROM customer_month_revenue WHERE customer_id IS NULL OR month IS NULL;
+DELETE FROM provider_month_revenue WHERE provider_id IS NULL OR month IS NULL;
@@ -0,0 +1,164 @@
+-- Версии таблиц снова меняют триггеры, поэтому учитываются и изменения в обход приложения
+-- (SQL-консоль, другие программы). У каждой таблицы 16 строк версий (shard 0-15), триггер меняет
+-- строку MOD(CONNECTION_ID(), 16) своего соединения. Блокировка строки версии держится до конца транзакции,
+-- но транзакции других соединений меняют другие строки и не ждут друг друга (кроме совпадений по модулю).
+-- Версия таблицы - сумма её строк (BaseDBModel.get_versions), она растёт с каждой зафиксированной записью.
+-- Каскадное удаление по внешним ключам триггеры дочерних таблиц не вызывает,
+-- поэтому триггер удаления родителя меняет версии и дочерних таблиц.
+-- Загрузчик manage.py bulk_load выставляет @table_version_disabled и меняет версию один раз после загрузки.
+-- Новой таблице с версией нужны строки всех 16 частей, как ниже
+
+ALTER TABLE table_version
+	ADD COLUMN shard TINYINT UNSIGNED NOT NULL DEFAULT 0 AFTER table_name,
+	DROP PRIMARY KEY,
+	ADD PRIMARY KEY (table_name, shard);
+
+INSERT INTO table_version(table_name, shard)
+WITH RECURSIVE shards(shard) AS (SELECT 1 UNION ALL SELECT shard + 1 FROM shards WHERE shard < 15)
+SELECT table_version.table_name, shards.shard
+FROM table_version
+CROSS JOIN shards;
+
+CREATE TRIGGER provider_name_insert_version AFTER INSERT ON provider_name
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_name' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_name_update_version AFTER UPDATE ON provider_name
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_name' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_name_delete_version AFTER DELETE ON provider_name
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name IN ('provider_name', 'provider_address', 'flower', 'booking') AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_address_insert_version AFTER INSERT ON provider_address
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_address' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_address_update_version AFTER UPDATE ON provider_address
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_address' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_address_delete_version AFTER DELETE ON provider_address
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_address' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER flower_insert_version AFTER INSERT ON flower
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'flower' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER flower_update_version AFTER UPDATE ON flower
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'flower' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER flower_delete_version AFTER DELETE ON flower
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name IN ('flower', 'booking') AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_name_insert_version AFTER INSERT ON customer_name
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_name' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_name_update_version AFTER UPDATE ON customer_name
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_name' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_name_delete_version AFTER DELETE ON customer_name
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name IN ('customer_name', 'customer_info', 'contract', 'booking') AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_info_insert_version AFTER INSERT ON customer_info
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_info' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_info_update_version AFTER UPDATE ON customer_info
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_info' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_info_delete_version AFTER DELETE ON customer_info
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_info' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER contract_insert_version AFTER INSERT ON contract
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'contract' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER contract_update_version AFTER UPDATE ON contract
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'contract' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER contract_delete_version AFTER DELETE ON contract
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name IN ('contract', 'booking') AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER booking_insert_version AFTER INSERT ON booking
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'booking' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER booking_update_version AFTER UPDATE ON booking
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'booking' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER booking_delete_version AFTER DELETE ON booking
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'booking' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER employee_insert_version AFTER INSERT ON employee
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'employee' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER employee_update_version AFTER UPDATE ON employee
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'employee' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER employee_delete_version AFTER DELETE ON employee
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'employee' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_user_insert_version AFTER INSERT ON customer_user
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_user' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_user_update_version AFTER UPDATE ON customer_user
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_user' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_user_delete_version AFTER DELETE ON customer_user
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_user' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER contract_total_insert_version AFTER INSERT ON contract_total
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'contract_total' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER contract_total_update_version AFTER UPDATE ON contract_total
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'contract_total' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER contract_total_delete_version AFTER DELETE ON contract_total
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'contract_total' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_month_revenue_insert_version AFTER INSERT ON customer_month_revenue
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_month_revenue' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_month_revenue_update_version AFTER UPDATE ON customer_month_revenue
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_month_revenue' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER customer_month_revenue_delete_version AFTER DELETE ON customer_month_revenue
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'customer_month_revenue' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_month_revenue_insert_version AFTER INSERT ON provider_month_revenue
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_month_revenue' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_month_revenue_update_version AFTER UPDATE ON provider_month_revenue
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_month_revenue' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
+
+CREATE TRIGGER provider_month_revenue_delete_version AFTER DELETE ON provider_month_revenue
+FOR EACH ROW UPDATE table_version SET version = version + 1
+WHERE table_name = 'provider_month_revenue' AND shard = MOD(CONNECTION_ID(), 16) AND @table_version_disabled IS NULL;
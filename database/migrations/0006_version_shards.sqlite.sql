@@ -0,0 +1,236 @@
+-- Вариант 0006_version_shards.sql для SQLite. Пишет одно соединение за раз, поэтому у таблицы
+-- одна строка версии (shard 0). Каскадное удаление в SQLite вызывает триггеры дочерних таблиц,
+-- пользовательских переменных нет: manage.py bulk_load меняет версии построчно
+
+CREATE TABLE table_version_sharded (
+	table_name VARCHAR(64),
+	shard INTEGER NOT NULL DEFAULT 0,
+	version INTEGER NOT NULL DEFAULT 0,
+	updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+
+	PRIMARY KEY (table_name, shard)
+);
+
+INSERT INTO table_version_sharded(table_name, shard, version, updated_at)
+SELECT table_name, 0, version, updated_at
+FROM table_version;
+
+DROP TABLE table_version;
+
+ALTER TABLE table_version_sharded RENAME TO table_version;
+
+CREATE TRIGGER provider_name_insert_version AFTER INSERT ON provider_name
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_name';
+END;
+
+CREATE TRIGGER provider_name_update_version AFTER UPDATE ON provider_name
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_name';
+END;
+
+CREATE TRIGGER provider_name_delete_version AFTER DELETE ON provider_name
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_name';
+END;
+
+CREATE TRIGGER provider_address_insert_version AFTER INSERT ON provider_address
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_address';
+END;
+
+CREATE TRIGGER provider_address_update_version AFTER UPDATE ON provider_address
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_address';
+END;
+
+CREATE TRIGGER provider_address_delete_version AFTER DELETE ON provider_address
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_address';
+END;
+
+CREATE TRIGGER flower_insert_version AFTER INSERT ON flower
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'flower';
+END;
+
+CREATE TRIGGER flower_update_version AFTER UPDATE ON flower
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'flower';
+END;
+
+CREATE TRIGGER flower_delete_version AFTER DELETE ON flower
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'flower';
+END;
+
+CREATE TRIGGER customer_name_insert_version AFTER INSERT ON customer_name
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_name';
+END;
+
+CREATE TRIGGER customer_name_update_version AFTER UPDATE ON customer_name
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_name';
+END;
+
+CREATE TRIGGER customer_name_delete_version AFTER DELETE ON customer_name
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_name';
+END;
+
+CREATE TRIGGER customer_info_insert_version AFTER INSERT ON customer_info
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_info';
+END;
+
+CREATE TRIGGER customer_info_update_version AFTER UPDATE ON customer_info
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_info';
+END;
+
+CREATE TRIGGER customer_info_delete_version AFTER DELETE ON customer_info
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_info';
+END;
+
+CREATE TRIGGER contract_insert_version AFTER INSERT ON contract
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'contract';
+END;
+
+CREATE TRIGGER contract_update_version AFTER UPDATE ON contract
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'contract';
+END;
+
+CREATE TRIGGER contract_delete_version AFTER DELETE ON contract
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'contract';
+END;
+
+CREATE TRIGGER booking_insert_version AFTER INSERT ON booking
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'booking';
+END;
+
+CREATE TRIGGER booking_update_version AFTER UPDATE ON booking
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'booking';
+END;
+
+CREATE TRIGGER booking_delete_version AFTER DELETE ON booking
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'booking';
+END;
+
+CREATE TRIGGER employee_insert_version AFTER INSERT ON employee
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'employee';
+END;
+
+CREATE TRIGGER employee_update_version AFTER UPDATE ON employee
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'employee';
+END;
+
+CREATE TRIGGER employee_delete_version AFTER DELETE ON employee
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'employee';
+END;
+
+CREATE TRIGGER customer_user_insert_version AFTER INSERT ON customer_user
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_user';
+END;
+
+CREATE TRIGGER customer_user_update_version AFTER UPDATE ON customer_user
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_user';
+END;
+
+CREATE TRIGGER customer_user_delete_version AFTER DELETE ON customer_user
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_user';
+END;
+
+CREATE TRIGGER contract_total_insert_version AFTER INSERT ON contract_total
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'contract_total';
+END;
+
+CREATE TRIGGER contract_total_update_version AFTER UPDATE ON contract_total
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'contract_total';
+END;
+
+CREATE TRIGGER contract_total_delete_version AFTER DELETE ON contract_total
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'contract_total';
+END;
+
+CREATE TRIGGER customer_month_revenue_insert_version AFTER INSERT ON customer_month_revenue
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_month_revenue';
+END;
+
+CREATE TRIGGER customer_month_revenue_update_version AFTER UPDATE ON customer_month_revenue
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_month_revenue';
+END;
+
+CREATE TRIGGER customer_month_revenue_delete_version AFTER DELETE ON customer_month_revenue
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'customer_month_revenue';
+END;
+
+CREATE TRIGGER provider_month_revenue_insert_version AFTER INSERT ON provider_month_revenue
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_month_revenue';
+END;
+
+CREATE TRIGGER provider_month_revenue_update_version AFTER UPDATE ON provider_month_revenue
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_month_revenue';
+END;
+
+CREATE TRIGGER provider_month_revenue_delete_version AFTER DELETE ON provider_month_revenue
+FOR EACH ROW BEGIN
+	UPDATE table_version SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+	WHERE table_name = 'provider_month_revenue';
+END;
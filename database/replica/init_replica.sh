@@ -0,0 +1,19 @@
+#!/bin/bash
+# Выполняется один раз, при создании тома реплики: копирует основную БД (SOURCE_HOST)
+# и запускает репликацию по GTID с позиции копии. Дальше реплика сама продолжает репликацию после перезапуска
+set -e
+mysql_source=(mysql -h "$SOURCE_HOST" -uroot -p"$MYSQL_ROOT_PASSWORD")
+mysql_replica=(mysql -uroot -p"$MYSQL_ROOT_PASSWORD")
+
+until "${mysql_source[@]}" -e "SELECT 1" > /dev/null 2>&1; do
+    sleep 1
+done
+"${mysql_replica[@]}" -e "RESET BINARY LOGS AND GTIDS"
+mysqldump -h "$SOURCE_HOST" -uroot -p"$MYSQL_ROOT_PASSWORD" --databases kursach \
+    --single-transaction --triggers --routines --set-gtid-purged=ON | "${mysql_replica[@]}"
+"${mysql_replica[@]}" -e "
+    CHANGE REPLICATION SOURCE TO
+        SOURCE_HOST = '$SOURCE_HOST', SOURCE_USER = 'root', SOURCE_PASSWORD = '$MYSQL_ROOT_PASSWORD',
+        SOURCE_AUTO_POSITION = 1, GET_SOURCE_PUBLIC_KEY = 1;
+    START REPLICA;
+"